@@ -0,0 +1,60 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import h5py as h5
+import numpy as np
+from ptypy import utils as u
+from ptypy.experiment.hdf5_loader import Hdf5Loader, Hdf5LoaderFast
+
+parser = argparse.ArgumentParser(description='Loading speed of Hdf5Loader and Hdf5LoaderFast')
+parser.add_argument('--frames', type=int, default=2000, help='Number of frames in the file')
+parser.add_argument('--shape', type=int, default=128, help='Frame edge length')
+parser.add_argument('--processes', type=int, default=None,
+                    help='Worker processes of Hdf5LoaderFast, all cores if not given')
+parser.add_argument('--chunk', type=int, default=500, help='Frames per load')
+args = parser.parse_args()
+
+def make_files(outdir, frames, shape):
+    data_file = os.path.join(outdir, 'intensity.h5')
+    with h5.File(data_file, 'w') as f:
+        f['entry/intensity'] = np.random.randint(0, 1000, (frames, shape, shape)).astype(np.float32)
+        f['entry/positions_slow'] = np.arange(frames, dtype=float)
+        f['entry/positions_fast'] = np.arange(frames, dtype=float)
+        f['entry/dark'] = np.ones((shape, shape), dtype=np.float32)
+        f['entry/mask'] = np.ones((shape, shape), dtype=int)
+    return data_file
+
+def run_benchmark(cls, data_file, **kwargs):
+    p = u.Param()
+    p.auto_center = False
+    p.save = None
+    p.intensities = u.Param(file=data_file, key='entry/intensity')
+    p.positions = u.Param(file=data_file, slow_key='entry/positions_slow',
+                          fast_key='entry/positions_fast')
+    p.darkfield = u.Param(file=data_file, key='entry/dark')
+    p.mask = u.Param(file=data_file, key='entry/mask')
+    p.update(kwargs)
+    scan = cls(p)
+    scan.initialize()
+    t1 = time.perf_counter()
+    frames = 0
+    while True:
+        msg = scan.auto(args.chunk)
+        if not isinstance(msg, dict):
+            break
+        frames += len(msg['iterable'])
+    t2 = time.perf_counter()
+    scan._finalize()
+    return frames, t2 - t1
+
+outdir = tempfile.mkdtemp()
+try:
+    data_file = make_files(outdir, args.frames, args.shape)
+    print(','.join(['Loader', 'Frames', 'Shape', 'Duration', 'Frames/s']))
+    for cls, kwargs in [(Hdf5Loader, {}), (Hdf5LoaderFast, {'processes': args.processes})]:
+        frames, dur = run_benchmark(cls, data_file, **kwargs)
+        print(','.join([str(x) for x in [cls.__name__, frames, args.shape, dur, frames/dur]]))
+finally:
+    shutil.rmtree(outdir)
@@ -1,11 +1,13 @@
 #!/bin/bash
 
 # Runs MPI all reduce benchmark with variable number of processes
+# (strong scaling), extra arguments are passed on to the benchmark,
+# e.g. ./mpi_allreduce_bench.sh --mode fused --region 0.8
 
 echo "Processes,i08,i13,i14_1,i14_2"
 for p in {2..16}
 do
     echo -n $p
-    mpirun -np $p python mpi_allreduce_speed.py | \
+    mpirun -np $p python mpi_allreduce_speed.py "$@" | \
      awk -F, '$0 ~ /^i[0-9]/ {printf(",%s", $2)} END {print ""}'
-done
\ No newline at end of file
+done
@@ -1,3 +1,4 @@
+import argparse
 import numpy as np
 from ptypy.utils import parallel
 from mpi4py import MPI
@@ -10,17 +11,34 @@ sizes ={
     'i14_2': (1, 3360, 3360), 
 }
 
-def run_benchmark(shape):
-    megabytes = np.product(shape) * 8 / 1024 / 1024 * 2
+parser = argparse.ArgumentParser(description='Speed of the object / normalisation allreduce')
+parser.add_argument('--mode', default='blocking', choices=['blocking', 'nonblocking', 'fused'],
+                    help='blocking: two allreduce calls as in the default engines, '
+                         'nonblocking: both reductions in flight at the same time, '
+                         'fused: object and normalisation in a single message')
+parser.add_argument('--region', type=float, default=1.0,
+                    help='Fraction of each dimension that is reduced, as with reduce_region')
+args = parser.parse_args()
 
+def run_benchmark(shape):
     data = np.zeros(shape, dtype=np.complex64)
-    
+    nrm = np.zeros(shape, dtype=np.float32)
+
+    # central region of the object that is reduced
+    region = (slice(None),) + tuple(slice(int(n * (1 - args.region) / 2), int(n * (1 + args.region) / 2))
+                                    for n in shape[1:])
+    megabytes = (data[region].nbytes + nrm[region].nbytes) / 1024 / 1024
+
     # average 5 runs
     duration = 0
     for n in range(5):
         t1 = time.perf_counter()
-        parallel.allreduce(data)  # 2 calls to simulate ptypy obb / obn reduce
-        parallel.allreduce(data)
+        if args.mode == 'blocking':
+            # 2 calls to simulate ptypy obb / obn reduce
+            parallel.iallreduce([data[region]]).wait()
+            parallel.iallreduce([nrm[region]]).wait()
+        else:
+            parallel.iallreduce([data[region], nrm[region]], fuse=(args.mode == 'fused')).wait()
         t2 = time.perf_counter()
         duration += t2-t1
     duration /= 5
@@ -36,7 +54,7 @@ for name,sz in sizes.items():
     res.append([name, dur, mb, mb/dur])
 
 if parallel.rank == 0:
-    print('Final results for {} processes'.format(parallel.size))
+    print('Final results for {} processes, mode {}, region {}'.format(parallel.size, args.mode, args.region))
     print(','.join(['Name', 'Duration', 'MB', 'MB/s']))
     for r in res:
-        print(','.join([str(x) for x in r]))
\ No newline at end of file
+        print(','.join([str(x) for x in r]))
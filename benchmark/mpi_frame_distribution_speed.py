@@ -0,0 +1,52 @@
+import argparse
+import numpy as np
+from ptypy.utils import parallel
+from mpi4py import MPI
+import time
+
+parser = argparse.ArgumentParser(description='Speed of distributing a chunk of frames from the master node')
+parser.add_argument('--mode', default='scatter', choices=['bcast', 'scatter'],
+                    help='bcast: every frame is broadcast to all nodes (bcast_dict), '
+                         'scatter: each node receives only its own frames (scatter_dict)')
+parser.add_argument('--frames', type=int, default=1000, help='Number of frames in the chunk')
+parser.add_argument('--shape', type=int, default=256, help='Frame edge length')
+args = parser.parse_args()
+
+def run_benchmark(frames, shape):
+    chunk = list(range(frames))
+    lm = parallel.LoadManager().assign(chunk)
+    keys = [[chunk[k] for k in l] for l in lm]
+    node = keys[parallel.rank]
+
+    if parallel.master:
+        raw = {k: np.ones((shape, shape), dtype=np.float32) for k in chunk}
+    else:
+        raw = {}
+    megabytes = frames * shape * shape * 4 / 1024 / 1024
+
+    # average 5 runs
+    duration = 0
+    for n in range(5):
+        parallel.barrier()
+        t1 = time.perf_counter()
+        if args.mode == 'bcast':
+            out = parallel.bcast_dict(raw, node)
+        else:
+            out = parallel.scatter_dict(raw, keys)
+        parallel.barrier()
+        t2 = time.perf_counter()
+        duration += t2-t1
+        assert sorted(out.keys()) == node
+    duration /= 5
+
+    duration = np.array([duration])
+    parallel.allreduce(duration, MPI.MAX)
+
+    return megabytes, duration[0]
+
+mb, dur = run_benchmark(args.frames, args.shape)
+
+if parallel.rank == 0:
+    print('Final results for {} processes, mode {}'.format(parallel.size, args.mode))
+    print(','.join(['Frames', 'Shape', 'Duration', 'MB', 'MB/s']))
+    print(','.join([str(x) for x in [args.frames, args.shape, dur, mb, mb/dur]]))
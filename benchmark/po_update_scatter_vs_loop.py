@@ -0,0 +1,83 @@
+'''
+Compares the per-frame loop and the batched scatter-add
+versions of the CPU object/probe update kernels.
+'''
+import numpy as np
+import time
+from ptypy.accelerate.base.kernels import PoUpdateKernel as POK
+
+COMPLEX_TYPE = np.complex64
+FLOAT_TYPE = np.float32
+INT_TYPE = np.int32
+
+def prepare_arrays(
+    overlap=0.2,
+    scan_pts=20,
+    frame_size=128,
+    num_pr_modes=2,
+    num_ob_modes=1):
+
+    fsh = (frame_size,frame_size)
+    shift = max(1, int(frame_size*overlap))
+    X, Y = np.indices((scan_pts,scan_pts)) * shift
+    X = X.flatten()
+    Y = Y.flatten()
+    num_pts = len(X)
+    X += 5
+    Y += 5
+    osh = (X.max()+5+fsh[0],Y.max()+5+fsh[1]) # ob shape
+    num_modes = num_ob_modes * num_pr_modes
+    A = num_pts * num_modes
+
+    probe = np.empty(shape=(num_pr_modes,fsh[0],fsh[1]), dtype=COMPLEX_TYPE)
+    for idx in range(num_pr_modes):
+        probe[idx] = np.ones(fsh) * (idx + 1) + 1j * np.ones(fsh) * (idx + 1)
+
+    object_array = np.empty(shape=(num_ob_modes,osh[0],osh[1]), dtype=COMPLEX_TYPE)
+    for idx in range(num_ob_modes):
+        object_array[idx] = np.ones(osh) * (3 * idx + 1) + 1j * np.ones(osh) * (3 * idx + 1)
+
+    exit_wave = np.empty(shape=(A,fsh[0],fsh[1]), dtype=COMPLEX_TYPE)
+    for idx in range(A):
+        exit_wave[idx] = np.ones(fsh) * (idx + 1) + 1j * np.ones(fsh) * (idx + 1)
+
+    addr = np.zeros((num_pts, num_modes, 5, 3), dtype=INT_TYPE)
+    exit_idx = 0
+    position_idx = 0
+    for xpos, ypos in zip(X, Y):  #
+        mode_idx = 0
+        for pr_mode in range(num_pr_modes):
+            for ob_mode in range(num_ob_modes):
+                addr[position_idx, mode_idx] = np.array([[pr_mode, 0, 0],
+                                                         [ob_mode, ypos, xpos],
+                                                         [exit_idx, 0, 0],
+                                                         [0, 0, 0],
+                                                         [0, 0, 0]], dtype=INT_TYPE)
+                mode_idx += 1
+                exit_idx += 1
+        position_idx += 1
+
+    object_array_denominator = np.ones(object_array.shape, dtype=FLOAT_TYPE)
+    probe_denominator = np.ones(probe.shape, dtype=FLOAT_TYPE)
+
+    return addr, object_array, object_array_denominator, probe, exit_wave, probe_denominator
+
+
+scan_pts=50
+for frame_size in [16,32,64,128]:
+    for overlap in [0.1,0.2]:
+        addr, ob, obn, pr, ex, prn = prepare_arrays(overlap, scan_pts, frame_size)
+        res = {}
+        for scatter in [False, True]:
+            pok = POK(scatter=scatter)
+            o, on = ob.copy(), obn.copy()
+            p, pn = pr.copy(), prn.copy()
+            t0 = time.time()
+            pok.ob_update(addr, o, on, pr, ex)
+            t1 = time.time()
+            pok.pr_update(addr, p, pn, ob, ex)
+            t2 = time.time()
+            res[scatter] = (o, p)
+            print('{} scatter={}: ob_update {:.1f}ms, pr_update {:.1f}ms'.format(
+                (overlap, frame_size, scan_pts), scatter, (t1-t0)*1e3, (t2-t1)*1e3))
+        assert all(np.array_equal(a, b) for a, b in zip(res[False], res[True]))
@@ -0,0 +1,81 @@
+"""
+Time to reach a given log-likelihood for SGD_serial and ML_serial.
+
+One iteration of either engine is one pass through all frames, such that
+the iterations are equivalent in the amount of data processed.
+"""
+import argparse
+import time
+import numpy as np
+import ptypy
+from ptypy import utils as u
+from ptypy.core import Ptycho
+ptypy.load_gpu_engines("serial")
+
+parser = argparse.ArgumentParser(description='Time to log-likelihood of SGD_serial and ML_serial')
+parser.add_argument('--frames', type=int, default=1000, help='Number of frames of the simulated scan')
+parser.add_argument('--shape', type=int, default=64, help='Frame edge length')
+parser.add_argument('--iterations', type=int, default=20, help='Passes through the data per engine')
+parser.add_argument('--batch-size', type=int, default=64, help='Minibatch size of SGD_serial')
+parser.add_argument('--step-size', type=float, default=0.01, help='Object step size of SGD_serial')
+parser.add_argument('--probe-step-size', type=float, default=0.003, help='Probe step size of SGD_serial')
+parser.add_argument('--step-size-decay', type=float, default=0.2, help='Step size decay per iteration of SGD_serial')
+parser.add_argument('--correct-probe', action='store_true', help='Start from the simulated probe')
+args = parser.parse_args()
+
+def run(engine_params):
+    np.random.seed(0)
+    p = u.Param()
+    p.verbose_level = "critical"
+    p.io = u.Param()
+    p.io.home = "./"
+    p.io.rfile = None
+    p.io.interaction = u.Param(active=False)
+    p.io.autosave = u.Param(active=False)
+    p.io.autoplot = u.Param(active=False)
+    p.scans = u.Param()
+    p.scans.MF = u.Param()
+    p.scans.MF.name = "BlockFull"
+    p.scans.MF.propagation = "farfield"
+    p.scans.MF.data = u.Param()
+    p.scans.MF.data.name = 'MoonFlowerScan'
+    p.scans.MF.data.num_frames = args.frames
+    p.scans.MF.data.shape = args.shape
+    p.scans.MF.data.save = None
+    p.scans.MF.data.photons = 1e8
+    p.scans.MF.data.density = 0.2
+    p.scans.MF.data.add_poisson_noise = False
+    p.engines = u.Param()
+    p.engines.engine00 = engine_params
+    P = Ptycho(p, level=4)
+    if args.correct_probe:
+        P.probe.S['SMFG00'].data[0] = P.model.scans['MF'].ptyscan.pr
+    P.run()
+    info = P.runtime["iter_info"]
+    return np.cumsum([i["duration"] for i in info]), np.array([i["error"][1] for i in info])
+
+engines = {}
+engines["ML_serial"] = u.Param(name="ML_serial", numiter=args.iterations, probe_update_start=0)
+engines["SGD_serial"] = u.Param(name="SGD_serial", numiter=args.iterations, probe_update_start=0,
+                                batch_size=args.batch_size, step_size=args.step_size,
+                                probe_step_size=args.probe_step_size,
+                                step_size_decay=args.step_size_decay)
+results = {name: run(pars) for name, pars in engines.items()}
+
+print(','.join(['Engine', 'Iteration', 'Time', 'LL']))
+for name, (t, LL) in results.items():
+    for i in range(len(t)):
+        print(','.join([str(x) for x in [name, i, t[i], LL[i]]]))
+
+# Time to the log-likelihood reached by ML_serial after a quarter,
+# half and all of the iterations
+print(','.join(['Target LL', 'ML_serial', 'SGD_serial']))
+t_ML, LL_ML = results["ML_serial"]
+for k in [len(LL_ML) // 4, len(LL_ML) // 2, len(LL_ML) - 1]:
+    target = LL_ML[k]
+    times = []
+    for name in ["ML_serial", "SGD_serial"]:
+        t, LL = results[name]
+        reached = np.nonzero(LL <= target)[0]
+        times.append(t[reached[0]] if len(reached) else np.nan)
+    print(','.join([str(x) for x in [target] + times]))
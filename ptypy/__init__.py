@@ -93,6 +93,8 @@ def load_gpu_engines(arch='cuda'):
         from .accelerate.base.engines import projectional_serial_stream
         from .accelerate.base.engines import stochastic
         from .accelerate.base.engines import ML_serial
+        from .accelerate.base.engines import LBFGS_serial
+        from .accelerate.base.engines import SGD_serial
     if arch=='ocl':
         from .accelerate.ocl_pyopencl.engines import DM_ocl, DM_ocl_npy
 
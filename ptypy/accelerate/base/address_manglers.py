@@ -85,3 +85,41 @@ class GridSearchMangler(BaseMangler):
 
 
 
+
+class GradientMangler(BaseMangler):
+    '''
+    No trial shifts, limits the shifts estimated from the error gradient
+    instead. Positions are in (subpixel) units of the object pixels.
+    '''
+    def __init__(self, *args, **kwargs):
+        super(GradientMangler, self).__init__(*args, **kwargs)
+        self.nshifts = 0
+        self.step = 0
+
+    def setup_shifts(self, current_iteration, nframes=1):
+        '''
+        Maximum step of this iteration
+        '''
+        self.step = self.max_step(current_iteration)
+
+    def get_positions(self, positions, shifts, original_positions, max_oby, max_obx):
+        '''
+        New positions after the `shifts`, with steps of at most the
+        maximum step, at most the maximum bound away from the
+        `original_positions` and within the object.
+        '''
+        shifts = np.array(shifts, dtype=float)
+        norms = np.linalg.norm(shifts, axis=-1)
+        too_far = norms > self.step
+        shifts[too_far] *= (self.step / norms[too_far])[:, None]
+
+        new_positions = positions + shifts
+        if self.max_bound is not None:
+            delta = new_positions - original_positions
+            norms = np.linalg.norm(delta, axis=-1)
+            too_far = norms > self.max_bound
+            delta[too_far] *= (self.max_bound / norms[too_far])[:, None]
+            new_positions = original_positions + delta
+        self.apply_bounding_box(new_positions[:, 0], 0, max_oby)
+        self.apply_bounding_box(new_positions[:, 1], 0, max_obx)
+        return new_positions
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Limited-memory BFGS reconstruction engine.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+from ptypy.engines import register
+from ptypy.engines.LBFGS import LBFGSMixin
+from .ML_serial import ML_serial
+
+
+__all__ = ['LBFGS_serial']
+
+@register()
+class LBFGS_serial(LBFGSMixin, ML_serial):
+    """
+    Limited-memory BFGS reconstruction engine, with the noise models
+    of the serialized maximum likelihood engine.
+
+    Defaults:
+
+    [name]
+    default = LBFGS_serial
+    type = str
+    help =
+    doc =
+
+    """
+
+    def engine_initialize(self):
+        """
+        Prepare for L-BFGS reconstruction.
+        """
+        super(LBFGS_serial, self).engine_initialize()
+        self._bfgs_initialize()
+
+    def engine_finalize(self):
+        """
+        Delete temporary containers.
+        """
+        self._bfgs_finalize()
+        super(LBFGS_serial, self).engine_finalize()
@@ -15,7 +15,7 @@ import numpy as np
 import time
 
 from ptypy.engines.ML import ML, BaseModel
-from .projectional_serial import serialize_array_access
+from .projectional_serial import serialize_array_access, refine_positions_gradient
 from ptypy import utils as u
 from ptypy.utils.verbose import logger, log
 from ptypy.utils import parallel
@@ -23,18 +23,21 @@ from ptypy.engines.utils import Cnorm2, Cdot
 from ptypy.engines import register
 from ptypy.accelerate.base.kernels import GradientDescentKernel, AuxiliaryWaveKernel, PoUpdateKernel, PositionCorrectionKernel
 from ptypy.accelerate.base import address_manglers
+from .thread_pool import ThreadPoolMixin
+from .po_update import PoUpdateMixin
 
 
 __all__ = ['ML_serial']
 
 @register()
-class ML_serial(ML):
+class ML_serial(ML, ThreadPoolMixin, PoUpdateMixin):
 
     def __init__(self, ptycho_parent, pars=None):
         """
         Maximum likelihood reconstruction engine.
         """
         super(ML_serial, self).__init__(ptycho_parent, pars)
+        ThreadPoolMixin.__init__(self)
 
         self.kernels = {}
         self.diff_info = {}
@@ -46,6 +49,7 @@ class ML_serial(ML):
         Prepare for ML reconstruction.
         """
         super(ML_serial, self).engine_initialize()
+        self._setup_thread_pool()
         self._setup_kernels()
 
     def _initialize_model(self):
@@ -54,9 +58,9 @@ class ML_serial(ML):
         if self.p.ML_type.lower() == "gaussian":
             self.ML_model = GaussianModel(self)
         elif self.p.ML_type.lower() == "poisson":
-            raise NotImplementedError('Poisson norm model not yet implemented')
+            self.ML_model = PoissonModel(self)
         elif self.p.ML_type.lower() == "euclid":
-            raise NotImplementedError('Euclid norm model not yet implemented')
+            self.ML_model = EuclidModel(self)
         else:
             raise RuntimeError("Unsupported ML_type: '%s'" % self.p.ML_type)
 
@@ -76,6 +80,8 @@ class ML_serial(ML):
 
             # Get info to shape buffer arrays
             fpc = scan.max_frames_per_block
+            if self.pool is not None:
+                fpc = self._thread_frames(fpc)
 
             # TODO : make this more foolproof
             try:
@@ -94,19 +100,40 @@ class ML_serial(ML):
             kern.GDK = GradientDescentKernel(aux, nmodes)
             kern.GDK.allocate()
 
-            kern.POK = PoUpdateKernel()
+            kern.POK = self._po_update_kernel()
             kern.POK.allocate()
 
             kern.AWK = AuxiliaryWaveKernel()
             kern.AWK.allocate()
 
-            kern.FW = geo.propagator.fw
-            kern.BW = geo.propagator.bw
+            kern.FW = geo.propagator.fw_inplace
+            kern.BW = geo.propagator.bw_inplace
             kern.resolution = geo.resolution[0]
 
+            # one set of kernels per worker thread, each on its own slice of the buffers
+            if self.pool is not None:
+                kern.threads = []
+                for i, (taux, ta, tb) in enumerate(zip(self._split_aux(aux, nmodes),
+                                                       self._split_aux(kern.a, nmodes),
+                                                       self._split_aux(kern.b, nmodes))):
+                    tk = u.Param()
+                    tk.index = i
+                    tk.aux = taux
+                    tk.a = ta
+                    tk.b = tb
+                    tk.GDK = GradientDescentKernel(taux, nmodes)
+                    tk.GDK.allocate()
+                    tk.POK = self._po_update_kernel()
+                    tk.AWK = AuxiliaryWaveKernel()
+                    tk.FW = kern.FW
+                    tk.BW = kern.BW
+                    kern.threads.append(tk)
+
             if self.do_position_refinement:
                 kern.PCK = PositionCorrectionKernel(aux, nmodes, self.p.position_refinement, geo.resolution)
                 kern.PCK.allocate()
+                if self.p.position_refinement.method == "Gradient":
+                    kern.daux = np.zeros_like(aux)
 
     def engine_prepare(self):
 
@@ -130,48 +157,27 @@ class ML_serial(ML):
             # Re-create exit addresses when gradient models (single exit buffer per view) are used
             # TODO: this should not be necessary, kernels should not use exit wave information
             if self.kernels[prep.label].scanmodel in ("GradFull", "BlockGradFull"):
-                for i,addr in enumerate(prep.addr):
-                    nmodes = len(addr[:,2,0])
-                    for j,ea in enumerate(addr[:,2,0]):
-                        prep.addr[i,j,2,0] = i*nmodes+j
+                nviews, nmodes = prep.addr.shape[:2]
+                prep.addr[:,:,2,0] = np.arange(nviews * nmodes).reshape(nviews, nmodes)
             prep.I = d.data
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
                 prep.ma = self.ma.S[d.ID].data
+                # subpixel positions and the errors at their last refinement
+                prep.original_pos = prep.addr[:, 0, 1, 1:].astype(float)
+                prep.pos = prep.original_pos.copy()
+                prep.posref_err = np.full((prep.addr.shape[0],), np.nan)
 
         self.ML_model.prepare()
 
-    def _get_smooth_gradient(self, data, sigma):
-        return self.smooth_gradient(data)
-
-    def _replace_ob_grad(self):
-        new_ob_grad = self.ob_grad_new
-        # Smoothing preconditioner
-        if self.smooth_gradient:
-            self.smooth_gradient.sigma *= (1. - self.p.smooth_gradient_decay)
-            for name, s in new_ob_grad.storages.items():
-                s.data[:] = self._get_smooth_gradient(s.data, self.smooth_gradient.sigma)
-
-        norm = Cnorm2(new_ob_grad)
-        dot = np.real(Cdot(new_ob_grad, self.ob_grad))
-        self.ob_grad << new_ob_grad
-        return norm, dot
-
-    def _replace_pr_grad(self):
-        new_pr_grad = self.pr_grad_new
-        # probe support
-        if self.p.probe_update_start <= self.curiter:
-            # Apply probe support if needed
-            for name, s in new_pr_grad.storages.items():
-                self.support_constraint(s)
-        else:
-            new_pr_grad.fill(0.)
-
-        norm = Cnorm2(new_pr_grad)
-        dot = np.real(Cdot(new_pr_grad, self.pr_grad))
-        self.pr_grad << new_pr_grad
-        return norm, dot
+    def _prefetch(self, dID):
+        """
+        Read ahead the out-of-core data of block `dID`.
+        """
+        prep = self.diff_info[dID]
+        u.prefetch(prep.I)
+        u.prefetch(prep.weights)
 
     def engine_iterate(self, num=1):
         """
@@ -304,6 +310,10 @@ class ML_serial(ML):
                 PCK = kern.PCK
                 FW = kern.FW
 
+                if self.p.position_refinement.method == "Gradient":
+                    self._position_update_gradient(prep, kern, ob, pr)
+                    continue
+
                 # Keep track of object boundaries
                 max_oby = ob.shape[-2] - aux.shape[-2] - 1
                 max_obx = ob.shape[-1] - aux.shape[-1] - 1
@@ -327,6 +337,29 @@ class ML_serial(ML):
                 prep.err_phot = error_state
                 prep.addr = addr
 
+    def _position_update_gradient(self, prep, kern, ob, pr):
+        """
+        Gradient position refinement of the frames of a block whose
+        error changed since their last refinement.
+        """
+        tol = self.p.position_refinement.tolerance
+        err_phot = prep.err_phot
+        changed = ~(np.abs(err_phot - prep.posref_err) <= tol * np.abs(prep.posref_err))
+        idx = np.nonzero(changed)[0]
+        if not len(idx):
+            return
+        prep.posref_err[idx] = err_phot[idx]
+
+        PCK = kern.PCK
+        I = prep.I
+        w = prep.weights
+
+        def error(aux, addr, frames, err):
+            PCK.log_likelihood_ml(aux, addr, I[frames], w[frames], err)
+
+        log(4, 'Position refinement (gradient): iteration %s, %d frames' % (self.curiter, len(idx)))
+        refine_positions_gradient(kern, prep, idx, ob, pr, I[idx], w[idx], error, self.curiter)
+
     def engine_finalize(self):
         """
         try deleting ever helper contianer
@@ -337,7 +370,10 @@ class ML_serial(ML):
                 res = self.kernels[prep.label].resolution
                 for i,view in enumerate(d.views):
                     for j,(pname, pod) in enumerate(view.pods.items()):
-                        delta = (prep.addr[i][j][1][1:] - prep.original_addr[i][j][1][1:]) * res
+                        if self.p.position_refinement.method == "Gradient":
+                            delta = (prep.pos[i] - prep.original_pos[i]) * res
+                        else:
+                            delta = (prep.addr[i][j][1][1:] - prep.original_addr[i][j][1][1:]) * res
                         pod.ob_view.coord += delta 
                         pod.ob_view.storage.update_views(pod.ob_view)
             self.ptycho.record_positions = True
@@ -349,6 +385,8 @@ class ML_serial(ML):
             float_intens_coeff[label] = prep.float_intens_coeff
         self.ptycho.runtime["float_intens"] = parallel.gather_dict(float_intens_coeff)
 
+        self._close_thread_pool()
+
 
 class BaseModelSerial(BaseModel):
     """
@@ -362,32 +400,114 @@ class BaseModelSerial(BaseModel):
         pass
 
 
-class GaussianModel(BaseModelSerial):
+class BlockModelSerial(BaseModelSerial):
     """
-    Gaussian noise model.
-    TODO: feed actual statistical weights instead of using the Poisson statistic heuristic.
+    Log-likelihood model evaluated block by block with the kernels of
+    the engine. Subclasses provide the weights and the calls of the noise
+    model specific kernels.
     """
 
     def __init__(self, MLengine):
         """
-        Core functions for ML computation using a Gaussian model.
+        Core functions for block-wise ML computation.
         """
-        super(GaussianModel, self).__init__(MLengine)
+        super(BlockModelSerial, self).__init__(MLengine)
+        self._far_field_free = int(self.p.far_field_cache * 2**20)
 
     def prepare(self):
 
-        super(GaussianModel, self).prepare()
+        super(BlockModelSerial, self).prepare()
 
         for label, d in self.engine.ptycho.new_data:
             prep = self.engine.diff_info[d.ID]
-            prep.weights = (self.Irenorm * self.engine.ma.S[d.ID].data
-                            / (1. / self.Irenorm + d.data)).astype(d.data.dtype)
+            ma = self.engine.ma.S[d.ID].data
+            if d.backing is None:
+                prep.weights = self._weights(d.data, ma)
+            else:
+                # Out-of-core data, keep the weights on scratch as well
+                prep.weights = u.scratch_array(d.data.shape, d.data.dtype, d.backing)
+                for i in range(d.data.shape[0]):
+                    prep.weights[i] = self._weights(d.data[i], ma[i])
+            prep.LLbase = self._LLbase(d.data)
+
+            # Far field waves of the gradient step, reused by the line search.
+            # Blocks beyond the memory budget and out-of-core blocks
+            # propagate them again.
+            fsh = (prep.addr.shape[0] * prep.addr.shape[1],) + d.data.shape[-2:]
+            nbytes = int(np.prod(fsh)) * np.dtype(np.complex64).itemsize
+            if d.backing is None and nbytes <= self._far_field_free:
+                prep.f = np.zeros(fsh, dtype=np.complex64)
+                self._far_field_free -= nbytes
+            else:
+                prep.f = None
+            prep.f_valid = False
 
     def __del__(self):
         """
         Clean up routine
         """
-        super(GaussianModel, self).__del__()
+        super(BlockModelSerial, self).__del__()
+
+    def _weights(self, I, ma):
+        """
+        Weights of the frames `I` with mask `ma`.
+        """
+        raise NotImplementedError
+
+    def _LLbase(self, I):
+        """
+        Constant log-likelihood per frame of `I`, or None.
+        """
+        return None
+
+    def _main(self, GDK, aux, addr, w, I, fic):
+        """
+        Error and gradient in detector space from the model intensities
+        of `GDK`. Updates the floating intensity coefficients `fic` if
+        required.
+        """
+        raise NotImplementedError
+
+    def _fill_b(self, GDK, addr, Brenorm, w, I, B):
+        """
+        Accumulate the line minimization coefficients in `B`.
+        """
+        raise NotImplementedError
+
+    def _Brenorm(self):
+        """
+        Normalisation of the line minimization coefficients.
+        """
+        return 1. / self.LL[0] ** 2
+
+    def _grad_block(self, kern, addr, w, I, err_phot, fic, ob, pr, obg, prg, f=None):
+        """
+        Gradient contribution of a stack of frames, computed with the
+        kernels and the aux buffer in `kern`. The far field waves are
+        copied to `f` if given.
+        """
+        GDK = kern.GDK
+        AWK = kern.AWK
+        POK = kern.POK
+        aux = kern.aux
+        FW = kern.FW
+        BW = kern.BW
+
+        # make propagated exit (to buffer)
+        AWK.build_aux_no_ex(aux, addr, ob, pr, add=False)
+
+        # forward prop
+        aux[:] = FW(aux)
+        if f is not None:
+            f[:] = aux[:len(f)]
+
+        GDK.make_model(aux, addr)
+        self._main(GDK, aux, addr, w, I, fic)
+        GDK.error_reduce(addr, err_phot)
+        aux[:] = BW(aux)
+
+        POK.ob_update_ML(addr, obg, pr, aux)
+        POK.pr_update_ML(addr, prg, ob, aux)
 
     def new_grad(self):
         """
@@ -405,21 +525,23 @@ class GaussianModel(BaseModelSerial):
         LL = np.array([0.])
         error_dct = {}
 
-        for dID in self.di.S.keys():
+        # per-thread accumulation buffers
+        if self.engine.pool is not None:
+            obg_acc = self.engine._accumulators(ob_grad)
+            prg_acc = self.engine._accumulators(pr_grad)
+
+        dIDs = list(self.di.S.keys())
+        for i, dID in enumerate(dIDs):
             prep = self.engine.diff_info[dID]
             # find probe, object in exit ID in dependence of dID
             pID, oID, eID = prep.poe_IDs
 
+            # read ahead the next block of out-of-core data
+            if i + 1 < len(dIDs):
+                self.engine._prefetch(dIDs[i + 1])
+
             # references for kernels
             kern = self.engine.kernels[prep.label]
-            GDK = kern.GDK
-            AWK = kern.AWK
-            POK = kern.POK
-
-            aux = kern.aux
-
-            FW = kern.FW
-            BW = kern.BW
 
             # get addresses and auxilliary array
             addr = prep.addr
@@ -429,28 +551,30 @@ class GaussianModel(BaseModelSerial):
 
             # local references
             ob = self.engine.ob.S[oID].data
-            obg = ob_grad.S[oID].data
             pr = self.engine.pr.S[pID].data
-            prg = pr_grad.S[pID].data
             I = prep.I
+            f = prep.f
+            nmodes = addr.shape[1]
 
-            # make propagated exit (to buffer)
-            AWK.build_aux_no_ex(aux, addr, ob, pr, add=False)
-
-            # forward prop
-            aux[:] = FW(aux)
-
-            GDK.make_model(aux, addr)
-
-            if self.p.floating_intensities:
-                GDK.floating_intensity(addr, w, I, fic)
-
-            GDK.main(aux, addr, w, I)
-            GDK.error_reduce(addr, err_phot)
-            aux[:] = BW(aux)
-
-            POK.ob_update_ML(addr, obg, pr, aux)
-            POK.pr_update_ML(addr, prg, ob, aux)
+            if self.engine.pool is None:
+                self._grad_block(kern, addr, w, I, err_phot, fic, ob, pr,
+                                 ob_grad.S[oID].data, pr_grad.S[pID].data, f)
+            else:
+                self.engine._map_frames(kern.threads, addr.shape[0],
+                    lambda tk, sl: self._grad_block(tk, self.engine._local_exit_addr(addr[sl]),
+                                                    w[sl], I[sl],
+                                                    err_phot[sl], fic[sl], ob, pr,
+                                                    obg_acc[oID][tk.index],
+                                                    prg_acc[pID][tk.index],
+                                                    None if f is None else
+                                                    f[sl.start * nmodes:sl.stop * nmodes]))
+            prep.f_valid = f is not None
+            if prep.LLbase is not None:
+                err_phot += prep.LLbase
+
+        if self.engine.pool is not None:
+            self.engine._reduce_accumulators(obg_acc)
+            self.engine._reduce_accumulators(prg_acc)
 
         for dID, prep in self.engine.diff_info.items():
             err_phot = prep.err_phot
@@ -475,6 +599,38 @@ class GaussianModel(BaseModelSerial):
         self.LL = LL / self.tot_measpts
         return error_dct
 
+    def _line_coeffs_block(self, kern, addr, w, I, fic, ob, ob_h, pr, pr_h, Brenorm, B, f=None):
+        """
+        Line minimization coefficients of a stack of frames, computed with
+        the kernels and the buffers in `kern` and accumulated in `B`.
+        The far field waves `f` of the gradient step are propagated again
+        if not given.
+        """
+        GDK = kern.GDK
+        AWK = kern.AWK
+
+        a = kern.a
+        b = kern.b
+
+        FW = kern.FW
+
+        # make propagated exit (to buffer)
+        if f is None:
+            f = kern.aux
+            AWK.build_aux_no_ex(f, addr, ob, pr, add=False)
+            f[:] = FW(f)
+        AWK.build_aux_no_ex(a, addr, ob_h, pr, add=False)
+        AWK.build_aux_no_ex(a, addr, ob, pr_h, add=True)
+        AWK.build_aux_no_ex(b, addr, ob_h, pr_h, add=False)
+
+        # forward prop
+        a[:] = FW(a)
+        b[:] = FW(b)
+
+        GDK.make_a012(f, a, b, addr, I, fic)
+        self._fill_b(GDK, addr, Brenorm, w, I, B)
+        return B
+
     def poly_line_coeffs(self, c_ob_h, c_pr_h):
         """
         Compute the coefficients of the polynomial for line minimization
@@ -482,25 +638,22 @@ class GaussianModel(BaseModelSerial):
         """
 
         B = np.zeros((3,), dtype=np.longdouble)
-        Brenorm = 1. / self.LL[0] ** 2
+        Brenorm = self._Brenorm()
 
         # Outer loop: through diffraction patterns
-        for dID in self.di.S.keys():
+        dIDs = list(self.di.S.keys())
+        for i, dID in enumerate(dIDs):
             prep = self.engine.diff_info[dID]
 
+            # read ahead the next block of out-of-core data
+            if i + 1 < len(dIDs):
+                self.engine._prefetch(dIDs[i + 1])
+
             # find probe, object in exit ID in dependence of dID
             pID, oID, eID = prep.poe_IDs
 
             # references for kernels
             kern = self.engine.kernels[prep.label]
-            GDK = kern.GDK
-            AWK = kern.AWK
-
-            f = kern.aux
-            a = kern.a
-            b = kern.b
-
-            FW = kern.FW
 
             # get addresses and auxilliary array
             addr = prep.addr
@@ -514,19 +667,23 @@ class GaussianModel(BaseModelSerial):
             pr_h = c_pr_h.S[pID].data
             I = self.di.S[dID].data
 
-            # make propagated exit (to buffer)
-            AWK.build_aux_no_ex(f, addr, ob, pr, add=False)
-            AWK.build_aux_no_ex(a, addr, ob_h, pr, add=False)
-            AWK.build_aux_no_ex(a, addr, ob, pr_h, add=True)
-            AWK.build_aux_no_ex(b, addr, ob_h, pr_h, add=False)
-
-            # forward prop
-            f[:] = FW(f)
-            a[:] = FW(a)
-            b[:] = FW(b)
+            # object and probe change after the line search
+            f = prep.f if prep.f_valid else None
+            prep.f_valid = False
+            nmodes = addr.shape[1]
 
-            GDK.make_a012(f, a, b, addr, I, fic)
-            GDK.fill_b(addr, Brenorm, w, B)
+            if self.engine.pool is None:
+                self._line_coeffs_block(kern, addr, w, I, fic, ob, ob_h, pr, pr_h, Brenorm, B, f)
+            else:
+                Bs = self.engine._map_frames(kern.threads, addr.shape[0],
+                    lambda tk, sl: self._line_coeffs_block(tk, addr[sl], w[sl], I[sl], fic[sl],
+                                                           ob, ob_h, pr, pr_h, Brenorm,
+                                                           np.zeros_like(B),
+                                                           None if f is None else
+                                                           f[sl.start * nmodes:sl.stop * nmodes]))
+                B += np.sum(Bs, axis=0)
+            if prep.LLbase is not None:
+                B[0] += prep.LLbase.sum() * Brenorm
 
         parallel.allreduce(B)
 
@@ -539,3 +696,71 @@ class GaussianModel(BaseModelSerial):
         self.B = B
 
         return B
+
+
+class GaussianModel(BlockModelSerial):
+    """
+    Gaussian noise model.
+    TODO: feed actual statistical weights instead of using the Poisson statistic heuristic.
+    """
+
+    def _weights(self, I, ma):
+        return (self.Irenorm * ma / (1. / self.Irenorm + I)).astype(I.dtype)
+
+    def _main(self, GDK, aux, addr, w, I, fic):
+        if self.p.floating_intensities:
+            GDK.floating_intensity(addr, w, I, fic)
+        GDK.main(aux, addr, w, I)
+
+    def _fill_b(self, GDK, addr, Brenorm, w, I, B):
+        GDK.fill_b(addr, Brenorm, w, B)
+
+
+class PoissonModel(BlockModelSerial):
+    """
+    Poisson noise model.
+    """
+
+    def __init__(self, MLengine):
+        """
+        Core functions for ML computation using a Poisson model.
+        """
+        super(PoissonModel, self).__init__(MLengine)
+        from scipy import special
+        self._gammaln = special.gammaln
+
+    def _weights(self, I, ma):
+        return ma.astype(I.dtype)
+
+    def _LLbase(self, I):
+        # frame by frame, such that out-of-core data is read once
+        return np.array([self._gammaln(Ii + 1).sum() for Ii in I])
+
+    def _main(self, GDK, aux, addr, w, I, fic):
+        if self.p.floating_intensities:
+            GDK.floating_intensity_sum(addr, I, fic)
+        GDK.main_poisson(aux, addr, w, I)
+
+    def _fill_b(self, GDK, addr, Brenorm, w, I, B):
+        GDK.fill_b_poisson(addr, Brenorm, w, I, B)
+
+    def _Brenorm(self):
+        return 1. / (self.tot_measpts * self.LL[0]) ** 2
+
+
+class EuclidModel(BlockModelSerial):
+    """
+    Euclid noise model, the squared distance of model and measured
+    Fourier magnitudes.
+    """
+
+    def _weights(self, I, ma):
+        return ma.astype(I.dtype)
+
+    def _main(self, GDK, aux, addr, w, I, fic):
+        if self.p.floating_intensities:
+            GDK.floating_intensity_sum(addr, I, fic)
+        GDK.main_euclid(aux, addr, w, I)
+
+    def _fill_b(self, GDK, addr, Brenorm, w, I, B):
+        GDK.fill_b_euclid(addr, Brenorm, w, I, B)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Minibatch stochastic gradient reconstruction engine.
+
+The engine minimizes the negative log-likelihood of the ML_serial noise
+models, but updates object and probe after every minibatch of randomly
+drawn frames with Adam steps instead of after a full pass through the
+data.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import numpy as np
+import time
+
+from ptypy import utils as u
+from ptypy.utils.verbose import logger
+from ptypy.utils import parallel
+from ptypy.engines import register
+from ptypy.accelerate.base.kernels import GradientDescentKernel, AuxiliaryWaveKernel, PoUpdateKernel
+from .ML_serial import ML_serial
+
+
+__all__ = ['SGD_serial']
+
+@register()
+class SGD_serial(ML_serial):
+    """
+    Minibatch stochastic gradient descent on the maximum likelihood
+    noise models. One iteration is one pass through all frames in
+    random order.
+
+    Defaults:
+
+    [name]
+    default = SGD_serial
+    type = str
+    help =
+    doc =
+
+    [batch_size]
+    default = 32
+    type = int
+    lowlim = 1
+    help = Number of randomly drawn frames per object and probe update
+    doc = Minibatches are drawn within a diffraction block, such that the data can be streamed block by block.
+
+    [step_size]
+    default = 0.01
+    type = float
+    lowlim = 0.0
+    help = Adam step size of the object, relative to its largest amplitude at the start
+
+    [probe_step_size]
+    default = 0.003
+    type = float
+    lowlim = 0.0
+    help = Adam step size of the probe, relative to its largest amplitude at the start
+    doc = The probe is updated with every minibatch, the object only where the minibatch covers it. The probe step is normalised by the largest second moment of its gradient rather than pixel by pixel, such that weakly illuminated probe pixels take proportionally smaller steps.
+
+    [step_size_decay]
+    default = 0.2
+    type = float
+    lowlim = 0.0
+    help = Decay rate of the step size per iteration
+    doc = The step sizes of iteration n are divided by (1 + n * step_size_decay), which damps the minibatch noise close to convergence.
+
+    [beta1]
+    default = 0.9
+    type = float
+    lowlim = 0.0
+    uplim = 1.0
+    help = Decay rate of the gradient average (momentum)
+
+    [beta2]
+    default = 0.999
+    type = float
+    lowlim = 0.0
+    uplim = 1.0
+    help = Decay rate of the squared gradient average
+
+    """
+
+    def __init__(self, ptycho_parent, pars=None):
+        """
+        Minibatch stochastic gradient reconstruction engine.
+        """
+        super(SGD_serial, self).__init__(ptycho_parent, pars)
+        if parallel.MPIenabled:
+            raise NotImplementedError("The stochastic engines are not compatible with MPI")
+
+        # Number of Adam steps taken
+        self.nsteps = 0
+
+        self.ptycho.citations.add_article(
+            title='Adam: A Method for Stochastic Optimization',
+            author='Kingma D. P. and Ba J.',
+            journal='arXiv',
+            volume=1412.6980,
+            year=2014,
+            page=1,
+            doi='10.48550/arXiv.1412.6980',
+            comment='The Adam update of object and probe',
+        )
+
+    def engine_initialize(self):
+        """
+        Prepare for SGD reconstruction.
+        """
+        super(SGD_serial, self).engine_initialize()
+        if self.p.reg_del2:
+            logger.warning('SGD_serial: the Gaussian prior regularizer is not supported and ignored.')
+
+        # Adam moments, in the containers of the ML gradient and direction
+        # (first moment in ob_h / pr_h, second moment in the real part of
+        # ob_grad / pr_grad)
+        for c in (self.ob_h, self.pr_h, self.ob_grad, self.pr_grad):
+            c.fill(0.)
+        self.nsteps = 0
+        self.ob_step = {k: self.p.step_size * max(np.abs(s.data).max(), 1e-10)
+                        for k, s in self.ob.S.items()}
+        self.pr_step = {k: self.p.probe_step_size * max(np.abs(s.data).max(), 1e-10)
+                        for k, s in self.pr.S.items()}
+
+    def _initialize_model(self):
+        super(SGD_serial, self)._initialize_model()
+        # there is no line search to reuse far field waves for
+        self.ML_model._far_field_free = 0
+
+    def _setup_kernels(self):
+        """
+        Additional kernels on a buffer of one minibatch, such that a
+        parameter update only propagates the frames of its minibatch.
+        """
+        super(SGD_serial, self)._setup_kernels()
+        for label, kern in self.kernels.items():
+            nmodes = kern.GDK.nmodes
+            nframes = min(self.p.batch_size, kern.aux.shape[0] // nmodes)
+
+            bk = u.Param()
+            bk.aux = np.zeros((nframes * nmodes,) + kern.aux.shape[1:], dtype=kern.aux.dtype)
+            bk.GDK = GradientDescentKernel(bk.aux, nmodes)
+            bk.GDK.allocate()
+            bk.POK = self._po_update_kernel()
+            bk.POK.allocate()
+            bk.AWK = AuxiliaryWaveKernel()
+            bk.AWK.allocate()
+            bk.FW = kern.FW
+            bk.BW = kern.BW
+            kern.batch = bk
+
+    @staticmethod
+    def _adam(x, g, m, v, step, b1, b2, t, shared=False):
+        """
+        Adam step of `x` along the gradient `g`, updating the first and
+        second moments `m` and `v` in place. With `shared`, the step is
+        normalised by the largest second moment instead of pixel by pixel.
+        """
+        m *= b1
+        m += (1. - b1) * g
+        v *= b2
+        v += (1. - b2) * (g.real**2 + g.imag**2)
+        mhat = m / (1. - b1**t)
+        if shared:
+            vhat = np.sqrt(v.real.max() / (1. - b2**t))
+        else:
+            vhat = np.sqrt(v.real / (1. - b2**t))
+        vhat += 1e-20
+        x -= step * (mhat / vhat)
+
+    def _minibatch(self, prep, idx, update_probe):
+        """
+        Gradient of the frames `idx` of one diffraction block and Adam
+        update of the part of the object they cover and of the probe.
+        """
+        pID, oID, eID = prep.poe_IDs
+        kern = self.kernels[prep.label].batch
+        addr = self._local_exit_addr(prep.addr[idx])
+
+        # bounding box of the frames on the object
+        sh = kern.aux.shape[-2:]
+        y0, x0 = addr[:, :, 1, 1].min(), addr[:, :, 1, 2].min()
+        y1, x1 = addr[:, :, 1, 1].max() + sh[0], addr[:, :, 1, 2].max() + sh[1]
+        addr[:, :, 1, 1] -= y0
+        addr[:, :, 1, 2] -= x0
+        box = (slice(None), slice(y0, y1), slice(x0, x1))
+
+        # the object gradient is accumulated in a contiguous buffer, as
+        # the batched scatter-add of the kernels requires
+        ob = self.ob.S[oID].data[box]
+        obg = np.zeros_like(ob)
+        pr = self.pr.S[pID].data
+        prg = self.pr_grad_new.S[pID].data
+        prg.fill(0.)
+
+        err_phot = prep.err_phot[idx]
+        fic = prep.float_intens_coeff[idx]
+        self.ML_model._grad_block(kern, addr, prep.weights[idx], prep.I[idx],
+                                  err_phot, fic, ob, pr, obg, prg)
+        prep.err_phot[idx] = err_phot
+        prep.float_intens_coeff[idx] = fic
+
+        if self.smooth_gradient:
+            obg[:] = self.smooth_gradient(obg)
+
+        self.nsteps += 1
+        b1, b2, t = self.p.beta1, self.p.beta2, self.nsteps
+        decay = 1. / (1. + self.p.step_size_decay * self.curiter)
+        self._adam(ob, obg, self.ob_h.S[oID].data[box], self.ob_grad.S[oID].data[box],
+                   self.ob_step[oID] * decay, b1, b2, t)
+        if update_probe:
+            self.support_constraint(self.pr_grad_new.S[pID])
+            self._adam(pr, prg, self.pr_h.S[pID].data, self.pr_grad.S[pID].data,
+                       self.pr_step[pID] * decay, b1, b2, t, shared=True)
+
+    def engine_iterate(self, num=1):
+        """
+        Compute `num` iterations.
+        """
+        tg = 0.
+        for it in range(num):
+            t1 = time.time()
+            update_probe = self.p.probe_update_start <= self.curiter
+
+            dIDs = list(self.di.S.keys())
+            np.random.shuffle(dIDs)
+            for i, dID in enumerate(dIDs):
+                prep = self.diff_info[dID]
+
+                # read ahead the next block of out-of-core data
+                if i + 1 < len(dIDs):
+                    self._prefetch(dIDs[i + 1])
+
+                order = np.random.permutation(prep.addr.shape[0])
+                for k in range(0, len(order), self.p.batch_size):
+                    # sorted, such that out-of-core data is read in order
+                    idx = np.sort(order[k:k + self.p.batch_size])
+                    self._minibatch(prep, idx, update_probe)
+
+            tg += time.time() - t1
+
+            # errors of the frames at the time of their last update
+            LL = 0.
+            error_dct = {}
+            for dID, prep in self.diff_info.items():
+                err_phot = prep.err_phot
+                if prep.LLbase is not None:
+                    err_phot += prep.LLbase
+                LL += err_phot.sum()
+                err_phot /= np.prod(prep.weights.shape[-2:])
+                err_fourier = np.zeros_like(err_phot)
+                err_exit = np.zeros_like(err_phot)
+                errs = np.ascontiguousarray(np.vstack([err_fourier, err_phot, err_exit]).T)
+                error_dct.update(zip(prep.view_IDs, errs))
+            self.ML_model.LL = np.array([LL]) / self.ML_model.tot_measpts
+
+
+            # Refine the scan positions
+            self.position_update()
+
+            # Allow for customized modifications at the end of each iteration
+            self._post_iterate_update()
+
+            # increase iteration counter
+            self.curiter += 1
+
+        logger.info('Time spent in minibatch updates: %.2f' % tg)
+        return error_dct
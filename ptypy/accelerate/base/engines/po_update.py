@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Object and probe update settings shared by the serialized engines.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+from ptypy.accelerate.base.kernels import PoUpdateKernel
+
+__all__ = ['PoUpdateMixin']
+
+
+class PoUpdateMixin:
+    """
+    Defaults:
+
+    [scatter_po_update]
+    default = False
+    type = bool
+    help = Use a batched scatter-add instead of a loop over frames for object and probe updates
+    doc = This removes the Python overhead per frame and pays off for scans with many small frames (up to about 32x32 pixels), while the loop is faster for large frames. The result is identical to the loop version.
+    """
+
+    def _po_update_kernel(self):
+        """
+        New object/probe update kernel with the settings of the engine.
+        """
+        return PoUpdateKernel(scatter=self.p.scatter_po_update)
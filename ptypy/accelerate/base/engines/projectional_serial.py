@@ -9,14 +9,18 @@ This file is part of the PTYPY package.
 """
 import numpy as np
 import time
+import weakref
 
 from ptypy import utils as u
 from ptypy.utils.verbose import logger, log
 from ptypy.utils import parallel
 from ptypy.engines import register
 from ptypy.engines.projectional import _ProjectionEngine, DMMixin, RAARMixin
+from ptypy.core.classes import VIEW_PREFIX
 from ptypy.accelerate.base.kernels import FourierUpdateKernel, AuxiliaryWaveKernel, PoUpdateKernel, PositionCorrectionKernel
 from ptypy.accelerate.base import array_utils as au
+from .thread_pool import ThreadPoolMixin
+from .po_update import PoUpdateMixin
 
 
 ### TODOS
@@ -48,12 +52,58 @@ def gaussian_kernel(sigma, size=None, sigma_y=None, size_y=None):
     return g / g.sum()
 
 
+# Pod view roles in the order of the address array
+_ADDR_ROLES = ('pr_view', 'ob_view', 'ex_view', 'di_view', 'ma_view')
+
+# Table rows of the pod views per diffraction view, for each diffraction storage
+_pod_rows_cache = weakref.WeakKeyDictionary()
+
+
+def _pod_rows(view, tables, poe_ID):
+    """
+    Rows of the pod views of diffraction `view` in the view `tables`,
+    as a list of ``npods`` lists with 5 entries. Returns None if any
+    view record is not backed by its table.
+    """
+    rows = []
+    for pod in view.pods.values():
+        row = []
+        for role, table in zip(_ADDR_ROLES, tables):
+            v = getattr(pod, role)
+            if v._record.base is not table:
+                return None
+            row.append(v.numID)
+        rows.append(row)
+
+        for name, v, sID in zip(('probes', 'objects', 'exit stacks'),
+                                (pod.pr_view, pod.ob_view, pod.ex_view), poe_ID):
+            if v.storage.ID != sID:
+                log(1, "Splitting %s for one diffraction stack is not supported in %s" % (name, __name__))
+    return rows
+
+
 def serialize_array_access(diff_storage):
-    # Sort views according to layer in diffraction stack
+    """
+    Build the int32 address array for the active views of `diff_storage`,
+    sorted by layer in the diffraction stack. For each view and pod it
+    holds ``(dlayer, dlow[0], dlow[1])`` of the probe, object, exit,
+    diffraction and mask view, i.e. its shape is ``(nviews, npods, 5, 3)``.
+
+    The addresses are computed with array operations from the view tables
+    of the containers. The table rows of the pod views are cached per
+    storage, such that a new data chunk only requires a look-up of the
+    pods for the views of new frames.
+
+    Returns
+    -------
+    view_IDs : list
+        IDs of the views, sorted by layer.
+    poe_ID : tuple
+        IDs of the probe, object and exit storage.
+    addr : ndarray
+        The address array.
+    """
     views = diff_storage.views
-    dlayers = [view.dlayer for view in views]
-    views = [views[i] for i in np.argsort(dlayers)]
-    view_IDs = [view.ID for view in views]
 
     # Master pod
     mpod = views[0].pod
@@ -65,38 +115,131 @@ def serialize_array_access(diff_storage):
 
     poe_ID = (pr.ID, ob.ID, ex.ID)
 
+    # The tables are reallocated when they grow, the rows are stable
+    tables = [getattr(mpod, role).owner._recs[VIEW_PREFIX] for role in _ADDR_ROLES]
+
+    known = _pod_rows_cache.setdefault(diff_storage, {})
+    rows = []
+    for view in views:
+        r = known.get(view.ID)
+        if r is None:
+            r = _pod_rows(view, tables, poe_ID)
+            if r is None:
+                return _serialize_array_access_loop(views, poe_ID)
+            known[view.ID] = r
+        rows.append(r)
+    rows = np.array(rows)
+
+    # Sort views according to layer in diffraction stack
+    order = np.argsort(tables[3]['dlayer'][rows[:, 0, 3]], kind='stable')
+    rows = rows[order]
+    view_IDs = [views[i].ID for i in order]
+
+    addr = np.empty(rows.shape + (3,), dtype=np.int32)
+    for i, table in enumerate(tables):
+        r = rows[:, :, i]
+        addr[:, :, i, 0] = table['dlayer'][r]
+        addr[:, :, i, 1:] = table['dlow'][r, :2]
+
+    return view_IDs, poe_ID, addr
+
+
+def _serialize_array_access_loop(views, poe_ID):
+    """
+    Address array from the view attributes, for views whose records
+    are not backed by a view table (e.g. after loading from a file).
+    """
+    views = [views[i] for i in np.argsort([view.dlayer for view in views], kind='stable')]
+    view_IDs = [view.ID for view in views]
+
     addr = []
     for view in views:
         address = []
-
         for pname, pod in view.pods.items():
-            ## store them for each pod
-            # create addresses
-            a = np.array(
-                [(pod.pr_view.dlayer, pod.pr_view.dlow[0], pod.pr_view.dlow[1]),
-                 (pod.ob_view.dlayer, pod.ob_view.dlow[0], pod.ob_view.dlow[1]),
-                 (pod.ex_view.dlayer, pod.ex_view.dlow[0], pod.ex_view.dlow[1]),
-                 (pod.di_view.dlayer, pod.di_view.dlow[0], pod.di_view.dlow[1]),
-                 (pod.ma_view.dlayer, pod.ma_view.dlow[0], pod.ma_view.dlow[1])])
-
-            address.append(a)
-
-            if pod.pr_view.storage.ID != pr.ID:
-                log(1, "Splitting probes for one diffraction stack is not supported in " + __name__)
-            if pod.ob_view.storage.ID != ob.ID:
-                log(1, "Splitting objects for one diffraction stack is not supported in " + __name__)
-            if pod.ex_view.storage.ID != ex.ID:
-                log(1, "Splitting exit stacks for one diffraction stack is not supported in " + __name__)
-
-        ## store data for each view
-        # adresses
+            address.append([(getattr(pod, role).dlayer,
+                             getattr(pod, role).dlow[0],
+                             getattr(pod, role).dlow[1]) for role in _ADDR_ROLES])
         addr.append(address)
 
-    # store them for each storage
     return view_IDs, poe_ID, np.array(addr).astype(np.int32)
 
 
-class _ProjectionEngine_serial(_ProjectionEngine):
+def refine_positions_gradient(kern, prep, idx, ob, pr, I, w, error, curiter):
+    """
+    Gradient position refinement of the frames `idx` of a diffraction
+    block in one batched pass.
+
+    The shift of each frame is a Gauss-Newton step on the weighted squared
+    difference of model and measured intensities, with the derivative of
+    the model with respect to the position from the probe gradient. The
+    subpixel positions in ``prep.pos`` accumulate the steps, the addresses
+    follow their rounded values if this lowers the error of a frame.
+
+    Parameters
+    ----------
+    kern : Param
+        Kernels and buffers of the scan, with position correction kernel
+        and the additional buffer ``daux``.
+    prep : Param
+        Diffraction block info with ``addr``, ``pos`` and ``original_pos``.
+    idx : ndarray
+        Indices of the frames to refine, at most the size of the buffers.
+    I, w : ndarray
+        Measured intensities and weights of the frames `idx`.
+    error : callable
+        ``error(aux, addr, frames, err)`` writes the errors of the far
+        field waves in `aux` of the block frames `frames` with addresses
+        `addr` to `err`.
+    curiter : int
+        Current iteration, for the maximum step.
+    """
+    PCK = kern.PCK
+    aux = kern.aux
+    daux = kern.daux
+    FW = kern.FW
+
+    # Keep track of object boundaries
+    max_oby = ob.shape[-2] - aux.shape[-2] - 1
+    max_obx = ob.shape[-1] - aux.shape[-1] - 1
+
+    addr = prep.addr[idx]
+    err = np.zeros((len(idx),), dtype=np.float32)
+    shifts = np.zeros((len(idx), 2))
+
+    # current error and the change of the intensities with the position
+    PCK.build_aux(aux, addr, ob, pr)
+    aux[:] = FW(aux)
+    error(aux, addr, idx, err)
+    for axis, dpr in enumerate(PCK.probe_derivative(pr)):
+        PCK.build_aux(daux, addr, ob, dpr)
+        daux[:] = FW(daux)
+        PCK.intensity_derivative(aux, daux, addr, axis)
+    PCK.shift_estimate(aux, addr, I, w, shifts)
+
+    # The estimates are damped by the part of the position error the
+    # object has absorbed, hence the positions accumulate them over
+    # the iterations.
+    PCK.mangler.setup_shifts(curiter, nframes=len(idx))
+    pos = PCK.mangler.get_positions(prep.pos[idx], shifts, prep.original_pos[idx], max_oby, max_obx)
+
+    # frames that move to another pixel are only moved if the error drops
+    new_addr = addr.copy()
+    new_addr[:, :, 1, 1:] = np.round(pos).astype(addr.dtype)[:, None, :]
+    moved = np.nonzero((new_addr[:, 0, 1, 1:] != addr[:, 0, 1, 1:]).any(-1))[0]
+    if len(moved):
+        new_err = np.zeros((len(moved),), dtype=np.float32)
+        PCK.build_aux(aux, new_addr[moved], ob, pr)
+        aux[:] = FW(aux)
+        error(aux, new_addr[moved], idx[moved], new_err)
+        rejected = moved[new_err >= err[moved]]
+        pos[rejected] = prep.pos[idx[rejected]]
+        new_addr[rejected] = addr[rejected]
+
+    prep.pos[idx] = pos
+    prep.addr[idx] = new_addr
+
+
+class _ProjectionEngine_serial(_ProjectionEngine, ThreadPoolMixin, PoUpdateMixin):
     """
     A full-fledged Difference Map engine that uses numpy arrays instead of iteration.
 
@@ -108,6 +251,7 @@ class _ProjectionEngine_serial(_ProjectionEngine):
         """
 
         super().__init__(ptycho_parent, pars)
+        ThreadPoolMixin.__init__(self)
 
         ## gaussian filter
         # dummy kernel
@@ -133,6 +277,7 @@ class _ProjectionEngine_serial(_ProjectionEngine):
         """
 
         super().engine_initialize()
+        self._setup_thread_pool()
         self._reset_benchmarks()
         self._setup_kernels()
 
@@ -143,6 +288,10 @@ class _ProjectionEngine_serial(_ProjectionEngine):
         self.benchmark.D_iProp = 0.
         self.benchmark.E_Build_exit = 0.
         self.benchmark.F_LLerror = 0.
+        for kern in self.kernels.values():
+            for tk in kern.get('threads', []):
+                for name in tk.benchmark.keys():
+                    tk.benchmark[name] = 0.
         self.benchmark.probe_update = 0.
         self.benchmark.object_update = 0.
         self.benchmark.calls_fourier = 0
@@ -165,6 +314,8 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
             # Get info to shape buffer arrays
             fpc = scan.max_frames_per_block
+            if self.pool is not None:
+                fpc = self._thread_frames(fpc)
 
             # TODO : make this more foolproof
             try:
@@ -182,19 +333,41 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             kern.FUK = FourierUpdateKernel(aux, nmodes)
             kern.FUK.allocate()
 
-            kern.POK = PoUpdateKernel()
+            kern.POK = self._po_update_kernel()
             kern.POK.allocate()
 
             kern.AWK = AuxiliaryWaveKernel()
             kern.AWK.allocate()
 
-            kern.FW = geo.propagator.fw
-            kern.BW = geo.propagator.bw
+            kern.FW = geo.propagator.fw_inplace
+            kern.BW = geo.propagator.bw_inplace
             kern.resolution = geo.resolution[0]
 
+            # one set of kernels per worker thread, each on its own slice of aux
+            if self.pool is not None:
+                kern.threads = []
+                for i, taux in enumerate(self._split_aux(aux, nmodes)):
+                    tk = u.Param()
+                    tk.index = i
+                    tk.aux = taux
+                    tk.FUK = FourierUpdateKernel(taux, nmodes)
+                    tk.FUK.allocate()
+                    tk.POK = self._po_update_kernel()
+                    tk.AWK = AuxiliaryWaveKernel()
+                    tk.FW = kern.FW
+                    tk.BW = kern.BW
+                    tk.benchmark = u.Param()
+                    for name in 'ABCDEF':
+                        for bname in self.benchmark.keys():
+                            if bname.startswith(name):
+                                tk.benchmark[bname] = 0.
+                    kern.threads.append(tk)
+
             if self.do_position_refinement:
                 kern.PCK = PositionCorrectionKernel(aux, nmodes, self.p.position_refinement, geo.resolution)
                 kern.PCK.allocate()
+                if self.p.position_refinement.method == "Gradient":
+                    kern.daux = np.zeros_like(aux)
 
     def engine_prepare(self):
 
@@ -207,8 +380,16 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
             prep.label = label
             self.diff_info[d.ID] = prep
-            prep.mag = np.sqrt(np.abs(d.data))
-            prep.ma = self.ma.S[d.ID].data.astype(np.float32)
+            if d.backing is None:
+                prep.mag = np.sqrt(np.abs(d.data))
+                prep.ma = self.ma.S[d.ID].data.astype(np.float32)
+            else:
+                # Out-of-core data, keep magnitudes and mask on scratch as well
+                prep.mag = u.scratch_array(d.data.shape, d.data.dtype, d.backing)
+                prep.ma = u.scratch_array(d.data.shape, np.float32, d.backing)
+                for i in range(d.data.shape[0]):
+                    prep.mag[i] = np.sqrt(np.abs(d.data[i]))
+                    prep.ma[i] = self.ma.S[d.ID].data[i]
             # self.ma.S[d.ID].data = prep.ma
             prep.ma_sum = prep.ma.sum(-1).sum(-1)
             prep.err_phot = np.zeros_like(prep.ma_sum)
@@ -224,6 +405,10 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
+                # subpixel positions and the errors at their last refinement
+                prep.original_pos = prep.addr[:, 0, 1, 1:].astype(float)
+                prep.pos = prep.original_pos.copy()
+                prep.posref_err = np.full((prep.addr.shape[0],), np.nan)
             pID, oID, eID = prep.poe_IDs
 
             # calculate c_facts
@@ -234,6 +419,61 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             cfact = self.p.probe_inertia * len(pr.views) / pr.data.shape[0]
             self.pr_cfact[pID] = cfact / u.parallel.size
 
+    def _prefetch(self, dID):
+        """
+        Read ahead the out-of-core data of block `dID`.
+        """
+        prep = self.diff_info[dID]
+        u.prefetch(prep.mag)
+        u.prefetch(prep.ma)
+
+    def _fourier_update_block(self, kern, addr, mag, ma, ma_sum, err_phot,
+                              err_fourier, err_exit, pbound, ob, pr, ex, bench):
+        """
+        Fourier update of a stack of frames with the kernels and the aux
+        buffer in `kern`. Timings are accumulated in `bench`.
+        """
+        FUK = kern.FUK
+        AWK = kern.AWK
+        FW = kern.FW
+        BW = kern.BW
+        aux = kern.aux
+
+        ## compute log-likelihood
+        if self.p.compute_log_likelihood:
+            t1 = time.time()
+            AWK.build_aux_no_ex(aux, addr, ob, pr)
+            aux[:] = FW(aux)
+            FUK.log_likelihood(aux, addr, mag, ma, err_phot)
+            bench.F_LLerror += time.time() - t1
+
+        ## build auxilliary wave
+        t1 = time.time()
+        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
+        bench.A_Build_aux += time.time() - t1
+
+        ## forward FFT
+        t1 = time.time()
+        aux[:] = FW(aux)
+        bench.B_Prop += time.time() - t1
+
+        ## Deviation from measured data
+        t1 = time.time()
+        FUK.fourier_update(aux, addr, mag, ma, ma_sum, err_fourier, pbound)
+        bench.C_Fourier_update += time.time() - t1
+
+        ## backward FFT
+        t1 = time.time()
+        aux[:] = BW(aux)
+        bench.D_iProp += time.time() - t1
+
+        ## build exit wave
+        t1 = time.time()
+        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+        FUK.exit_error(aux,addr)
+        FUK.error_reduce(addr, err_exit)
+        bench.E_Build_exit += time.time() - t1
+
     def engine_iterate(self, num=1):
         """
         Compute one iteration.
@@ -243,18 +483,19 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
             error = {}
 
-            for dID in self.di.S.keys():
+            dIDs = list(self.di.S.keys())
+            for i, dID in enumerate(dIDs):
 
                 # find probe, object and exit ID in dependence of dID
                 prep = self.diff_info[dID]
                 pID, oID, eID = prep.poe_IDs
 
+                # read ahead the next block of out-of-core data
+                if i + 1 < len(dIDs):
+                    self._prefetch(dIDs[i + 1])
+
                 # references for kernels
                 kern = self.kernels[prep.label]
-                FUK = kern.FUK
-                AWK = kern.AWK
-                FW = kern.FW
-                BW = kern.BW
 
                 # get addresses and buffers
                 addr = prep.addr
@@ -264,7 +505,6 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 err_fourier = prep.err_fourier
                 err_exit = prep.err_exit
                 pbound = self.pbound_scan[prep.label]
-                aux = kern.aux
 
                 # local references
                 ma = prep.ma
@@ -272,42 +512,16 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 pr = self.pr.S[pID].data
                 ex = self.ex.S[eID].data
 
-                ## compute log-likelihood
-                if self.p.compute_log_likelihood:
-                    t1 = time.time()
-                    AWK.build_aux_no_ex(aux, addr, ob, pr)
-                    aux[:] = FW(aux)
-                    FUK.log_likelihood(aux, addr, mag, ma, err_phot)
-                    self.benchmark.F_LLerror += time.time() - t1
-
-                ## build auxilliary wave
-                t1 = time.time()
-                AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
-                self.benchmark.A_Build_aux += time.time() - t1
-
-                ## forward FFT
-                t1 = time.time()
-                aux[:] = FW(aux)
-                self.benchmark.B_Prop += time.time() - t1
-
-                ## Deviation from measured data
-                t1 = time.time()
-                FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                FUK.error_reduce(addr, err_fourier)
-                FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
-                self.benchmark.C_Fourier_update += time.time() - t1
-
-                ## backward FFT
-                t1 = time.time()
-                aux[:] = BW(aux)
-                self.benchmark.D_iProp += time.time() - t1
-
-                ## build exit wave
-                t1 = time.time()
-                AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
-                FUK.exit_error(aux,addr)
-                FUK.error_reduce(addr, err_exit)
-                self.benchmark.E_Build_exit += time.time() - t1
+                if self.pool is None:
+                    self._fourier_update_block(kern, addr, mag, ma, ma_sum, err_phot,
+                                               err_fourier, err_exit, pbound, ob, pr, ex,
+                                               self.benchmark)
+                else:
+                    self._map_frames(kern.threads, addr.shape[0],
+                        lambda tk, sl: self._fourier_update_block(
+                            tk, addr[sl], mag[sl], ma[sl], ma_sum[sl], err_phot[sl],
+                            err_fourier[sl], err_exit[sl], pbound, ob, pr, ex,
+                            tk.benchmark))
 
                 # update errors
                 errs = np.ascontiguousarray(np.vstack([err_fourier, err_phot, err_exit]).T)
@@ -366,6 +580,10 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 PCK = kern.PCK
                 FW = kern.FW
 
+                if self.p.position_refinement.method == "Gradient":
+                    self._position_update_gradient(prep, kern, ob, pr)
+                    continue
+
                 # Keep track of object boundaries
                 max_oby = ob.shape[-2] - aux.shape[-2] - 1
                 max_obx = ob.shape[-1] - aux.shape[-1] - 1
@@ -397,6 +615,35 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 prep.err_fourier = error_state
                 prep.addr = addr
 
+    def _position_update_gradient(self, prep, kern, ob, pr):
+        """
+        Gradient position refinement of the frames of a block whose
+        Fourier error changed since their last refinement.
+        """
+        tol = self.p.position_refinement.tolerance
+        err_fourier = prep.err_fourier
+        changed = ~(np.abs(err_fourier - prep.posref_err) <= tol * np.abs(prep.posref_err))
+        idx = np.nonzero(changed)[0]
+        if not len(idx):
+            return
+        prep.posref_err[idx] = err_fourier[idx]
+
+        PCK = kern.PCK
+        mag = prep.mag
+        ma = prep.ma
+        ma_sum = prep.ma_sum
+
+        def error(aux, addr, frames, err):
+            if self.p.position_refinement.metric == "fourier":
+                PCK.fourier_error(aux, addr, mag[frames], ma[frames], ma_sum[frames])
+                PCK.error_reduce(addr, err)
+            if self.p.position_refinement.metric == "photon":
+                PCK.log_likelihood(aux, addr, mag[frames], ma[frames], err)
+
+        log(4, 'Position refinement (gradient): iteration %s, %d frames' % (self.curiter, len(idx)))
+        I = mag[idx] ** 2
+        refine_positions_gradient(kern, prep, idx, ob, pr, I, ma[idx] / (I + 1.), error, self.curiter)
+
 
     def overlap_update(self, MPI=True):
         """
@@ -443,30 +690,49 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
             obn.data[:] = cfact
 
+        # per-thread accumulation buffers
+        if self.pool is not None:
+            ob_acc = self._accumulators(self.ob)
+            obn_acc = self._accumulators(self.ob_nrm)
+
         # storage for-loop
         for dID in self.di.S.keys():
             prep = self.diff_info[dID]
 
-            POK = self.kernels[prep.label].POK
+            kern = self.kernels[prep.label]
+            POK = kern.POK
             # find probe, object in exit ID in dependence of dID
             pID, oID, eID = prep.poe_IDs
 
-            # scan for loop
-            ev = POK.ob_update(prep.addr,
-                               self.ob.S[oID].data,
-                               self.ob_nrm.S[oID].data,
-                               self.pr.S[pID].data,
-                               self.ex.S[eID].data)
+            if self.pool is not None:
+                addr = prep.addr
+                pr = self.pr.S[pID].data
+                ex = self.ex.S[eID].data
+                self._map_frames(kern.threads, addr.shape[0],
+                    lambda tk, sl: tk.POK.ob_update(addr[sl],
+                                                    ob_acc[oID][tk.index],
+                                                    obn_acc[oID][tk.index],
+                                                    pr, ex))
+            else:
+                # scan for loop
+                ev = POK.ob_update(prep.addr,
+                                   self.ob.S[oID].data,
+                                   self.ob_nrm.S[oID].data,
+                                   self.pr.S[pID].data,
+                                   self.ex.S[eID].data)
+
+        if self.pool is not None:
+            self._reduce_accumulators(ob_acc)
+            self._reduce_accumulators(obn_acc)
+
+        # MPI reduction, started for all storages at once
+        requests = self._reduce_storages(self.ob, self.ob_nrm, 1) if MPI else {}
 
         for oID, ob in self.ob.storages.items():
             obn = self.ob_nrm.S[oID]
-            # MPI test
             if MPI:
-                parallel.allreduce(ob.data)
-                parallel.allreduce(obn.data)
-                ob.data /= obn.data
-            else:
-                ob.data /= obn.data
+                requests[oID].wait()
+            ob.data /= obn.data
 
             # Clip object (This call takes like one ms. Not time critical)
             if self.p.clip_object is not None:
@@ -494,36 +760,54 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             pr.data *= cfact
             prn.data.fill(cfact)
 
+        # per-thread accumulation buffers
+        if self.pool is not None:
+            pr_acc = self._accumulators(self.pr)
+            prn_acc = self._accumulators(self.pr_nrm)
+
         for dID in self.di.S.keys():
             prep = self.diff_info[dID]
 
-            POK = self.kernels[prep.label].POK
+            kern = self.kernels[prep.label]
+            POK = kern.POK
             # find probe, object in exit ID in dependence of dID
             pID, oID, eID = prep.poe_IDs
 
-            # scan for-loop
-            ev = POK.pr_update(prep.addr,
-                               self.pr.S[pID].data,
-                               self.pr_nrm.S[pID].data,
-                               self.ob.S[oID].data,
-                               self.ex.S[eID].data)
+            if self.pool is not None:
+                addr = prep.addr
+                ob = self.ob.S[oID].data
+                ex = self.ex.S[eID].data
+                self._map_frames(kern.threads, addr.shape[0],
+                    lambda tk, sl: tk.POK.pr_update(addr[sl],
+                                                    pr_acc[pID][tk.index],
+                                                    prn_acc[pID][tk.index],
+                                                    ob, ex))
+            else:
+                # scan for-loop
+                ev = POK.pr_update(prep.addr,
+                                   self.pr.S[pID].data,
+                                   self.pr_nrm.S[pID].data,
+                                   self.ob.S[oID].data,
+                                   self.ex.S[eID].data)
 
             self.benchmark.probe_update += time.time() - t1
             self.benchmark.calls_probe += 1
 
+        if self.pool is not None:
+            self._reduce_accumulators(pr_acc)
+            self._reduce_accumulators(prn_acc)
+
+        # MPI reduction, started for all storages at once
+        requests = self._reduce_storages(self.pr, self.pr_nrm, 0) if MPI else {}
+
         for pID, pr in self.pr.storages.items():
 
             buf = self.pr_buf.S[pID]
             prn = self.pr_nrm.S[pID]
 
-            # MPI test
             if MPI:
-                # if False:
-                parallel.allreduce(pr.data)
-                parallel.allreduce(prn.data)
-                pr.data /= prn.data
-            else:
-                pr.data /= prn.data
+                requests[pID].wait()
+            pr.data /= prn.data
 
             self.support_constraint(pr)
 
@@ -534,10 +818,56 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
         return np.sqrt(change)
 
+    def _reduce_storages(self, container, nrm, col):
+        """
+        Start the MPI sum of all storages of `container` and `nrm`, with
+        the reduce_region, reduce_nonblocking and reduce_fused options
+        of the projectional engines. `col` is the address column of the
+        container (0: probe, 1: object). Returns the requests per storage.
+        """
+        regions = self._addr_regions(container, col) if self.p.reduce_region else {}
+        return {ID: self._reduce(s, nrm.S[ID], regions.get(ID))
+                for ID, s in container.storages.items()}
+
+    def _addr_regions(self, container, col):
+        """
+        Bounding box of the frames in address column `col` across all
+        processes, as a tuple of slices for each storage in `container`.
+        """
+        names = list(container.storages.keys())
+        low = np.full((len(names), 2), np.iinfo(np.int64).max, dtype=np.int64)
+        high = np.full((len(names), 2), np.iinfo(np.int64).min, dtype=np.int64)
+        for prep in self.diff_info.values():
+            i = names.index(prep.poe_IDs[col])
+            if not len(prep.addr):
+                continue
+            sh = self.kernels[prep.label].aux.shape[-2:]
+            pos = prep.addr[:, :, col, 1:].reshape(-1, 2)
+            low[i] = np.minimum(low[i], pos.min(0))
+            high[i] = np.maximum(high[i], pos.max(0) + sh)
+        if parallel.MPIenabled:
+            parallel.allreduce(low, parallel.MPI.MIN)
+            parallel.allreduce(high, parallel.MPI.MAX)
+
+        regions = {}
+        for i, name in enumerate(names):
+            shape = container.storages[name].shape[1:]
+            lo = np.clip(low[i], 0, shape)
+            hi = np.clip(high[i], lo, shape)
+            regions[name] = (slice(None),) + tuple(slice(a, b) for a, b in zip(lo, hi))
+        return regions
+
     def engine_finalize(self, benchmark=True):
         """
         try deleting ever helper contianer
         """
+        # fold in the per-thread timings, averaged over threads
+        for kern in self.kernels.values():
+            threads = kern.get('threads', [])
+            for tk in threads:
+                for name, t in tk.benchmark.items():
+                    self.benchmark[name] += t / len(threads)
+
         if parallel.master and benchmark:
             print("----- BENCHMARKS ----")
             acc = 0.
@@ -564,11 +894,15 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 res = self.kernels[prep.label].resolution
                 for i,view in enumerate(d.views):
                     for j,(pname, pod) in enumerate(view.pods.items()):
-                        delta = (prep.addr[i][j][1][1:] - prep.original_addr[i][j][1][1:]) * res
+                        if self.p.position_refinement.method == "Gradient":
+                            delta = (prep.pos[i] - prep.original_pos[i]) * res
+                        else:
+                            delta = (prep.addr[i][j][1][1:] - prep.original_addr[i][j][1][1:]) * res
                         pod.ob_view.coord += delta
                         pod.ob_view.storage.update_views(pod.ob_view)
             self.ptycho.record_positions = True
 
+        self._close_thread_pool()
         super().engine_finalize()
 
 
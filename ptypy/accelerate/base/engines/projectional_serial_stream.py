@@ -41,6 +41,39 @@ class DM_serial_stream(DM_serial):
     """
     A full-fledged Difference Map engine that uses numpy arrays instead of iteration.
     """
+    def _fourier_update_block_stream(self, kern, addr, mag, ma, ma_sum, err_fourier, pbound, ob, pr, ex, bench):
+        """
+        Fourier update of a stack of frames with the kernels and the aux
+        buffer in `kern`. Timings are accumulated in `bench`.
+        """
+        FUK = kern.FUK
+        AWK = kern.AWK
+        aux = kern.aux
+
+        ## build auxilliary wave
+        t1 = time.time()
+        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
+        bench.A_Build_aux += time.time() - t1
+
+        ## FFT
+        t1 = time.time()
+        aux[:] = kern.FW(aux)
+        bench.B_Prop += time.time() - t1
+
+        ## Deviation from measured data
+        t1 = time.time()
+        FUK.fourier_update(aux, addr, mag, ma, ma_sum, err_fourier, pbound)
+        bench.C_Fourier_update += time.time() - t1
+
+        t1 = time.time()
+        aux[:] = kern.BW(aux)
+        bench.D_iProp += time.time() - t1
+
+        ## apply changes #2
+        t1 = time.time()
+        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+        bench.E_Build_exit += time.time() - t1
+
     def engine_iterate(self, num=1):
         """
         Compute one iteration.
@@ -60,6 +93,10 @@ class DM_serial_stream(DM_serial):
 
                 # initialize probe and object buffer to receive an update
                 if do_update_object:
+                    # per-thread accumulation buffers
+                    if self.pool is not None:
+                        obb_acc = self._accumulators(self.ob_buf)
+                        obn_acc = self._accumulators(self.ob_nrm)
                     for oID, ob in self.ob.storages.items():
                         cfact = self.ob_cfact[oID]
                         obn = self.ob_nrm.S[oID]
@@ -89,14 +126,9 @@ class DM_serial_stream(DM_serial):
 
                     # references for kernels
                     kern = self.kernels[prep.label]
-                    FUK = kern.FUK
-                    AWK = kern.AWK
                     POK = kern.POK
 
                     pbound = self.pbound_scan[prep.label]
-                    aux = kern.aux
-                    FW = kern.FW
-                    BW = kern.BW
 
                     # get addresses and auxilliary array
                     addr = prep.addr
@@ -115,30 +147,15 @@ class DM_serial_stream(DM_serial):
                     # Fourier update.
                     if do_update_fourier:
                         log(4, '----- Fourier update -----', True)
-                        t1 = time.time()
-                        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
-                        self.benchmark.A_Build_aux += time.time() - t1
-
-                        ## FFT
-                        t1 = time.time()
-                        aux[:] = FW(aux)
-                        self.benchmark.B_Prop += time.time() - t1
-
-                        ## Deviation from measured data
-                        t1 = time.time()
-                        FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                        FUK.error_reduce(addr, err_fourier)
-                        FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
-                        self.benchmark.C_Fourier_update += time.time() - t1
-
-                        t1 = time.time()
-                        aux[:] = BW(aux)
-                        self.benchmark.D_iProp += time.time() - t1
-
-                        ## apply changes #2
-                        t1 = time.time()
-                        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
-                        self.benchmark.E_Build_exit += time.time() - t1
+                        if self.pool is not None:
+                            self._map_frames(kern.threads, addr.shape[0],
+                                lambda tk, sl: self._fourier_update_block_stream(
+                                    tk, addr[sl], mag[sl], ma[sl], ma_sum[sl],
+                                    err_fourier[sl], pbound, ob, pr, ex, tk.benchmark))
+                        else:
+                            self._fourier_update_block_stream(kern, addr, mag, ma, ma_sum,
+                                                              err_fourier, pbound, ob, pr, ex,
+                                                              self.benchmark)
 
                         err_phot = np.zeros_like(err_fourier)
                         err_exit = np.zeros_like(err_fourier)
@@ -157,23 +174,31 @@ class DM_serial_stream(DM_serial):
                         log(4, prestr + '----- object update -----', True)
                         t1 = time.time()
 
-                        # scan for loop
-                        ev = POK.ob_update(addr, obb, obn, pr, ex)
+                        if self.pool is not None:
+                            self._map_frames(kern.threads, addr.shape[0],
+                                lambda tk, sl: tk.POK.ob_update(addr[sl],
+                                                                obb_acc[oID][tk.index],
+                                                                obn_acc[oID][tk.index],
+                                                                pr, ex))
+                        else:
+                            # scan for loop
+                            ev = POK.ob_update(addr, obb, obn, pr, ex)
 
                         self.benchmark.object_update += time.time() - t1
                         self.benchmark.calls_object += 1
 
                 if do_update_object:
+                    if self.pool is not None:
+                        self._reduce_accumulators(obb_acc)
+                        self._reduce_accumulators(obn_acc)
+                    # MPI reduction, started for all storages at once
+                    requests = self._reduce_storages(self.ob_buf, self.ob_nrm, 1) if MPI else {}
                     for oID, ob in self.ob.storages.items():
                         obn = self.ob_nrm.S[oID]
                         obb = self.ob_buf.S[oID]
-                        # MPI test
                         if MPI:
-                            parallel.allreduce(obb.data)
-                            parallel.allreduce(obn.data)
-                            obb.data /= obn.data
-                        else:
-                            obb.data /= obn.data
+                            requests[oID].wait()
+                        obb.data /= obn.data
 
                         self.clip_object(obb)
                         ob.data[:] = obb.data
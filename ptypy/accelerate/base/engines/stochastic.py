@@ -20,11 +20,12 @@ from ptypy.engines.stochastic import _StochasticEngine, EPIEMixin, SDRMixin
 from ptypy.accelerate.base.engines import projectional_serial
 from ptypy.accelerate.base.kernels import FourierUpdateKernel, AuxiliaryWaveKernel, PoUpdateKernel, PositionCorrectionKernel
 from ptypy.accelerate.base import address_manglers
+from ptypy.accelerate.base.engines.po_update import PoUpdateMixin
 from ptypy.accelerate.base import array_utils as au
 
 __all__ = ["EPIE_serial", "SDR_serial"]
 
-class _StochasticEngineSerial(_StochasticEngine):
+class _StochasticEngineSerial(_StochasticEngine, PoUpdateMixin):
     """
     A serialized base implementation of a stochastic algorithm for ptychography
 
@@ -112,14 +113,14 @@ class _StochasticEngineSerial(_StochasticEngine):
             kern.FUK = FourierUpdateKernel(aux, nmodes)
             kern.FUK.allocate()
 
-            kern.POK = PoUpdateKernel()
+            kern.POK = self._po_update_kernel()
             kern.POK.allocate()
 
             kern.AWK = AuxiliaryWaveKernel()
             kern.AWK.allocate()
 
-            kern.FW = geo.propagator.fw
-            kern.BW = geo.propagator.bw
+            kern.FW = geo.propagator.fw_inplace
+            kern.BW = geo.propagator.bw_inplace
             kern.resolution = geo.resolution[0]
 
             if self.do_position_refinement:
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Thread pool execution for the serialized engines.
+
+The frames of each block are split into contiguous ranges, one per
+worker thread. NumPy and the FFT libraries release the GIL for large
+array operations, so the threads run concurrently on the frame stacks.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['ThreadPoolMixin']
+
+
+class ThreadPoolMixin:
+    """
+    Defaults:
+
+    [numthreads]
+    default = 1
+    type = int
+    lowlim = 1
+    help = Number of worker threads the frames of each block are distributed over
+    doc = With more than one thread, every thread gets its own set of kernels and a slice of the aux buffer. Object and probe updates are accumulated in one buffer per thread and summed before the MPI reduction, which costs one additional copy of object and probe per extra thread.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self._acc_buffers = {}
+
+    def _setup_thread_pool(self):
+        """
+        Create the worker pool, if more than one thread is requested.
+        """
+        self._close_thread_pool()
+        if self.p.numthreads > 1:
+            self.pool = ThreadPoolExecutor(self.p.numthreads)
+
+    def _close_thread_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.pool = None
+        self._acc_buffers = {}
+
+    def _thread_frames(self, fpc):
+        """
+        Number of frames to allocate buffers for, such that the buffer
+        can be split into equal slices, one per thread.
+        """
+        n = self.p.numthreads
+        return -(-fpc // n) * n
+
+    def _split_aux(self, aux, nmodes):
+        """
+        Views on `aux`, one per thread, each large enough for the
+        frame range `_map_frames` assigns to the thread.
+        """
+        n = self.p.numthreads
+        chunk = aux.shape[0] // n
+        return [aux[i * chunk:(i + 1) * chunk] for i in range(n)]
+
+    def _map_frames(self, threads, nframes, func):
+        """
+        Split `nframes` into contiguous ranges and call
+        ``func(thread_kernels, slice)`` for each in the pool.
+        """
+        bounds = np.linspace(0, nframes, len(threads) + 1).astype(int)
+        futures = [self.pool.submit(func, tk, slice(bounds[i], bounds[i + 1]))
+                   for i, tk in enumerate(threads)]
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def _local_exit_addr(addr):
+        """
+        Copy of `addr` with the exit wave layers renumbered, for kernels
+        that use a thread's slice of the aux buffer as exit waves.
+        """
+        addr = addr.copy()
+        addr[:, :, 2, 0] = np.arange(addr.shape[0] * addr.shape[1]).reshape(addr.shape[:2])
+        return addr
+
+    def _accumulators(self, container):
+        """
+        One zeroed accumulation buffer per thread for each storage in
+        `container`. The first thread accumulates into the storage itself.
+        """
+        acc = {}
+        for ID, s in container.storages.items():
+            key = (container.ID, ID)
+            bufs = self._acc_buffers.get(key)
+            if bufs is None or bufs[0].shape != s.data.shape:
+                bufs = [np.zeros_like(s.data) for i in range(self.p.numthreads - 1)]
+                self._acc_buffers[key] = bufs
+            else:
+                for b in bufs:
+                    b.fill(0)
+            acc[ID] = [s.data] + bufs
+        return acc
+
+    @staticmethod
+    def _reduce_accumulators(acc):
+        """
+        Sum the thread buffers into the storages.
+        """
+        for bufs in acc.values():
+            for b in bufs[1:]:
+                bufs[0] += b
@@ -22,6 +22,9 @@ class BaseKernel(object):
 
 class FourierUpdateKernel(BaseKernel):
 
+    # Pixels per step of the fused fourier_update
+    FUSED_CHUNK_PIXELS = 1 << 16
+
     def __init__(self, aux, nmodes=1):
 
         super(FourierUpdateKernel, self).__init__()
@@ -33,6 +36,11 @@ class FourierUpdateKernel(BaseKernel):
         # temporary buffer arrays
         self.npy.fdev = None
         self.npy.ferr = None
+        self.npy.fscratch = None
+
+        # Frames per step of the fused fourier_update, such that its
+        # scratch buffers stay in cache
+        self.fchunk = max(1, self.FUSED_CHUNK_PIXELS // (ash[1] * ash[2]))
 
         self.kernels = [
             'fourier_error',
@@ -48,6 +56,60 @@ class FourierUpdateKernel(BaseKernel):
         # temporary buffer arrays
         self.npy.fdev = np.zeros(self.fshape, dtype=np.float32)
         self.npy.ferr = np.zeros(self.fshape, dtype=np.float32)
+        self.npy.fscratch = np.zeros((3, self.fchunk) + self.fshape[1:], dtype=np.float32)
+
+    def fourier_update(self, b_aux, addr, mag, mask, mask_sum, err_sum, pbound=0.0):
+        """
+        Fused version of `fourier_error`, `error_reduce` and
+        `fmag_all_update`. The stack is processed in chunks of frames,
+        with all intermediate results in preallocated scratch buffers,
+        such that `aux` is read and written only once. Unlike the
+        separate kernels, this does not fill the `fdev` and `ferr` buffers.
+        """
+        nmodes = self.nmodes
+        maxz = mag.shape[0]
+        tf = b_aux[:maxz * nmodes].reshape((maxz, nmodes) + self.fshape[1:])
+        scratch = self.npy.fscratch
+
+        for start in range(0, maxz, self.fchunk):
+            stop = min(start + self.fchunk, maxz)
+            n = stop - start
+            t = tf[start:stop]
+            af, fdev, tmp = scratch[0, :n], scratch[1, :n], scratch[2, :n]
+            fmag = mag[start:stop]
+            fmask = mask[start:stop]
+
+            # Modal sum of the far field intensities
+            np.abs(t[:, 0], out=af)
+            np.multiply(af, af, out=af)
+            for m in range(1, nmodes):
+                np.abs(t[:, m], out=tmp)
+                np.multiply(tmp, tmp, out=tmp)
+                af += tmp
+            np.sqrt(af, out=af)
+
+            # Deviation from the measured magnitudes and its masked sum
+            np.subtract(af, fmag, out=fdev)
+            np.multiply(fdev, fdev, out=tmp)
+            tmp *= fmask
+            err = tmp.sum(-1).sum(-1) / mask_sum[start:stop]
+            err_sum[start:stop] = err
+
+            # Renormalisation, see fmag_all_update
+            renorm = np.ones((n,), np.float32)
+            ind = err > pbound
+            renorm[ind] = np.sqrt(pbound / err[ind])
+
+            # fm = (1 - mask) + mask * (mag + fdev * renorm) / (af + denom)
+            fdev *= renorm.reshape((n, 1, 1))
+            fdev += fmag
+            af += self.denom
+            fdev /= af
+            fdev -= 1
+            fdev *= fmask
+            fdev += 1
+            t *= fdev[:, np.newaxis]
+        return
 
     def fourier_error(self, b_aux, addr, mag, mask, mask_sum):
         # reference shape (write-to shape)
@@ -241,7 +303,12 @@ class GradientDescentKernel(BaseKernel):
             'make_a012',
             'fill_b',
             'main',
-            'floating_intensity'
+            'floating_intensity',
+            'floating_intensity_sum',
+            'main_poisson',
+            'main_euclid',
+            'fill_b_poisson',
+            'fill_b_euclid'
         ]
 
     def allocate(self):
@@ -382,6 +449,112 @@ class GradientDescentKernel(BaseKernel):
         aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * tmp[:, np.newaxis, :, :]).reshape(ish)
         return
 
+    def floating_intensity_sum(self, addr, I, fic):
+        """
+        Floating intensity coefficients as ratio of measured and model
+        counts (Poisson and Euclid models).
+        """
+        # stopper
+        maxz = fic.shape[0]
+
+        # internal buffers
+        Imodel = self.npy.Imodel[:maxz]
+
+        ## math ##
+        fic[:] = I.sum(-1).sum(-1) / Imodel.sum(-1).sum(-1)
+        Imodel *= fic.reshape(Imodel.shape[0], 1, 1)
+
+    def main_poisson(self, b_aux, addr, w, I):
+
+        nmodes = self.nmodes
+        # stopper
+        maxz = I.shape[0]
+
+        # batch buffers
+        err = self.npy.LLerr[:maxz]
+        Imodel = self.npy.Imodel[:maxz]
+        aux = b_aux[:maxz*nmodes]
+
+        # write-to shape  (= GPU global dims)
+        ish = aux.shape
+
+        ## math ##
+        # w is the mask, the constant log(I!) is left to the caller
+        Im = np.double(Imodel) + 1e-6
+        err[:] = w * (Im - I * np.log(Im))
+        tmp = w * (1. - I / Im)
+
+        aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * tmp[:, np.newaxis, :, :]).reshape(ish)
+        return
+
+    def main_euclid(self, b_aux, addr, w, I):
+
+        nmodes = self.nmodes
+        # stopper
+        maxz = I.shape[0]
+
+        # batch buffers
+        err = self.npy.LLerr[:maxz]
+        Imodel = self.npy.Imodel[:maxz]
+        aux = b_aux[:maxz*nmodes]
+
+        # write-to shape  (= GPU global dims)
+        ish = aux.shape
+
+        ## math ##
+        A = np.sqrt(np.double(Imodel))
+        DA = A - np.sqrt(I)
+        err[:] = w * DA**2
+        tmp = w * DA / (A + self.denom)
+
+        aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * tmp[:, np.newaxis, :, :]).reshape(ish)
+        return
+
+    def fill_b_poisson(self, addr, Brenorm, w, I, B):
+        """
+        Like `fill_b`, but for the Poisson model with mask `w`. The
+        constant log(I!) is left to the caller.
+        """
+        # stopper
+        maxz = w.shape[0]
+
+        # A0 of make_a012 is the model minus the intensities
+        A0 = np.double(self.npy.Imodel[:maxz]) + I + 1e-6
+        A1 = self.npy.LLerr[:maxz]
+        A2 = self.npy.LLden[:maxz]
+
+        ## Actual math ##
+        DI = 1. - I / A0
+
+        B[0] += np.dot(w.flat, (A0 - I * np.log(A0)).flat) * Brenorm
+        B[1] += np.dot(w.flat, (A1 * DI).flat) * Brenorm
+        B[2] += (np.dot(w.flat, (A2 * DI).flat) + .5 * np.dot(w.flat, (I * (A1 / A0)**2).flat)) * Brenorm
+        return
+
+    def fill_b_euclid(self, addr, Brenorm, w, I, B):
+        """
+        Like `fill_b`, but for the Euclid model with mask `w`. The model
+        amplitudes along the line are expanded to second order.
+        """
+        # stopper
+        maxz = w.shape[0]
+
+        # A0 of make_a012 is the model minus the intensities
+        A0 = np.double(self.npy.Imodel[:maxz]) + I
+        A1 = self.npy.LLerr[:maxz]
+        A2 = self.npy.LLden[:maxz]
+
+        ## Actual math ##
+        A = np.sqrt(A0)
+        a0 = A - np.sqrt(I)
+        a1 = A1 / (2 * A + self.denom)
+        a2 = A2 / (2 * A + self.denom) - A1**2 / (8 * A0 * A + self.denom)
+
+        B[0] += np.dot(w.flat, (a0 ** 2).flat) * Brenorm
+        B[1] += np.dot(w.flat, (2 * a0 * a1).flat) * Brenorm
+        B[2] += np.dot(w.flat, (a1 ** 2 + 2 * a0 * a2).flat) * Brenorm
+        return
+
 
 class AuxiliaryWaveKernel(BaseKernel):
 
@@ -545,11 +718,35 @@ class AuxiliaryWaveKernel(BaseKernel):
                 aux[ind, :, :] = tmp
         return
 
+def _flat(A):
+    """
+    Flat view of a C-contiguous array. Raises rather than silently
+    returning a copy, since we scatter into the result.
+    """
+    flat = A.view()
+    flat.shape = (A.size,)
+    return flat
+
+
+def _window_index(coords, shape, rows, cols):
+    """
+    Flat indices of the (rows, cols) windows starting at `coords`
+    (layer, y, x) in an array of `shape`, one row per window.
+    """
+    base = (coords[:, 0].astype(np.intp) * shape[-2] + coords[:, 1]) * shape[-1] + coords[:, 2]
+    offsets = (np.arange(rows)[:, None] * shape[-1] + np.arange(cols)).ravel()
+    return base[:, None] + offsets
+
+
 class PoUpdateKernel(BaseKernel):
 
-    def __init__(self):
+    def __init__(self, scatter=False):
 
         super(PoUpdateKernel, self).__init__()
+        # batched scatter-add instead of one slice-add per frame
+        self.scatter = scatter
+        # max number of elements per scatter batch (bounds index memory)
+        self.scatter_chunk = 2 ** 22
         self.kernels = [
             'pr_update',
             'ob_update',
@@ -558,11 +755,22 @@ class PoUpdateKernel(BaseKernel):
     def allocate(self):
         pass
 
+    def _chunks(self, flat_addr, rows, cols):
+        """
+        Yields (start, stop) row ranges of `flat_addr` so that each batch
+        holds at most `scatter_chunk` elements.
+        """
+        step = max(1, self.scatter_chunk // (rows * cols))
+        for start in range(0, flat_addr.shape[0], step):
+            yield start, min(start + step, flat_addr.shape[0])
+
     def ob_update(self, addr, ob, obn, pr, ex):
 
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.scatter:
+            return self._ob_update_scatter(flat_addr, ob, obn, pr, ex, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] += \
                 pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols].conj() * \
@@ -577,6 +785,8 @@ class PoUpdateKernel(BaseKernel):
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.scatter:
+            return self._pr_update_scatter(flat_addr, pr, prn, ob, ex, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols] += \
                 ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols].conj() * \
@@ -591,6 +801,8 @@ class PoUpdateKernel(BaseKernel):
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.scatter:
+            return self._update_ML_scatter(flat_addr, 1, 0, ob, pr, ex, fac, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] += \
                 pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols].conj() * \
@@ -602,6 +814,8 @@ class PoUpdateKernel(BaseKernel):
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.scatter:
+            return self._update_ML_scatter(flat_addr, 0, 1, pr, ob, ex, fac, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols] += \
                 ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols].conj() * \
@@ -613,6 +827,8 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
         pr_norm = (1 - a) * prn.max() + a * prn
+        if self.scatter:
+            return self._update_local_scatter(flat_addr, 1, 0, ob, pr, ex, aux, pr_norm, a, b, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] += \
                 (a + b) * pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols].conj() * \
@@ -625,6 +841,8 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
         ob_norm = (1 - a) * obn_max + a * obn
+        if self.scatter:
+            return self._update_local_scatter(flat_addr, 0, 1, pr, ob, ex, aux, ob_norm, a, b, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols] += \
                 (a + b) * ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols].conj() * \
@@ -637,6 +855,8 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = obn.shape[-2:]
         obn[:] = 0.
+        if self.scatter:
+            return self._norm_local_scatter(flat_addr, 1, 0, ob, obn, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             # each object mode should only be counted once
             if prc[0] > 0:
@@ -651,6 +871,8 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = prn.shape[-2:]
         prn[:] = 0.
+        if self.scatter:
+            return self._norm_local_scatter(flat_addr, 0, 1, pr, prn, rows, cols)
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             # each probe mode should only be counted once
             if obc[0] > 0:
@@ -660,13 +882,84 @@ class PoUpdateKernel(BaseKernel):
             pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols]).real
         return
 
+    ## Batched scatter-add variants. These gather all windows of a batch
+    ## at once and accumulate with np.add.at, which applies the additions
+    ## in address order and therefore reproduces the loops above exactly.
+
+    def _ob_update_scatter(self, flat_addr, ob, obn, pr, ex, rows, cols):
+        ob_flat, obn_flat = _flat(ob), _flat(obn)
+        for start, stop in self._chunks(flat_addr, rows, cols):
+            fa = flat_addr[start:stop]
+            obi = _window_index(fa[:, 1], ob.shape, rows, cols)
+            prv = pr.reshape(-1)[_window_index(fa[:, 0], pr.shape, rows, cols)]
+            exv = ex.reshape(-1)[_window_index(fa[:, 2], ex.shape, rows, cols)]
+            np.add.at(ob_flat, obi, prv.conj() * exv)
+            np.add.at(obn_flat, obi, (prv.conj() * prv).real)
+        return
+
+    def _pr_update_scatter(self, flat_addr, pr, prn, ob, ex, rows, cols):
+        pr_flat, prn_flat = _flat(pr), _flat(prn)
+        for start, stop in self._chunks(flat_addr, rows, cols):
+            fa = flat_addr[start:stop]
+            pri = _window_index(fa[:, 0], pr.shape, rows, cols)
+            obv = ob.reshape(-1)[_window_index(fa[:, 1], ob.shape, rows, cols)]
+            exv = ex.reshape(-1)[_window_index(fa[:, 2], ex.shape, rows, cols)]
+            np.add.at(pr_flat, pri, obv.conj() * exv)
+            np.add.at(prn_flat, pri, (obv.conj() * obv).real)
+        return
+
+    def _update_ML_scatter(self, flat_addr, tgt, src, A, B, ex, fac, rows, cols):
+        """
+        A[tgt] += B[src].conj() * ex * fac, with `tgt` and `src` the
+        address columns of A and B.
+        """
+        A_flat = _flat(A)
+        for start, stop in self._chunks(flat_addr, rows, cols):
+            fa = flat_addr[start:stop]
+            Ai = _window_index(fa[:, tgt], A.shape, rows, cols)
+            Bv = B.reshape(-1)[_window_index(fa[:, src], B.shape, rows, cols)]
+            exv = ex.reshape(-1)[_window_index(fa[:, 2], ex.shape, rows, cols)]
+            np.add.at(A_flat, Ai, Bv.conj() * exv * fac)
+        return
+
+    def _update_local_scatter(self, flat_addr, tgt, src, A, B, ex, aux, norm, a, b, rows, cols):
+        """
+        A[tgt] += (a + b) * B[src].conj() * (ex - aux) / norm, with `tgt`
+        and `src` the address columns of A and B.
+        """
+        A_flat = _flat(A)
+        for start, stop in self._chunks(flat_addr, rows, cols):
+            fa = flat_addr[start:stop]
+            Ai = _window_index(fa[:, tgt], A.shape, rows, cols)
+            Bv = B.reshape(-1)[_window_index(fa[:, src], B.shape, rows, cols)]
+            exv = ex.reshape(-1)[_window_index(fa[:, 2], ex.shape, rows, cols)]
+            auxv = aux[start:stop].reshape(stop - start, rows * cols)
+            nv = norm.reshape(-1)[_window_index(fa[:, 4], norm.shape, rows, cols)]
+            np.add.at(A_flat, Ai, (a + b) * Bv.conj() * (exv - auxv) / nv)
+        return
+
+    def _norm_local_scatter(self, flat_addr, src, skip, A, An, rows, cols):
+        """
+        An += |A[src]|^2 for all rows whose `skip` column layer is 0,
+        i.e. each mode of A is counted only once.
+        """
+        An_flat = _flat(An)
+        flat_addr = flat_addr[flat_addr[:, skip, 0] == 0]
+        for start, stop in self._chunks(flat_addr, rows, cols):
+            fa = flat_addr[start:stop]
+            Ani = _window_index(fa[:, 4], An.shape, rows, cols)
+            Av = A.reshape(-1)[_window_index(fa[:, src], A.shape, rows, cols)]
+            np.add.at(An_flat, Ani, (Av.conj() * Av).real)
+        return
+
 
 class PositionCorrectionKernel(BaseKernel):
     from ptypy.accelerate.base import address_manglers
 
     MANGLERS = {
         'Annealing': address_manglers.RandomIntMangler,
-        'GridSearch': address_manglers.GridSearchMangler
+        'GridSearch': address_manglers.GridSearchMangler,
+        'Gradient': address_manglers.GradientMangler
     }
 
     def __init__(self, aux, nmodes, parameters, resolution):
@@ -675,6 +968,7 @@ class PositionCorrectionKernel(BaseKernel):
         self.fshape = (ash[0] // nmodes, ash[1], ash[2])
         self.npy.ferr = None
         self.npy.fdev = None
+        self.npy.dI = None
         self.addr = None
         self.nmodes = nmodes
         self.param = parameters
@@ -683,7 +977,9 @@ class PositionCorrectionKernel(BaseKernel):
         self.kernels = ['build_aux',
                         'fourier_error',
                         'error_reduce',
-                        'update_addr']
+                        'update_addr',
+                        'intensity_derivative',
+                        'shift_estimate']
         self.setup()
 
     def setup(self):
@@ -697,6 +993,8 @@ class PositionCorrectionKernel(BaseKernel):
     def allocate(self):
         self.npy.fdev = np.zeros(self.fshape, dtype=np.float32) # we won't use this again but preallocate for speed
         self.npy.ferr = np.zeros(self.fshape, dtype=np.float32)
+        if self.param.method == 'Gradient':
+            self.npy.dI = np.zeros((2,) + self.fshape, dtype=np.float32)
 
     def build_aux(self, b_aux, addr, ob, pr):
         """
@@ -805,6 +1103,71 @@ class PositionCorrectionKernel(BaseKernel):
         err_sum[:] = ((weights * (LL - I)**2).sum(-1).sum(-1) /  np.prod(LL.shape[-2:]))
         return
 
+    def probe_derivative(self, pr):
+        """
+        Derivatives of the probe modes `pr` along y and x, computed
+        in Fourier space.
+        """
+        prf = np.fft.fft2(pr)
+        ky = np.fft.fftfreq(pr.shape[-2]).reshape(-1, 1)
+        kx = np.fft.fftfreq(pr.shape[-1]).reshape(1, -1)
+        return [np.fft.ifft2(2j * np.pi * k * prf).astype(pr.dtype) for k in (ky, kx)]
+
+    def intensity_derivative(self, b_aux, b_daux, addr, axis):
+        """
+        Derivative of the model intensities of the far field waves in
+        `b_aux` with respect to the position along `axis` (0: y, 1: x),
+        from the far field waves of the probe derivative in `b_daux`.
+        """
+        # reference shape (write-to shape)
+        sh = self.fshape
+        # stopper
+        maxz = addr.shape[0]
+
+        # batch buffers
+        dI = self.npy.dI[axis][:maxz]
+        aux = b_aux[:maxz * self.nmodes]
+        daux = b_daux[:maxz * self.nmodes]
+
+        ## Actual math ##
+        tf = aux.reshape(maxz, self.nmodes, sh[1], sh[2])
+        tdf = daux.reshape(maxz, self.nmodes, sh[1], sh[2])
+        # moving the object view by +s moves the probe by -s relative to it
+        dI[:] = -2. * (tf.conj() * tdf).real.sum(1)
+
+    def shift_estimate(self, b_aux, addr, I, w, shifts):
+        """
+        Gauss-Newton estimate of the position shifts that minimise the
+        weighted squared difference of model intensities and measured
+        intensities `I`, from the intensity derivatives. Shifts are in
+        object pixels along (y, x).
+        """
+        # reference shape (write-to shape)
+        sh = self.fshape
+        # stopper
+        maxz = I.shape[0]
+
+        # batch buffers
+        aux = b_aux[:maxz * self.nmodes]
+        dIy = self.npy.dI[0][:maxz]
+        dIx = self.npy.dI[1][:maxz]
+
+        ## Actual math ##
+        tf = aux.reshape(maxz, self.nmodes, sh[1], sh[2])
+        res = (np.abs(tf) ** 2).sum(1) - I
+
+        ayy = (w * dIy * dIy).sum(-1).sum(-1).astype(np.float64)
+        axx = (w * dIx * dIx).sum(-1).sum(-1).astype(np.float64)
+        axy = (w * dIy * dIx).sum(-1).sum(-1).astype(np.float64)
+        by = (w * dIy * res).sum(-1).sum(-1).astype(np.float64)
+        bx = (w * dIx * res).sum(-1).sum(-1).astype(np.float64)
+
+        det = ayy * axx - axy ** 2
+        valid = det > 1e-6 * ayy * axx
+        det[~valid] = 1.
+        shifts[:maxz, 0] = np.where(valid, (axy * bx - axx * by) / det, 0.)
+        shifts[:maxz, 1] = np.where(valid, (axy * by - ayy * bx) / det, 0.)
+
     def update_addr_and_error_state(self, addr, error_state, mangled_addr, err_sum):
         """
         updates the addresses and err state vector corresponding to the smallest error. I think this can be done on the cpu
@@ -18,6 +18,7 @@ from ptypy.utils.verbose import logger, log
 from ptypy.utils import parallel
 from ptypy.engines import BaseEngine, register, projectional
 from ptypy.accelerate import ocl_pyopencl as gpu
+from ptypy.accelerate.base.engines import projectional_serial
 
 from pyopencl import array as cla
 
@@ -51,52 +52,7 @@ def gaussian_kernel(sigma, size=None, sigma_y=None, size_y=None):
     return g / g.sum()
 
 
-def serialize_array_access(diff_storage):
-    # Sort views according to layer in diffraction stack 
-    views = diff_storage.views
-    dlayers = [view.dlayer for view in views]
-    views = [views[i] for i in np.argsort(dlayers)]
-    view_IDs = [view.ID for view in views]
-
-    # Master pod
-    mpod = views[0].pod
-
-    # Determine linked storages for probe, object and exit waves
-    pr = mpod.pr_view.storage
-    ob = mpod.ob_view.storage
-    ex = mpod.ex_view.storage
-
-    poe_ID = (pr.ID, ob.ID, ex.ID)
-
-    addr = []
-    for view in views:
-        address = []
-
-        for pname, pod in view.pods.items():
-            ## store them for each pod
-            # create addresses
-            a = np.array(
-                [(pod.pr_view.dlayer, pod.pr_view.dlow[0], pod.pr_view.dlow[1]),
-                 (pod.ob_view.dlayer, pod.ob_view.dlow[0], pod.ob_view.dlow[1]),
-                 (pod.ex_view.dlayer, pod.ex_view.dlow[0], pod.ex_view.dlow[1]),
-                 (pod.di_view.dlayer, pod.di_view.dlow[0], pod.di_view.dlow[1]),
-                 (pod.ma_view.dlayer, pod.ma_view.dlow[0], pod.ma_view.dlow[1])])
-
-            address.append(a)
-
-            if pod.pr_view.storage.ID != pr.ID:
-                log(1, "Splitting probes for one diffraction stack is not supported in " + __name__)
-            if pod.ob_view.storage.ID != ob.ID:
-                log(1, "Splitting objects for one diffraction stack is not supported in " + __name__)
-            if pod.ex_view.storage.ID != ex.ID:
-                log(1, "Splitting exit stacks for one diffraction stack is not supported in " + __name__)
-
-        ## store data for each view
-        # adresses
-        addr.append(address)
-
-    # store them for each storage
-    return view_IDs, poe_ID, np.array(addr).astype(np.int32)
+serialize_array_access = projectional_serial.serialize_array_access
 
 
 @register()
@@ -35,6 +35,7 @@ This file is part of the PTYPY package.
 import numpy as np
 import weakref
 from collections import OrderedDict
+from functools import lru_cache
 
 try:
     from pympler.asizeof import asizeof
@@ -83,6 +84,21 @@ GEO_PREFIX = 'G'
 # TODO: make this dynamic from available memory.
 MEGAPIXEL_LIMIT = 50
 
+# Growth factor of the layer capacity when storages gain layers
+LAYER_GROWTH = 1.5
+
+
+def _view_rows(views):
+    """
+    Return the view table of the container owning `views` and the rows
+    of `views` in it, or ``(None, None)`` if any of the view records is
+    not backed by the table (e.g. after loading from a file).
+    """
+    table = views[0].owner._recs[VIEW_PREFIX]
+    if not all(v._record.base is table for v in views):
+        return None, None
+    return table, np.array([v.numID for v in views])
+
 
 class Base(object):
 
@@ -179,8 +195,16 @@ class Base(object):
         recs = self._recs[prefix]
         l = len(recs)
         if idx >= l:
-            nl = l + 8192 if idx > 10000 else 2*l
-            recs = np.resize(recs,(nl,))
+            # Grow the table geometrically and point the records of the
+            # registered objects to their rows in the new table, such
+            # that the table stays the authoritative copy
+            nl = l + l // 2 if idx > 10000 else 2*l
+            nrecs = np.zeros((nl,), dtype=recs.dtype)
+            nrecs[:l] = recs
+            for o in d.values():
+                if o is not obj and o.numID is not None and o.numID < l:
+                    o._record = nrecs[o.numID]
+            recs = nrecs
             self._recs[prefix] = recs
         rec = recs[idx] 
         obj._record = rec
@@ -336,8 +360,9 @@ class Storage(Base):
             by parent.
 
         data: ndarray or None
-            A numpy array to use as initial buffer.
-            *Deprecated* in v0.3, use fill method instead.
+            A (N+1)-dimensional numpy array to adopt as initial buffer.
+            No copy is made if it is C-contiguous and already has the
+            data type of the container. `shape` is ignored in this case.
 
         shape : tuple, int, or None
             The shape of the buffer. If None or int, the dimensionality
@@ -385,7 +410,9 @@ class Storage(Base):
         # dimensionality suggestion from container
         ndim = container.ndim if container.ndim is not None else 2
 
-        if shape is None:
+        if data is not None:
+            shape = np.shape(data)
+        elif shape is None:
             shape = (1,) + (1,) * ndim
             #shape = (1,) + (1 + 2*self.padding,) * ndim
         elif np.isscalar(shape):
@@ -400,30 +427,15 @@ class Storage(Base):
                         'scope (2,3). Behavior is untested.' % len(shape[1:]))
 
         self.shape = shape
-        self.data = np.empty(self.shape, self.dtype)
-        self.data.fill(self.fill_value)
-
-        """
-        # Set data buffer
         if data is None:
-            # Create data buffer
-            self.shape = shape
-            self.data = np.empty(self.shape, self.dtype)
+            self.data = self._allocate(self.shape)
             self.data.fill(self.fill_value)
+        elif self.backing is not None:
+            self.data = self._allocate(self.shape)
+            self.data[:] = data
         else:
-            # Set initial buffer. Casting the type makes a copy
-            data = np.asarray(data).astype(self.dtype)
-            if data.ndim < self.ndim or data.ndim > (self.ndim + 1):
-                raise ValueError(
-                    'For `data_dims` = %d, initial buffer must be'
-                    ' %dD or %dD, this one is %dD'
-                    % (self.ndim, self.ndim, self.ndim+1, data.ndim))
-            elif data.ndim == self.ndim:
-                self.data = data.reshape((1,) + data.shape)
-            else:
-                self.data = data
-            self.shape = self.data.shape
-        """
+            # Adopt the buffer, casting the type makes a copy
+            self.data = np.ascontiguousarray(data, dtype=self.dtype)
 
         if layermap is None:
             layermap = list(range(len(self.data)))
@@ -432,6 +444,9 @@ class Storage(Base):
         # This is most often not accurate. Set this quantity from the outside
         self.nlayers = len(layermap)
 
+        # Incremental bookkeeping of the views on this storage
+        self._reset_view_index(OrderedDict())
+
         # Need to bootstrap the parameters.
         # We set the initial center to the middle of the array
         self._center = u.expectN(self.shape[-self.ndim:], self.ndim) // 2
@@ -461,6 +476,171 @@ class Storage(Base):
         # solution required
         # self._origin = None
 
+    def _reset_view_index(self, index=None):
+        """
+        Reset the incremental bookkeeping of the views on this storage.
+        With `index` None, the views are looked up in the container
+        again when next needed.
+        """
+        # All views on this storage, by ID
+        self._vindex = index
+        # Views created or changed since the last reformat
+        self._stale = OrderedDict()
+        # (dlow, dhigh, layer) of the active views already accounted for
+        self._extents = {}
+        # Number of accounted views per layer
+        self._layer_count = {}
+        # Field of view [dlow, dhigh] of the accounted views, None if it
+        # has to be rebuilt from self._extents
+        self._fov = None
+        # Layer buffer with spare capacity that self.data is a view on
+        self._buffer = None
+
+    def _post_dict_import(self):
+        self._reset_view_index()
+
+    def _to_dict(self):
+        res = super(Storage, self)._to_dict()
+        for k in ['_vindex', '_stale', '_extents', '_layer_count', '_fov', '_buffer']:
+            res.pop(k, None)
+        return res
+
+    def _view_index(self):
+        """
+        Ordered dictionary of all views on this storage.
+        """
+        if self._vindex is None:
+            self._vindex = OrderedDict(
+                (v.ID, v) for v in self.owner.original.V.values()
+                if v.storageID == self.ID)
+            self._stale.update(self._vindex)
+            self._extents = {}
+            self._layer_count = {}
+            self._fov = None
+        return self._vindex
+
+    def _add_stale(self, v):
+        """
+        Register view `v` (new or changed) for the next reformat.
+        """
+        self._view_index()[v.ID] = v
+        self._stale[v.ID] = v
+
+    def _account(self, views):
+        """
+        Add the extents of the active `views` to the field of view and
+        layer bookkeeping.
+        """
+        if not views:
+            return
+        table, rows = _view_rows(views)
+        if table is None:
+            dlow = np.array([v.dlow for v in views])
+            dhigh = np.array([v.dhigh for v in views])
+            layers = [int(v.layer) for v in views]
+        else:
+            nd = self.ndim
+            dlow = table['dlow'][rows, :nd]
+            dhigh = table['dhigh'][rows, :nd]
+            layers = table['layer'][rows].tolist()
+        count = self._layer_count
+        for v, low, high, layer in zip(views, dlow, dhigh, layers):
+            self._extents[v.ID] = (low, high, layer)
+            count[layer] = count.get(layer, 0) + 1
+        if self._fov is not None:
+            np.minimum(self._fov[0], dlow.min(0), out=self._fov[0])
+            np.maximum(self._fov[1], dhigh.max(0), out=self._fov[1])
+
+    def _discount(self, ID):
+        """
+        Remove the extent of the view with `ID` from the bookkeeping.
+        The field of view is rebuilt if the view was on its boundary.
+        """
+        ext = self._extents.pop(ID, None)
+        if ext is None:
+            return
+        n = self._layer_count[ext[2]] - 1
+        if n:
+            self._layer_count[ext[2]] = n
+        else:
+            del self._layer_count[ext[2]]
+        if self._fov is not None and ((ext[0] == self._fov[0]).any()
+                                      or (ext[1] == self._fov[1]).any()):
+            self._fov = None
+
+    def _rebuild_extents(self):
+        """
+        Account for all active views on this storage from scratch.
+        Assumes that all views are up to date.
+        """
+        self._stale.clear()
+        self._extents = {}
+        self._layer_count = {}
+        self._fov = None
+        self._account([v for v in self._view_index().values()
+                       if v.active and v.storageID == self.ID])
+
+    def _account_views(self):
+        """
+        Update the views created or changed since the last call and
+        fold them into the field of view and layer bookkeeping.
+
+        Returns
+        -------
+        stale : list
+            The views that were (re-)accounted for.
+        """
+        self.owner._sort_touched()
+        self._view_index()
+        stale = list(self._stale.values())
+        self._stale.clear()
+        for v in stale:
+            self._discount(v.ID)
+        views = [v for v in stale if v.active and v.storageID == self.ID]
+        self._update_views(views)
+        self._account(views)
+
+        if self._fov is None and self._extents:
+            ext = list(self._extents.values())
+            self._fov = [np.min([e[0] for e in ext], axis=0),
+                         np.max([e[1] for e in ext], axis=0)]
+        return stale
+
+    def _grow_layers(self, data, nlayers):
+        """
+        Return `data` extended to `nlayers` layers, the new layers
+        filled with the fill value. The underlying buffer grows
+        geometrically, such that appending layers mostly does
+        not require a copy.
+        """
+        nold = len(data)
+        buf = self._buffer
+        if (buf is None or data.base is not buf or len(buf) < nlayers
+                or data.shape[1:] != buf.shape[1:]
+                or np.byte_bounds(data)[0] != np.byte_bounds(buf)[0]):
+            capacity = max(nlayers, int(np.ceil(nold * LAYER_GROWTH)))
+            buf = self._allocate((capacity,) + data.shape[1:])
+            buf[:nold] = data
+            self._buffer = buf
+        new_data = buf[:nlayers]
+        new_data[nold:].fill(self.fill_value)
+        return new_data
+
+    def _allocate(self, shape):
+        """
+        Uninitialised buffer of `shape`, memory-mapped to a scratch file
+        if the owning container has a backing directory.
+        """
+        return u.scratch_array(shape, self.dtype, self.backing)
+
+    @property
+    def backing(self):
+        """
+        Scratch directory of the buffer as set on the owning
+        :any:`Container`, None if the buffer is held in memory.
+        """
+        return getattr(self.owner, 'backing', None)
+
     @property
     def ndim(self):
         """
@@ -468,6 +648,14 @@ class Storage(Base):
         """
         return len(self.shape[1:])
 
+    @property
+    def subpixel(self):
+        """
+        Subpixel method for :any:`View` access, as set on the
+        owning :any:`Container`.
+        """
+        return getattr(self.owner, 'subpixel', None)
+
     @property
     def dtype(self):
         return self.owner.dtype if self.owner is not None else None
@@ -523,7 +711,7 @@ class Storage(Base):
                (self.fill_value).
         """
         if self.data is None:
-            self.data = np.empty(self.shape)
+            self.data = self._allocate(self.shape)
 
         if fill is None:
             # Fill with default fill value
@@ -541,7 +729,11 @@ class Storage(Base):
                     % (self.ndim, self.ndim, self.ndim+1, fill.ndim))
             elif fill.ndim == self.ndim:
                 fill = np.resize(fill, (self.shape[0],) + fill.shape)
-            self.data = fill.astype(self.dtype)
+            if self.backing is not None:
+                self.data = self._allocate(fill.shape)
+                self.data[:] = fill
+            else:
+                self.data = fill.astype(self.dtype)
             self.shape = self.data.shape
 
     def update(self):
@@ -555,6 +747,7 @@ class Storage(Base):
         # to avoid iterating through all the views when creating copies
         if self.owner.original is self.owner:
             self.update_views()
+            self._rebuild_extents()
 
     def update_views(self, v=None):
         """
@@ -568,8 +761,7 @@ class Storage(Base):
             the view is actually on self. Use cautiously.
         """
         if v is None:
-            for v in self.views:
-                self.update_views(v)
+            self._update_views(self.views)
             return
 
         if not self.ndim == v.ndim:
@@ -597,6 +789,33 @@ class Storage(Base):
         # else:
         #     v.slayer = self.layermap.index(v.layer)
 
+    def _update_views(self, views):
+        """
+        Vectorized :py:meth:`update_views` for a list of views, operating
+        on their rows in the container's view table.
+        """
+        if not views:
+            return
+        nd = self.ndim
+        for v in views:
+            if not nd == v.ndim:
+                raise ValueError(
+                    'Storage %s(ndim=%d) and View %s(ndim=%d) have conflicting '
+                    'data dimensions' % (self.ID, self.ndim, v.ID, v.ndim))
+        table, rows = _view_rows(views)
+        if table is None:
+            for v in views:
+                self.update_views(v)
+            return
+        pcoord = self._to_pix(table['coord'][rows, :nd])
+        dcoord = np.round(pcoord + 0.00001).astype(int)
+        shape = table['shape'][rows, :nd]
+        table['psize'][rows, :nd] = self.psize
+        table['dcoord'][rows, :nd] = dcoord
+        table['dlow'][rows, :nd] = dcoord - shape // 2
+        table['dhigh'][rows, :nd] = dcoord + (shape + 1) // 2
+        table['sp'][rows, :nd] = pcoord - dcoord
+
     def reformat(self, newID=None, update=True):
         """
         Crop or pad if required.
@@ -610,7 +829,9 @@ class Storage(Base):
         update : bool
             If True, updates all Views before reformatting. Not necessarily
             needed, if Views have been recently instantiated. Roughly doubles 
-            execution time.
+            execution time. Only relevant for storages of container copies,
+            the storages of the original container keep track of the views
+            created or changed since the last reformat and update those.
 
         Returns
         -------
@@ -624,37 +845,48 @@ class Storage(Base):
             s.reformat()
             return s
 
-        # Make sure all views are up to date
-        # This call takes roughly half the time of .reformat()
-        if update:
-            self.update()
+        dlow_fov = [np.inf] * self.ndim
+        dhigh_fov = [-np.inf] * self.ndim
+        dims = list(range(self.ndim))
+        if self.owner.original is self.owner:
+            # Only the views created or changed since the last reformat
+            # are updated and added to the field of view
+            stale = self._account_views()
+            views = None
+            if self._fov is not None:
+                dlow_fov = [int(x) for x in self._fov[0]]
+                dhigh_fov = [int(x) for x in self._fov[1]]
+            layers = list(self._layer_count.keys())
+
+            logger.debug('%s[%s] :: %d changed views for this storage'
+                         % (self.owner.ID, self.ID, len(stale)))
+        else:
+            # Make sure all views are up to date
+            # This call takes roughly half the time of .reformat()
+            if update:
+                self.update()
 
-        # List of views on this storage
-        views = self.views
+            # List of views on this storage
+            views = self.views
 
-        logger.debug('%s[%s] :: %d views for this storage'
-                     % (self.owner.ID, self.ID, len(views)))
+            logger.debug('%s[%s] :: %d views for this storage'
+                         % (self.owner.ID, self.ID, len(views)))
 
-        sh = self.data.shape
+            # Loop through all active views to get individual boundaries
+            layers = []
+            for v in views:
+                if not v.active:
+                    continue
 
-        # Loop through all active views to get individual boundaries
-        dlow_fov = [np.inf] * self.ndim
-        dhigh_fov = [-np.inf] * self.ndim
-        layers = []
-        dims = list(range(self.ndim))
-        for v in views:
-            if not v.active:
-                continue
+                # Accumulate the regions of interest to
+                # compute the full field of view
+                for d in dims:
+                    dlow_fov[d] = min(dlow_fov[d], v.dlow[d])
+                    dhigh_fov[d] = max(dhigh_fov[d], v.dhigh[d])
 
-            # Accumulate the regions of interest to
-            # compute the full field of view
-            for d in dims:
-                dlow_fov[d] = min(dlow_fov[d], v.dlow[d])
-                dhigh_fov[d] = max(dhigh_fov[d], v.dhigh[d])
-                
-            # Gather a (unique) list of layers
-            if v.layer not in layers:
-                layers.append(v.layer)
+                # Gather a (unique) list of layers
+                if v.layer not in layers:
+                    layers.append(v.layer)
 
         # Check if storage is scattered
         # A storage is "scattered" if and only if layer maps are different across nodes.
@@ -666,7 +898,7 @@ class Storage(Base):
             dhigh_fov[:] = u.parallel.comm.allreduce(dhigh_fov, u.parallel.MPI.MAX)
 
         # Return if no views, it is important that this only happens after self._is_scattered is updated 
-        if not views:
+        if not layers:
             return self
 
         sh = self.data.shape
@@ -719,7 +951,7 @@ class Storage(Base):
                     misfit,
                     fillpar=self.fill_value).astype(self.dtype)
             else:
-                new_data = np.empty(new_shape, self.dtype)
+                new_data = self._allocate(new_shape)
                 new_data.fill(self.fill_value)
         else:
             # Nothing changes for now
@@ -728,7 +960,14 @@ class Storage(Base):
             new_center = self.center
         
         # Deal with layermap
-        if self.layermap != new_layermap:
+        relaid = False
+        if self.layermap != new_layermap and new_layermap[:len(self.layermap)] == self.layermap:
+            # Layers are only appended, grow the buffer in place if possible
+            new_data = self._grow_layers(new_data, len(new_layermap))
+            new_shape = new_data.shape
+            self.layermap = new_layermap
+        elif self.layermap != new_layermap:
+            relaid = True
             relaid_data = []
             for i in new_layermap:
                 if i in self.layermap:
@@ -746,15 +985,28 @@ class Storage(Base):
         self.nlayers = len(new_layermap)
         
         # set layer index in the view
+        if views is None:
+            # Appended layers do not change the index of existing layers
+            views = [v for v in self._view_index().values()
+                     if v.active and v.storageID == self.ID] if relaid else \
+                    [v for v in stale if v.active and v.storageID == self.ID]
+        dlayers = {layer: i for i, layer in enumerate(self.layermap)}
         for v in views:
-            v.dlayer = self.layermap.index(v.layer)
+            if v.active:
+                v.dlayer = dlayers[v.layer]
 
         logger.debug('%s[%s] :: shape: %s -> %s'
                      % (self.owner.ID, self.ID, str(sh), str(new_shape)))
         # Store new buffer
+        if self.backing is not None and not isinstance(new_data, np.memmap):
+            buf = self._allocate(new_data.shape)
+            buf[:] = new_data
+            new_data = buf
         self.data = new_data
         self.shape = new_shape
-        self.center = new_center
+        # Setting the center updates all views, avoid that if unchanged
+        if not np.array_equal(new_center, self.center):
+            self.center = new_center
                 
     def _to_pix(self, coord):
         """
@@ -1042,14 +1294,16 @@ class Storage(Base):
         # return shift(self.data[v.slayer, v.roi[0, 0]:v.roi[1, 0],
         #             v.roi[0, 1]:v.roi[1, 1]], v.sp)
         if isinstance(v, View):
+            if self._shifted(v):
+                return self._get_shifted(v)
             if self.ndim == 2:
                 return shift(self.data[
                              v.dlayer, v.dlow[0]:v.dhigh[0], v.dlow[1]:v.dhigh[1]],
-                             v.sp)
+                             v.sp, self.subpixel)
             elif self.ndim == 3:
                 return shift(self.data[
                              v.dlayer, v.dlow[0]:v.dhigh[0], v.dlow[1]:v.dhigh[1],
-                             v.dlow[2]:v.dhigh[2]], v.sp)
+                             v.dlow[2]:v.dhigh[2]], v.sp, self.subpixel)
         elif v in self.layermap:
             return self.data[self.layermap.index(v)]
         else:
@@ -1078,36 +1332,83 @@ class Storage(Base):
         # self.data[v.slayer, v.roi[0, 0]:v.roi[1, 0],
         #          v.roi[0, 1]:v.roi[1, 1]] = shift(newdata, -v.sp)
         if isinstance(v, View):
+            if self._shifted(v):
+                self._set_shifted(v, newdata)
+                return
             # there must be a nicer way to do this, numpy.take is nearly
             # right, but returns copies and not views.
             if self.ndim == 2:
                 self.data[v.dlayer,
                           v.dlow[0]:v.dhigh[0],
-                          v.dlow[1]:v.dhigh[1]] = (shift(newdata, -v.sp))
+                          v.dlow[1]:v.dhigh[1]] = shift(newdata, -v.sp, self.subpixel)
             elif self.ndim == 3:
                 self.data[v.dlayer,
                           v.dlow[0]:v.dhigh[0],
                           v.dlow[1]:v.dhigh[1],
-                          v.dlow[2]:v.dhigh[2]] = (shift(newdata, -v.sp))
+                          v.dlow[2]:v.dhigh[2]] = shift(newdata, -v.sp, self.subpixel)
             elif self.ndim == 4:
                 self.data[v.dlayer,
                           v.dlow[0]:v.dhigh[0],
                           v.dlow[1]:v.dhigh[1],
                           v.dlow[2]:v.dhigh[2],
-                          v.dlow[3]:v.dhigh[3]] = (shift(newdata, -v.sp))
+                          v.dlow[3]:v.dhigh[3]] = shift(newdata, -v.sp, self.subpixel)
             elif self.ndim == 5:
                 self.data[v.dlayer,
                           v.dlow[0]:v.dhigh[0],
                           v.dlow[1]:v.dhigh[1],
                           v.dlow[2]:v.dhigh[2],
                           v.dlow[3]:v.dhigh[3],
-                          v.dlow[4]:v.dhigh[4]] = (shift(newdata, -v.sp))
+                          v.dlow[4]:v.dhigh[4]] = shift(newdata, -v.sp, self.subpixel)
         elif v in self.layermap:
             self.data[self.layermap.index(v)] = newdata
         else:
             raise ValueError("View or layer '%s' is not present in storage %s"
                              % (v, self.ID))
 
+    def _shifted(self, v):
+        """
+        True if access through view `v` needs a subpixel shift.
+        """
+        return (self.subpixel is not None
+                and np.round(v.sp, _SP_DECIMALS).any())
+
+    def _margin(self, v):
+        """
+        Index of the region of view `v` widened by the subpixel margin
+        and clipped to the buffer, the padding that replaces the clipped
+        part, the margin and the index of the view within the widened
+        region.
+        """
+        m = _SP_MARGIN[self.subpixel]
+        shape = np.array(self.data.shape[1:])
+        lo = np.clip(v.dlow - m, 0, shape)
+        hi = np.clip(v.dhigh + m, lo, shape)
+        index = (v.dlayer,) + tuple(slice(a, b) for a, b in zip(lo, hi))
+        pad = list(zip(lo - (v.dlow - m), (v.dhigh + m) - hi))
+        crop = (slice(m, -m),) * len(lo)
+        return index, pad, m, crop
+
+    def _get_shifted(self, v):
+        """
+        Shifted copy of the region of view `v`. The shift reads the
+        neighbouring buffer pixels, so that the view edges neither
+        repeat nor wrap around.
+        """
+        index, pad, m, crop = self._margin(v)
+        w = np.pad(self.data[index], pad, mode='edge')
+        return shift(w, v.sp, self.subpixel)[crop]
+
+    def _set_shifted(self, v, newdata):
+        """
+        Write `newdata` through view `v`. Only the difference to the
+        current content is shifted back, so writing back what was read
+        leaves the buffer untouched.
+        """
+        index, pad, m, crop = self._margin(v)
+        delta = np.pad(newdata - self._get_shifted(v), m, mode='edge')
+        window = tuple(slice(a, b) for a, b in zip(v.dlow, v.dhigh))
+        self.data[(v.dlayer,) + window] += shift(delta, -v.sp, self.subpixel)[crop]
+
     def __str__(self):
         info = '%15s : %7.2f MB :: ' % (self.ID, self.data.nbytes / 1e6)
         if self.data is not None:
@@ -1117,11 +1418,77 @@ class Storage(Base):
         return info + ' psize=%(_psize)s center=%(_center)s' % self.__dict__
 
 
-def shift(v, sp):
+def shift(v, sp, method=None):
     """
-    Placeholder for future subpixel shifting method.
+    Subpixel shift of the array `v`, such that the result samples `v`
+    at ``index + sp`` along the last ``len(sp)`` axes.
+
+    Parameters
+    ----------
+    v : ndarray
+        Array to shift
+
+    sp : array-like
+        Subpixel offset, one entry per shifted axis
+
+    method : None, 'fourier' or 'linear'
+        None returns `v` itself. 'fourier' multiplies the spectrum of `v`,
+        mirrored at its far edges so that no content wraps around, with a
+        linear phase ramp. 'linear' is a bilinear interpolation with edge
+        values repeated. Storages read a margin around their views, so
+        that view edges are shifted from neighbouring buffer pixels.
+
+    Returns
+    -------
+    out : ndarray
+        `v` if no shift applies, otherwise a shifted copy
     """
-    return v
+    if method is None or np.ndim(v) < len(sp):
+        return v
+    sp = np.round(np.asarray(sp, dtype=float), _SP_DECIMALS)
+    if not sp.any():
+        return v
+
+    axes = list(range(v.ndim - len(sp), v.ndim))
+    if method == 'fourier':
+        axes = [ax for ax, s in zip(axes, sp) if s != 0.]
+        w = v
+        for ax in axes:
+            w = np.concatenate([w, np.flip(w, axis=ax)], axis=ax)
+        w = np.fft.fftn(w, axes=axes)
+        for ax, s in zip(axes, sp[sp != 0.]):
+            w *= _fourier_ramp(2 * v.shape[ax], s).reshape(
+                (-1,) + (1,) * (v.ndim - 1 - ax))
+        w = np.fft.ifftn(w, axes=axes)[tuple(slice(0, n) for n in v.shape)]
+        return (w if np.iscomplexobj(v) else w.real).astype(v.dtype)
+    elif method == 'linear':
+        w = v
+        for ax, s in zip(axes, sp):
+            if s == 0.:
+                continue
+            # Neighbours on the side of the shift, edge values repeated
+            n = v.shape[ax]
+            idx = np.clip(np.arange(n) + int(np.sign(s)), 0, n - 1)
+            w = (1. - abs(s)) * w + abs(s) * np.take(w, idx, axis=ax)
+        return w.astype(v.dtype)
+    else:
+        raise ValueError("Unknown subpixel method '%s'" % method)
+
+
+# Precision of subpixel offsets, offsets that agree up to this
+# number of decimals share their phase ramps
+_SP_DECIMALS = 6
+
+# Pixels read around a view for each subpixel method
+_SP_MARGIN = {'linear': 1, 'fourier': 4}
+
+
+@lru_cache(maxsize=4096)
+def _fourier_ramp(n, s):
+    """
+    Phase ramp that shifts a periodic array of length `n` by `s` pixels.
+    """
+    return np.exp(2j * np.pi * s * np.fft.fftfreq(n))
 
 
 class View(Base):
@@ -1213,6 +1580,7 @@ class View(Base):
         self.active = True
         """ Active state. If False this view will be ignored when
             resizing the data buffer of the associated :any:`Storage`."""
+        self._touch()
 
         #: The :py:class:`Storage` instance that this view applies to by default.
         self.storage = None
@@ -1232,25 +1600,26 @@ class View(Base):
         """
         Store internal info to get/set the 2D data in the container.
         """
-        rule = u.Param(self.DEFAULT_ACCESSRULE)
+        # A plain dictionary, this is called once for every view
+        rule = dict(self.DEFAULT_ACCESSRULE)
         if accessrule is not None:
             rule.update(accessrule)
         rule.update(kwargs)
 
-        self.active = True if rule.active else False
+        self.active = True if rule['active'] else False
 
-        self.storageID = rule.storageID
+        self.storageID = rule['storageID']
 
         # shape == None means "full frame"
-        self.shape = rule.shape
+        self.shape = rule['shape']
 
         # Look for storage, create one if necessary
         s = self.owner.storages.get(self.storageID, None)
         if s is None:
             sh = (1,) + tuple(self.shape) if self.shape is not None else None
             s = self.owner.new_storage(ID=self.storageID,
-                                       psize=rule.psize,
-                                       origin=rule.coord,
+                                       psize=rule['psize'],
+                                       origin=rule['coord'],
                                        shape=sh)
         self.storage = s
 
@@ -1259,12 +1628,13 @@ class View(Base):
             self._set_full_frame(s)
 
         # Information to access the slice within the storage buffer
-        self.psize = rule.psize
-        self.coord = rule.coord
-        self.layer = rule.layer
+        self.psize = rule['psize']
+        self.coord = rule['coord']
+        self.layer = rule['layer']
 
-        if (self.psize is not None
-                and not np.allclose(self.storage.psize, self.psize)):
+        psize = self.psize
+        if (psize is not None and (psize != s.psize).any()
+                and not np.allclose(s.psize, psize)):
             logger.warning(
                 'Inconsistent pixel size when creating view.\n (%s vs %s)'
                 % (str(self.storage.psize), str(self.psize)))
@@ -1289,7 +1659,10 @@ class View(Base):
 
     def copy(self,ID=None, update = True):
         nView = View(self.owner, ID)
-        nView._record = self._record.copy()
+        # Copy the record into the row of the new view
+        nID = nView._record['ID']
+        self.owner._recs[VIEW_PREFIX][nView.numID] = self._record
+        nView._record['ID'] = nID
         nView._ndim = self._ndim
         nView.storage = self.storage
         nView.storageID = self.storageID
@@ -1303,7 +1676,9 @@ class View(Base):
         
     @active.setter
     def active(self, v):
-        self._record['active'] = v
+        if self._record['active'] != v:
+            self._record['active'] = v
+            self._touch()
         
     @property
     def dlayer(self):
@@ -1320,6 +1695,15 @@ class View(Base):
     @layer.setter
     def layer(self, v):
         self._record['layer'] = v
+        self._touch()
+
+    def _touch(self):
+        """
+        Queue this view for the next (incremental) reformat of its storage.
+        """
+        touched = getattr(self.owner, '_touched', None)
+        if touched is not None:
+            touched[self.ID] = self
 
     @property
     def ndim(self):
@@ -1402,6 +1786,7 @@ class View(Base):
         else:
             self._ndim = len(v)
             self._record['shape'][:len(v)] = v
+        self._touch()
 
     @property
     def dlow(self):
@@ -1481,6 +1866,7 @@ class View(Base):
             self._record['coord'][:self._ndim] = u.expectN(v, self._ndim)
         else:
             self._record['coord'][:self._ndim] = v
+        self._touch()
 
     @property
     def sp(self):
@@ -1549,7 +1935,8 @@ class Container(Base):
     """
     _PREFIX = CONTAINER_PREFIX
 
-    def __init__(self, owner=None, ID=None, data_type='complex', data_dims=2, distribution="cloned"):
+    def __init__(self, owner=None, ID=None, data_type='complex', data_dims=2, distribution="cloned",
+                 subpixel=None, backing=None):
         """
         Parameters
         ----------
@@ -1569,6 +1956,18 @@ class Container(Base):
         distribution : str
             Indicates if the data is "cloned" in all MPI processes or "scattered"
 
+        subpixel : None, 'fourier' or 'linear'
+            Subpixel shift applied when accessing data through views, see
+            :py:func:`shift`. None (default) accesses whole pixels only and
+            returns views on the buffer, whereas shifted access returns copies.
+            Copies of the container inherit this setting.
+
+        backing : str or None
+            If a directory, the buffers of all storages are memory-mapped
+            to scratch files in it (see :py:func:`~ptypy.utils.misc.scratch_array`)
+            instead of being held in memory. Copies of the container keep
+            their buffers in memory.
+
         """
 
         super(Container, self).__init__(owner, ID)
@@ -1587,6 +1986,42 @@ class Container(Base):
         # boolean parameter for distributed containers
         self._is_scattered = (distribution == "scattered")
 
+        # Subpixel method for view access
+        self.subpixel = subpixel
+
+        # Scratch directory for memory-mapped storage buffers
+        self.backing = backing
+
+        # Views created or changed since they were last handed over to
+        # their storage, see Storage.reformat()
+        self._touched = OrderedDict()
+
+    def _post_dict_import(self):
+        self._touched = OrderedDict()
+
+    def _to_dict(self):
+        res = super(Container, self)._to_dict()
+        res.pop('_touched', None)
+        return res
+
+    def _sort_touched(self):
+        """
+        Hand the views touched since the last call over to the
+        bookkeeping of their storages. Views whose storage does not
+        exist yet are kept for later.
+        """
+        if not self._touched:
+            return
+        touched = self._touched
+        self._touched = OrderedDict()
+        storages = self.storages
+        for ID, v in touched.items():
+            s = storages.get(v.storageID)
+            if s is None:
+                self._touched[ID] = v
+            else:
+                s._add_stale(v)
+
     @property
     def copies(self):
         """
@@ -1698,6 +2133,25 @@ class Container(Base):
                 sz += s.data.nbytes
         return sz
 
+    def view_records(self, views):
+        """
+        Return the records of `views` as a structured array with one row
+        per view and the fields of :py:attr:`View._fields` (e.g. ``dlayer``,
+        ``dlow`` or ``coord``). Multi-dimensional fields are padded to
+        five dimensions.
+
+        Parameters
+        ----------
+        views : list
+            Views managed by this container.
+        """
+        if not views:
+            return np.zeros((0,), dtype=View._fields)
+        table, rows = _view_rows(views)
+        if table is None:
+            return np.array([v._record for v in views], dtype=View._fields)
+        return table[rows]
+
     def views_in_storage(self, s, active_only=True):
         """
         Return a list of views on :any:`Storage` `s`.
@@ -1709,11 +2163,16 @@ class Container(Base):
         active_only : True or False
                  If True (default), return only active views.
         """
+        original = self.original
+        original._sort_touched()
+        so = original.storages.get(s.ID)
+        if so is None:
+            return []
         if active_only:
-            return [v for v in self.original.V.values()
+            return [v for v in so._view_index().values()
                     if v.active and (v.storageID == s.ID)]
         else:
-            return [v for v in self.original.V.values()
+            return [v for v in so._view_index().values()
                     if (v.storage.ID == s.ID)]
 
     def copy(self, ID=None, fill=None, dtype=None):
@@ -1741,6 +2200,7 @@ class Container(Base):
                               ID=ID,
                               data_type=data_type)
         new_cont.original = self
+        new_cont.subpixel = getattr(self, 'subpixel', None)
 
         # If changing data type, avoid casting by producing empty buffers
         if (dtype is not None) and (fill is None):
@@ -24,6 +24,7 @@ from . import geometry
 from . import xy
 from .. import utils as u
 from .. import io
+from ..io import h5pool
 from .. import resources
 from ..utils import parallel
 from ..utils.verbose import logger, log, headerline
@@ -97,6 +98,9 @@ class PtyScan(object):
         - ``'link'``: appends external links in master \\*.ptyd file and stores chunks separately
         <newline>
         in the path given by the link. Links file paths are relative to master file.
+        - ``'parallel'``: like ``'link'``, but each node stores its own frames of a chunk in a
+        <newline>
+        separate file, without gathering them to the master node, which only adds the links.
     userlevel = 1
 
     [auto_center]
@@ -115,6 +119,12 @@ class PtyScan(object):
     help = Determines what will be loaded in parallel
     doc = Choose from ``None``, ``'data'``, ``'common'``, ``'all'``
 
+    [scatter_frames]
+    type = bool
+    default = True
+    help = Send each node only its own frames if data is not loaded in parallel
+    doc = If ``True``, the master node packs the frames and weights of each node into one contiguous buffer and scatters them (see :py:func:`ptypy.utils.parallel.scatter_dict`). If ``False``, every frame is broadcast to all nodes, which then keep their own share.
+
     [rebin]
     type = int
     default = None
@@ -764,8 +774,8 @@ class PtyScan(object):
             # We proceed with numpy arrays.That is probably now more memory
             # intensive but shorter in writing
             if has_data:
-                d = np.array([data[ind] for ind in indices.node])
-                w = np.array([weights[ind] for ind in indices.node])
+                d = self._stack_frames(data, indices.node)
+                w = self._stack_frames(weights, indices.node)
             else:
                 d = np.ones((1,) + tuple(dsh))
                 w = np.ones((1,) + tuple(dsh))
@@ -820,6 +830,25 @@ class PtyScan(object):
                 # Translate back to dictionaries
                 data = dict(zip(indices.node, d))
                 weights = dict(zip(indices.node, w))
+            else:
+                d = None
+                w = None
+
+        elif has_data and sorted(data.keys()) == sorted(indices.node):
+            # Collect the frames in one contiguous array and let the
+            # dictionaries refer to its layers. Loaders that exclude
+            # frames may label them differently, their dictionaries
+            # are kept as they are.
+            d = self._stack_frames(data, indices.node)
+            data = dict(zip(indices.node, d))
+            if has_weights:
+                w = self._stack_frames(weights, indices.node)
+                weights = dict(zip(indices.node, w))
+            else:
+                w = None
+        else:
+            d = None
+            w = None
 
         # Adapt geometric info
         self.meta.center = cen / float(self.rebin)
@@ -837,6 +866,11 @@ class PtyScan(object):
         
         # chunk now always has weights
         chunk.weights = weights
+
+        # Contiguous (frames, y, x) arrays in the order of indices_node,
+        # which data and weights refer to, or None if not available
+        chunk.data_array = d
+        chunk.weights_array = w
         
         # If there are weights we add them to chunk,
         # otherwise we push it into meta
@@ -954,6 +988,26 @@ class PtyScan(object):
 
         return out
 
+    @staticmethod
+    def _stack_frames(frames, indices):
+        """
+        Returns the frames in dict `frames` for `indices` as one
+        contiguous array. Frames that already are consecutive layers
+        of such an array (e.g. from :py:func:`parallel.scatter_dict`)
+        are not copied.
+        """
+        values = [frames[ind] for ind in indices]
+        base = getattr(values[0], 'base', None)
+        if (isinstance(base, np.ndarray) and base.flags.c_contiguous
+                and base.shape == (len(values),) + np.shape(values[0])):
+            ptr = base.__array_interface__['data'][0]
+            step = base.strides[0]
+            if all(isinstance(v, np.ndarray) and v.base is base
+                   and v.__array_interface__['data'][0] == ptr + i * step
+                   for i, v in enumerate(values)):
+                return base
+        return np.array(values)
+
     def _mpi_pipeline_with_dictionaries(self, indices):
         """
         Example processing pipeline using dictionaries.
@@ -979,8 +1033,13 @@ class PtyScan(object):
                 pos = {}
                 weights = {}
             # Distribute raw data across nodes according to indices
-            raw = parallel.bcast_dict(raw, indices.node)
-            weights = parallel.bcast_dict(weights, indices.node)
+            if self.info.scatter_frames:
+                keys = [[indices.chunk[k] for k in lm] for lm in indices.lm]
+                raw = parallel.scatter_dict(raw, keys)
+                weights = parallel.scatter_dict(weights, keys)
+            else:
+                raw = parallel.bcast_dict(raw, indices.node)
+                weights = parallel.bcast_dict(weights, indices.node)
 
         # (re)distribute position information - every node should now be
         # aware of all positions
@@ -1159,12 +1218,14 @@ class PtyScan(object):
         In case you support parallel hdf5 writing, please modify this
         function to suit your installation.
 
-        2 out of 3 modes currently supported
+        3 out of 4 modes currently supported
 
-        kind : 'merge','append','link'
+        kind : 'merge','append','link','parallel'
 
             'append' : appends chunks of data in same file
             'link' : saves chunks in separate files and adds ExternalLinks
+            'parallel' : every node saves its part of the chunk in a
+                         separate file, the master node adds ExternalLinks
 
         TODO:
             * For the 'link case, saving still requires access to
@@ -1178,10 +1239,15 @@ class PtyScan(object):
         # Gather all distributed dictionary data.
         c = chunk if chunk is not None else self.chunk
 
+        if str(kind) == 'parallel':
+            return self._mpi_save_chunk_parallel(c)
+
         # Shallow copy
         todisk = dict(c)
         num = todisk.pop('num')
         ind = todisk.pop('indices_node')
+        todisk.pop('data_array', None)
+        todisk.pop('weights_array', None)
 
         for k in ['data', 'weights']:
             if k in c.keys():
@@ -1217,6 +1283,51 @@ class PtyScan(object):
                                           'is not yet implemented.')
         parallel.barrier()
 
+    def _mpi_save_chunk_parallel(self, c):
+        """
+        Saves the frames of chunk `c` held by this node to a separate file.
+
+        The parts of chunk number ``num`` are stored as chunks number
+        ``num * parallel.size + rank`` in the master file, which keeps the
+        order of the frames, as each node holds a contiguous block of them.
+        Only the master node opens the master file to add the links.
+        """
+        ind = list(c['indices_node'])
+        num = c['num'] * parallel.size + parallel.rank
+
+        # Master node always stores its part, possibly empty, such
+        # that the first chunk exists
+        hddaddress = None
+        if ind or parallel.master:
+            todisk = {k: v for k, v in c.items() if k not in
+                      ['num', 'indices_node', 'data_array', 'weights_array',
+                       'data', 'weights', 'positions', 'indices']}
+            pos = dict(zip(c['indices'], c['positions']))
+            todisk['indices'] = np.asarray(ind, dtype=int)
+            # empty parts keep the dimensions of the frames and positions
+            todisk['positions'] = np.asarray([pos[j] for j in ind]).reshape(
+                (len(ind),) + np.shape(c['positions'])[1:])
+            for k in ['data', 'weights']:
+                if k not in c.keys():
+                    continue
+                stacked = c.get(k + '_array')
+                if stacked is None:
+                    v = c[k]
+                    stacked = np.asarray([v[j] for j in ind] if hasattr(v, 'items') else v)
+                if not ind:
+                    stacked = np.zeros((0,) + tuple(u.expect2(self.meta.shape)))
+                todisk[k] = stacked
+            hddaddress = self.dfile + '.part%03d' % num
+            io.h5write(hddaddress, todisk)
+
+        # Master node adds links to all parts
+        parts = parallel.gather_dict({num: hddaddress} if hddaddress else {})
+        if parallel.master:
+            with h5py.File(self.dfile, 'a') as f:
+                for n in sorted(parts.keys()):
+                    f['chunks/%d' % n] = h5py.ExternalLink(parts[n], '/')
+        parallel.barrier()
+
 
 @defaults_tree.parse_doc('scandata.PtydScan')
 class PtydScan(PtyScan):
@@ -1245,6 +1356,15 @@ class PtydScan(PtyScan):
     help = Alternate source file path if data is meant to be reprocessed.
     doc = `None` for input shall be deprecated in future
 
+    [read_processes]
+    default = 1
+    type = int
+    lowlim = 1
+    help = Number of processes per node reading the source file
+    doc = Frames are read in runs of consecutive frames. With more than one process, the runs are
+      read in parallel by a pool of processes, which is kept for subsequent loads.
+    userlevel = 2
+
     """
 
     def __init__(self, pars=None, **kwargs):
@@ -1351,6 +1471,8 @@ class PtydScan(PtyScan):
         # Other instance attributes
         self._checked = {}
         self._ch_frame_ind = None
+        self._index_changed = True
+        self._pool = None
 
     def check(self, frames=None, start=None):
         """
@@ -1385,20 +1507,40 @@ class PtydScan(PtyScan):
 
         self._checked = d
         all_frames = int(sum([ch[1] for ch in d['data']]))
-        ch_frame_ind = []
-        for dd in d['data']:
-            for frame in range(dd[1]):
-                ch_frame_ind.append((dd[0], frame))
+        ch_frame_ind = np.concatenate(
+            [np.stack([np.full(dd[1], dd[0]), np.arange(dd[1])], axis=1)
+             for dd in d['data']])
 
-        self._ch_frame_ind = np.array(ch_frame_ind)
+        if (self._ch_frame_ind is None
+                or not np.array_equal(self._ch_frame_ind, ch_frame_ind)):
+            self._ch_frame_ind = ch_frame_ind
+            self._index_changed = True
 
         # Accessible frames
         frames_accessible = min((frames, all_frames - start))
         # end_of_scan = source_frames <= start + frames_accessible
         return frames_accessible, None
 
-    def _coord_to_h5_calls(self, key, coord):
-        return 'chunks/%d/%s' % (coord[0], key), slice(coord[1], coord[1] + 1)
+    @staticmethod
+    def _coords_to_runs(coords):
+        """
+        Group (chunk, frame) coordinates into runs of consecutive frames
+        of the same chunk. Returns (chunk, first frame, start, stop)
+        tuples, with start and stop the positions in `coords`.
+        """
+        runs = []
+        chunks = coords[:, 0]
+        seg = np.concatenate(([0], np.nonzero(np.diff(chunks))[0] + 1, [len(chunks)]))
+        for s0, s1 in zip(seg[:-1], seg[1:]):
+            for first, start, stop in h5pool.frame_runs(coords[s0:s1, 1]):
+                runs.append((int(chunks[s0]), first, int(s0) + start, int(s0) + stop))
+        return runs
+
+    def _finalize(self):
+        super(PtydScan, self)._finalize()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
 
     def load_weight(self):
         if 'weight2d' in self.info:
@@ -1415,26 +1557,39 @@ class PtydScan(PtyScan):
 
         Due to possible chunked data, slicing frames is non-trivial.
         """
-        # Ok we need to communicate the some internal info
-        parallel.barrier()
-        self._ch_frame_ind = parallel.bcast(self._ch_frame_ind)
-        parallel.barrier()
-        self._checked = parallel.bcast_dict(self._checked)
-
-        # Get the coordinates in the chunks
+        # The chunk index is only known to the node that ran check(),
+        # communicate it again only if it has changed
+        if parallel.bcast(self._index_changed):
+            self._ch_frame_ind = parallel.bcast(self._ch_frame_ind)
+            self._checked = parallel.bcast_dict(self._checked)
+        self._index_changed = False
+
+        # Get the coordinates in the chunks, read consecutive frames at once
         coords = self._ch_frame_ind[indices]
-        calls = {}
+        runs = self._coords_to_runs(coords)
 
-        for key in self._checked.keys():
-            calls[key] = [self._coord_to_h5_calls(key, c) for c in coords]
+        nproc = self.info.read_processes
+        if nproc > 1 and self._pool is None:
+            self._pool = h5pool.H5ReadPool(nproc)
 
         # Get our data from the ptyd file
         out = {}
         with h5py.File(self.source, 'r') as f:
-            for array, call in calls.items():
-                out[array] = [np.squeeze(f[path][slce]) for path, slce in call]
-
-            f.close()
+            for key in self._checked.keys():
+                if not runs:
+                    out[key] = []
+                    continue
+                dset = f['chunks/%d/%s' % (runs[0][0], key)]
+                shape = (len(coords),) + dset.shape[1:]
+                reads = [('chunks/%d/%s' % (ch, key), np.s_[first:first + stop - start],
+                          np.s_[start:stop]) for ch, first, start, stop in runs]
+                if self._pool is not None:
+                    buf = self._pool.read(self.source, shape, dset.dtype, reads)
+                else:
+                    buf = np.empty(shape, dtype=dset.dtype)
+                    for path, source_sel, dest_sel in reads:
+                        f[path].read_direct(buf, source_sel, dest_sel)
+                out[key] = [np.squeeze(b) for b in buf]
 
         # If the chunk provided indices, we use those instead of our own
         # Dangerous and not yet implemented
@@ -7,7 +7,8 @@ This file is part of the PTYPY package.
     :license: see LICENSE for details.
 """
 import numpy as np
-from scipy import fftpack
+import scipy.fft
+import threading
 
 from .. import utils as u
 from ..utils.verbose import logger
@@ -116,6 +117,15 @@ class Geo(Base):
     choices = 'numpy', 'scipy', 'fftw'
     userlevel = 1
 
+    [fft_threads]
+    type = int
+    default = 1
+    lowlim = 1
+    help = Number of threads per FFT
+    doc = Used by the "scipy" and "fftw" FFT types. Keep this at 1 if the engine already
+          distributes frames over several threads.
+    userlevel = 2
+
     [shape]
     type = int, tuple
     default = 256
@@ -447,8 +457,15 @@ class FFTchooser(object):
     """
     Chooses the desired FFT algo, and assigns scaling.
     If pyFFTW is not available, falls back to scipy.
+
+    Besides the out-of-place transforms `fft` and `ifft`, in-place
+    transforms `fft_inplace` and `ifft_inplace` over the last two axes
+    are assigned, which overwrite and return their argument. For pyFFTW,
+    these use plans cached per shape and dtype of the input in
+    thread-local storage, as executing a plan on new arrays is not thread
+    safe. The plans of a thread are released when the thread ends.
     """
-    def __init__(self, ffttype='scipy'):
+    def __init__(self, ffttype='scipy', threads=1):
         """
         Parameters
         ----------
@@ -460,24 +477,88 @@ class FFTchooser(object):
             - 'scipy' for scipy.fft.fft2
             - 2 or 4-tuple of (forward_fft2(), inverse_fft2(),
               [scaling, inverse_scaling])
+
+        threads : int
+            Number of threads per transform for 'scipy' and 'fftw'.
         """
         self.ffttype = ffttype
+        self.threads = threads
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # The cached plans belong to the threads of this instance
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
 
     def _FFTW_fft(self):
         pyfftw.interfaces.cache.enable()
         pyfftw.interfaces.cache.set_keepalive_time(15.0)
         pe = 'FFTW_MEASURE'
-        self.fft = lambda x: fftw_np.fft2(x, planner_effort=pe)
-        self.ifft = lambda x: fftw_np.ifft2(x, planner_effort=pe)
+        self.fft = lambda x: fftw_np.fft2(x, planner_effort=pe, threads=self.threads)
+        self.ifft = lambda x: fftw_np.ifft2(x, planner_effort=pe, threads=self.threads)
+        self.fft_inplace = lambda x: self._FFTW_inplace(x, 'FFTW_FORWARD')
+        self.ifft_inplace = lambda x: self._FFTW_inplace(x, 'FFTW_BACKWARD')
+
+    def _FFTW_plan(self, x, direction):
+        plans = getattr(self._local, 'plans', None)
+        if plans is None:
+            plans = self._local.plans = {}
+        key = (x.shape, x.dtype.str, direction)
+        if key not in plans:
+            # Planning overwrites the arrays, so plan on a scratch buffer
+            a = np.empty(x.shape, dtype=x.dtype)
+            plan = pyfftw.FFTW(a, a, axes=(-2, -1), direction=direction,
+                               flags=('FFTW_MEASURE', 'FFTW_UNALIGNED'),
+                               threads=self.threads)
+            plans[key] = (plan, a)
+        return plans[key]
+
+    def _FFTW_inplace(self, x, direction):
+        if not x.flags.c_contiguous:
+            x[:] = self.fft(x) if direction == 'FFTW_FORWARD' else self.ifft(x)
+            return x
+        plan, a = self._FFTW_plan(x, direction)
+        plan(x, x)
+        # Rebind the scratch buffer, the plan must not keep `x` alive
+        plan.update_arrays(a, a)
+        return x
 
     def _scipy_fft(self):
-        self.fft = lambda x: fftpack.fft2(x).astype(x.dtype)
-        self.ifft = lambda x: fftpack.ifft2(x).astype(x.dtype)
+        self.fft = lambda x: scipy.fft.fft2(x, workers=self.threads).astype(x.dtype, copy=False)
+        self.ifft = lambda x: scipy.fft.ifft2(x, workers=self.threads).astype(x.dtype, copy=False)
+
+        def fft_inplace(x):
+            x[:] = scipy.fft.fft2(x, overwrite_x=True, workers=self.threads)
+            return x
+
+        def ifft_inplace(x):
+            x[:] = scipy.fft.ifft2(x, overwrite_x=True, workers=self.threads)
+            return x
+
+        self.fft_inplace = fft_inplace
+        self.ifft_inplace = ifft_inplace
 
     def _numpy_fft(self):
         self.fft = lambda x: np.ascontiguousarray(np.fft.fft2(x).astype(x.dtype))
         self.ifft = lambda x: np.ascontiguousarray(np.fft.ifft2(x).astype(x.dtype))
 
+    def _generic_inplace(self):
+        def fft_inplace(x):
+            x[:] = self.fft(x)
+            return x
+
+        def ifft_inplace(x):
+            x[:] = self.ifft(x)
+            return x
+
+        self.fft_inplace = fft_inplace
+        self.ifft_inplace = ifft_inplace
+
     def assign_scaling(self, shape):
         if isinstance(self.ffttype, tuple) and len(self.ffttype) > 2:
             self.sc = self.ffttype[2]
@@ -489,6 +570,7 @@ class FFTchooser(object):
         return (self.sc, self.isc)
 
     def assign_fft(self):
+        self._generic_inplace()
         if str(self.ffttype) == 'fftw':
             try:
                 self._FFTW_fft()
@@ -630,23 +712,29 @@ class BasicFarfieldPropagator(object):
         self.pre_ifft = self.post_fft.conj()
         self.post_ifft = self.pre_fft.conj()
         self.sc, self.isc = self.FFTch.assign_scaling(self.sh)
+        self.FFTch.threads = p.fft_threads
 
+        # Post factors with the scaling folded in
+        self.post_fft_sc = (self.post_fft * self.sc).astype(self.dtype)
+        self.post_ifft_isc = (self.isc * self.post_ifft).astype(self.dtype)
+
+    def _crop_pad(self):
+        return (self.crop_pad != 0).any()
 
     def fw(self, W):
         """
         Computes forward propagated wavefront of input wavefront W.
         """
         # Check for cropping
-
-        if (self.crop_pad != 0).any():
+        if self._crop_pad():
             w = u.crop_pad(W, self.crop_pad)
         else:
             w = W
 
-        w = self.post_fft * self.sc * self.fft(self.pre_fft * w)
+        w = self.post_fft_sc * self.fft(self.pre_fft * w)
 
         # Cropping again
-        if (self.crop_pad != 0).any():
+        if self._crop_pad():
             return u.crop_pad(w, -self.crop_pad)
         else:
             return w
@@ -656,20 +744,48 @@ class BasicFarfieldPropagator(object):
         Computes backward propagated wavefront of input wavefront W.
         """
         # Check for cropping
-        if (self.crop_pad != 0).any():
+        if self._crop_pad():
             w = u.crop_pad(W, self.crop_pad)
         else:
             w = W
 
         # Compute transform
-        w = self.ifft(self.pre_ifft * w) * self.isc * self.post_ifft
+        w = self.ifft(self.pre_ifft * w) * self.post_ifft_isc
 
         # Cropping again
-        if (self.crop_pad != 0).any():
+        if self._crop_pad():
             return u.crop_pad(w, -self.crop_pad)
         else:
             return w
 
+    def fw_inplace(self, W):
+        """
+        Forward propagates the wavefront(s) W in place and returns W.
+        W may be a stack of frames with the frame axes last.
+        """
+        if self._crop_pad():
+            W[:] = self.fw(W)
+            return W
+
+        W *= self.pre_fft
+        self.FFTch.fft_inplace(W)
+        W *= self.post_fft_sc
+        return W
+
+    def bw_inplace(self, W):
+        """
+        Backward propagates the wavefront(s) W in place and returns W.
+        W may be a stack of frames with the frame axes last.
+        """
+        if self._crop_pad():
+            W[:] = self.bw(W)
+            return W
+
+        W *= self.pre_ifft
+        self.FFTch.ifft_inplace(W)
+        W *= self.post_ifft_isc
+        return W
+
 
 def translate_to_pix(sh, center):
     """
@@ -720,9 +836,9 @@ class BasicNearfieldPropagator(object):
         # Get default parameters and update
         self.p = u.Param(Geo.DEFAULT)
         self.dtype = kwargs['dtype'] if 'dtype' in kwargs else np.complex128
-        self.update(geo_pars, **kwargs)
         self.FFTch = FFTchooser(ffttype)
         self.fft, self.ifft = self.FFTch.assign_fft()
+        self.update(geo_pars, **kwargs)
 
     def update(self, geo_pars=None, **kwargs):
         """
@@ -758,6 +874,7 @@ class BasicNearfieldPropagator(object):
             2j * np.pi * (p.distance / p.lam) * (np.sqrt(1-a2) - 1)).astype(self.dtype)
         # self.kernel = np.fft.fftshift(self.kernel)
         self.ikernel = self.kernel.conj()
+        self.FFTch.threads = p.fft_threads
 
     def fw(self, W):
         """
@@ -771,6 +888,22 @@ class BasicNearfieldPropagator(object):
         """
         return self.ifft(self.fft(W) * self.ikernel)
 
+    def fw_inplace(self, W):
+        """
+        Forward propagates the wavefront(s) W in place and returns W.
+        """
+        self.FFTch.fft_inplace(W)
+        W *= self.kernel
+        return self.FFTch.ifft_inplace(W)
+
+    def bw_inplace(self, W):
+        """
+        Backward propagates the wavefront(s) W in place and returns W.
+        """
+        self.FFTch.fft_inplace(W)
+        W *= self.ikernel
+        return self.FFTch.ifft_inplace(W)
+
 
 ############
 # TESTING ##
@@ -15,6 +15,8 @@ This file is part of the PTYPY package.
 """
 import numpy as np
 import time
+import queue
+import threading
 from collections import OrderedDict
 from . import illumination
 from . import sample
@@ -48,6 +50,69 @@ class _LogTime(object):
         self._t = time.time()
 
 
+class _ChunkLoader(object):
+    """
+    Runs :py:meth:`PtyScan.auto` in a background thread and keeps up to
+    `depth` data packages ready in a queue. Chunks are prepared with the
+    `max_frames` of the latest request to :py:meth:`get`.
+    """
+
+    def __init__(self, ptyscan, max_frames, depth, wait=0.1):
+        self.ptyscan = ptyscan
+        self.max_frames = max_frames
+        self.wait = wait
+        self.queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                dp = self.ptyscan.auto(self.max_frames)
+                if dp == data.WAIT:
+                    self._stop.wait(self.wait)
+                    continue
+                self._put(dp)
+                if dp == data.EOS:
+                    break
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Do not block on a full queue once stopped
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=self.wait)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, max_frames, block=True):
+        """
+        Next data package, or :py:data:`data.WAIT` if none is ready
+        and `block` is False. Chunks that are prepared from now on
+        hold at most `max_frames` frames.
+        """
+        self.max_frames = max_frames
+        try:
+            dp = self.queue.get(block=block)
+        except queue.Empty:
+            return data.WAIT
+        if isinstance(dp, Exception):
+            raise dp
+        return dp
+
+    def stop(self):
+        """
+        Stop the thread after the chunk it is preparing and drop the
+        chunks that were not fetched.
+        """
+        self._stop.set()
+        self.thread.join()
+        self.queue = queue.Queue()
+
+
 @defaults_tree.parse_doc('scan.ScanModel')
 class ScanModel(object):
     """
@@ -80,6 +145,14 @@ class ScanModel(object):
     doc = Choose from "numpy", "scipy" or "fftw"
     userlevel = 1
 
+    [fft_threads]
+    type = int
+    default = 1
+    lowlim = 1
+    help = Number of threads per FFT
+    doc = Used by the "scipy" and "fftw" FFT types.
+    userlevel = 2
+
     [data]
     default =
     type = @scandata.*
@@ -107,6 +180,17 @@ class ScanModel(object):
     help = Resampling fraction of the image frames w.r.t. diffraction frames
     doc = A resampling of 2 means that the image frame is to be sampled (in the detector plane) twice
           as densely as the raw diffraction data.
+
+    [prefetch]
+    type = int
+    default = 0
+    lowlim = 0
+    help = Number of data chunks prepared ahead in a background thread
+    doc = If larger than 0, a background thread reads and prepares the data chunks of this scan
+          ahead of the reconstruction, keeping up to this many chunks ready, such that loading does
+          not stall the engine iterations. Only creating views and pods is left to the main thread.
+          Ignored when running with MPI, as data preparation communicates between processes.
+    userlevel = 2
     """
     _PREFIX = MODEL_PREFIX
 
@@ -167,6 +251,9 @@ class ScanModel(object):
         # By default we create a new exit buffer for each view
         self._single_exit_buffer_for_all_views = False
 
+        # Background data loading, see _get_data
+        self._loader = None
+
     @classmethod
     def makePtyScan(cls, pars):
         """
@@ -493,7 +580,15 @@ class ScanModel(object):
     def _get_data(self, max_frames):
         # Get data
         logger.info('Importing data from scan %s.' % self.label)
-        dp = self.ptyscan.auto(max_frames)
+        if self.p.prefetch > 0 and not parallel.MPIenabled:
+            if self._loader is None:
+                self._loader = _ChunkLoader(self.ptyscan, max_frames, self.p.prefetch)
+            # Only wait for the loader if there is nothing to work on yet
+            dp = self._loader.get(max_frames, block=not self.diff_views)
+            if dp == data.EOS:
+                self._loader = None
+        else:
+            dp = self.ptyscan.auto(max_frames)
 
         self.data_available = (dp != data.EOS)
 
@@ -505,6 +600,14 @@ class ScanModel(object):
         else:
             return dp
 
+    def stop_loading(self):
+        """
+        Stop loading data in the background, see the `prefetch` parameter.
+        """
+        if getattr(self, '_loader', None) is not None:
+            self._loader.stop()
+            self._loader = None
+
 
 @defaults_tree.parse_doc('scan.BlockScanModel')
 class BlockScanModel(ScanModel):
@@ -552,10 +655,21 @@ class BlockScanModel(ScanModel):
 
         indices_node = chunk['indices_node']
 
-        diff = self.Cdiff.new_storage(shape=sh, psize=self.psize, padonly=True,
-                                      fill=0.0, layermap=indices_node)
-        mask = self.Cmask.new_storage(shape=sh, psize=self.psize, padonly=True,
-                                      fill=1.0, layermap=indices_node)
+        # Adopt the contiguous frame arrays of the chunk as storage buffers
+        # where possible instead of copying frame by frame
+        data_array = chunk.get('data_array')
+        weights_array = chunk.get('weights_array')
+        if data_array is None or data_array.shape != sh:
+            data_array = None
+            weights_array = None
+        elif weights_array is not None and weights_array.shape != sh:
+            weights_array = None
+
+        diff = self.Cdiff.new_storage(data=data_array, shape=sh, psize=self.psize,
+                                      padonly=True, fill=0.0, layermap=indices_node)
+        mask = self.Cmask.new_storage(data=weights_array, shape=sh, psize=self.psize,
+                                      padonly=True, fill=1.0, layermap=indices_node)
+        layer_of = dict((index, l) for l, index in enumerate(indices_node))
 
         # Prepare for View generation
         AR_diff = DEFAULT_ACCESSRULE.copy()
@@ -598,11 +712,13 @@ class BlockScanModel(ScanModel):
             mask_views.append(mv)
 
             if active:
-                l = indices_node.index(index)
+                l = layer_of[index]
                 dv.dlayer = l
                 mv.dlayer = l
-                dv.data[:] = maybe_data
-                mv.data[:] = weights.get(index, np.ones_like(maybe_data))
+                if data_array is None:
+                    dv.data[:] = maybe_data
+                if weights_array is None:
+                    mv.data[:] = weights.get(index, np.ones_like(maybe_data))
 
                 # positions
         positions = chunk.positions
@@ -784,6 +900,7 @@ class _Vanilla(object):
         geo_pars.center = center
         geo_pars.propagation = self.p.propagation
         geo_pars.ffttype = self.p.ffttype
+        geo_pars.fft_threads = self.p.fft_threads
         geo_pars.psize = psize
 
         # make a Geo instance and fix resolution
@@ -1074,6 +1191,7 @@ class _Full(object):
         # Add propagation info from this scan model
         geo_pars.propagation = self.p.propagation
         geo_pars.ffttype = self.p.ffttype
+        geo_pars.fft_threads = self.p.fft_threads
 
         # The multispectral case will have multiple geometries
         for ii, fac in enumerate(self.p.coherence.energies):
@@ -1648,7 +1766,16 @@ class ModelManager(object):
     
     @property
     def end_of_scan(self):
-        return all(s.ptyscan.end_of_scan for s in list(self.scans.values()))
+        # Chunks prepared in the background may still be waiting
+        return all(s.ptyscan.end_of_scan and getattr(s, '_loader', None) is None
+                   for s in list(self.scans.values()))
+
+    def stop_loading(self):
+        """
+        Stop loading data in the background for all scans.
+        """
+        for scan in self.scans.values():
+            scan.stop_loading()
 
     def new_data(self):
         """
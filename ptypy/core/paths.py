@@ -62,12 +62,13 @@ class Paths(object):
             self.recon = io.rfile
         except:
             self.recon = self.DEFAULT.recon
+        self.scratch = io.get('scratch')
 
         sep = os.path.sep
         if not self.home.endswith(sep):
             self.home += sep
 
-        for key in ['autosave', 'autoplot', 'recon']:
+        for key in ['autosave', 'autoplot', 'recon', 'scratch']:
             v = self.__dict__[key]
             if isinstance(v, str):
                 if not v.startswith(os.path.sep):
@@ -94,6 +95,12 @@ class Paths(object):
         p = self.get_path(self.autoplot, runtime)
         return self.get_path(self.autoplot, runtime)
 
+    def scratch_dir(self):
+        """ Directory for memory-mapped buffers, None if not set """
+        if self.scratch is None:
+            return None
+        return os.path.abspath(os.path.expanduser(self.scratch))
+
     def get_path(self, path, runtime):
         if runtime is not None:
             try:
@@ -10,6 +10,8 @@ This file is part of the PTYPY package.
 import numpy as np
 import time
 import json
+import queue
+import threading
 from . import paths
 from collections import OrderedDict
 
@@ -30,6 +32,115 @@ if __has_zmq__:
 __all__ = ['Ptycho']
 
 
+class _AutoSaver(object):
+    """
+    Writes autosave dumps in a background thread.
+
+    The probe and object buffers are copied into one of two snapshot
+    buffers in turn, such that the next snapshot can be taken while the
+    previous one is still being written. Only a snapshot whose buffers
+    are still being written makes the caller wait.
+    """
+
+    def __init__(self, h5options=None):
+        self.h5options = h5options if h5options is not None else {}
+        self._buffers = [{}, {}]
+        self._free = [threading.Event(), threading.Event()]
+        for free in self._free:
+            free.set()
+        self._slot = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @staticmethod
+    def _grids(shape, psize, origin):
+        """
+        Same as :py:meth:`Storage.grids` for a storage of `shape`.
+        """
+        nm = np.indices(shape)[1:]
+        return tuple(nm[i] * psize[i] + origin[i] for i in range(len(shape) - 1))
+
+    def snapshot(self, ptycho, dest_file):
+        """
+        Copy the current state of `ptycho` and queue it for
+        writing to `dest_file`.
+        """
+        slot = self._slot
+        self._slot = 1 - slot
+        self._free[slot].wait()
+        self._free[slot].clear()
+        buffers = self._buffers[slot]
+
+        dump = u.Param()
+        for name, container in [('probe', ptycho.probe), ('obj', ptycho.obj)]:
+            dump[name] = {}
+            for ID, S in container.storages.items():
+                buf = buffers.get((name, ID))
+                if buf is None or buf.shape != S.data.shape or buf.dtype != S.data.dtype:
+                    buf = np.empty(S.data.shape, dtype=S.data.dtype)
+                    buffers[(name, ID)] = buf
+                np.copyto(buf, S.data)
+                d = S._to_dict()
+                for k, v in d.items():
+                    if isinstance(v, np.ndarray):
+                        d[k] = v.copy() if v is not S.data else buf
+                d['grids'] = (S.data.shape, S.psize.copy(), S.origin.copy())
+                dump[name][ID] = d
+
+        dump.pars = ptycho.p.copy()
+        dump.runtime = ptycho.runtime.copy()
+        # Discard some bits of runtime to save space, and detach
+        # the list from the one the engine keeps appending to
+        dump.runtime.iter_info = ptycho.runtime.iter_info[-1:]
+
+        self._queue.put((slot, dest_file, dump))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _write(self, dest_file, dump):
+        from .. import io
+        for name in ['probe', 'obj']:
+            for d in dump[name].values():
+                d['grids'] = self._grids(*d['grids'])
+        try:
+            defaults_tree['ptycho'].validate(dump.pars)
+        except RuntimeError:
+            logger.warning("The parameters we are saving won't pass a validator check!")
+        header = {'kind': 'dump',
+                  'description': 'Ptypy .h5 compatible storage format'}
+        logger.info('Saving to %s' % dest_file)
+        with io.h5options_local(**self.h5options):
+            io.h5write(dest_file, header=header, content=dump)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            slot, dest_file, dump = job
+            try:
+                self._write(dest_file, dump)
+            except Exception as e:
+                logger.warning('Autosave to %s failed: %s' % (dest_file, e))
+            finally:
+                self._free[slot].set()
+                self._queue.task_done()
+
+    def wait(self):
+        """
+        Wait until all queued snapshots are written.
+        """
+        self._queue.join()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
 
 @defaults_tree.parse_doc('ptycho')
 class Ptycho(Base):
@@ -157,6 +268,32 @@ class Ptycho(Base):
        - ``'dls'``:    Custom format for Diamond Light Source
     choices = 'minimal','dls'
 
+    [io.compression]
+    default = 'gzip'
+    type = str, None
+    help = Compression of arrays in reconstruction files
+    doc = One of ``None`` (no compression, fastest), ``'lzf'`` (fast), ``'gzip'`` or the name of a
+      filter provided by the optional ``hdf5plugin`` package, e.g. ``'blosc'``. Unavailable filters
+      fall back to ``'gzip'``. Stacks of frames are chunked along the frame axis.
+    userlevel = 2
+
+    [io.compression_level]
+    default = None
+    type = int, None
+    help = Compression level
+    doc = The gzip level (0-9). Other filters use their defaults.
+    userlevel = 2
+
+    [io.scratch]
+    default = None
+    type = str
+    help = Scratch directory for out-of-core diffraction data
+    doc = If set, the diffraction data and mask storages are memory-mapped to scratch files in this
+      directory instead of being held in memory, so that scans larger than the available memory can
+      be reconstructed. The block-based serial engines read ahead the next block of frames while the
+      current one is processed. Use a fast local disk.
+    userlevel = 2
+
     [io.interaction]
     default = None
     type = Param
@@ -205,6 +342,15 @@ class Ptycho(Base):
     help = Auto-save file name (or format string)
     doc = Auto-save file name or format string (constructed against runtime dictionary)
 
+    [io.autosave.threaded]
+    default = False
+    type = bool
+    help = Save in a background thread
+    doc = If ``True``, probe and object are copied to a snapshot buffer and written to file by a
+      background thread while the reconstruction continues. This needs memory for two further
+      copies of probe and object.
+    userlevel = 2
+
     [io.autoplot]
     default = Param
     type = Param
@@ -242,6 +388,15 @@ class Ptycho(Base):
       reconstruction. This option should be set to ``True`` when ptypy is run on an isolated
       workstation.
 
+    [io.autoplot.preview]
+    default = 1024
+    type = int
+    help = Display size of object and probe in pixels
+    doc = The plot client receives the object and probe binned by powers of two to about this size
+      along their longer axis, instead of at full resolution. Set to 0 for full resolution.
+    lowlim = 0
+    userlevel = 2
+
     [io.autoplot.layout]
     default = "default"
     type = str
@@ -357,6 +512,7 @@ class Ptycho(Base):
         self.plotter = None
         self.record_positions = False
         self._jupyter_client = None
+        self._autosaver = None
 
         # Early boot strapping
         self._configure()
@@ -514,8 +670,11 @@ class Ptycho(Base):
         self.probe = Container(self, ID='Cprobe', data_type='complex')
         self.obj = Container(self, ID='Cobj', data_type='complex')
         self.exit = Container(self, ID='Cexit', data_type='complex', distribution="scattered")
-        self.diff = Container(self, ID='Cdiff', data_type='real', distribution="scattered")
-        self.mask = Container(self, ID='Cmask', data_type='bool', distribution="scattered")
+        scratch = self.paths.scratch_dir()
+        self.diff = Container(self, ID='Cdiff', data_type='real', distribution="scattered",
+                              backing=scratch)
+        self.mask = Container(self, ID='Cmask', data_type='bool', distribution="scattered",
+                              backing=scratch)
         # Initialize the model manager. This also initializes the
         # containers.
         self.model = ModelManager(self, self.p.scans)
@@ -693,7 +852,13 @@ class Ptycho(Base):
                     if engine.curiter % auto_save.interval == 0:
                         auto = self.paths.auto_file(self.runtime)
                         logger.info(headerline('Autosaving'))
-                        self.save_run(auto, 'dump')
+                        if auto_save.threaded:
+                            if parallel.master:
+                                if self._autosaver is None:
+                                    self._autosaver = _AutoSaver(self._h5options())
+                                self._autosaver.snapshot(self, u.clean_path(auto))
+                        else:
+                            self.save_run(auto, 'dump')
                         self.runtime.last_save = engine.curiter
                         logger.info(headerline())
 
@@ -709,6 +874,7 @@ class Ptycho(Base):
 
                 # Display runtime information and do saving
                 if parallel.master:
+                    self._update_state()
                     info = self.runtime.iter_info[-1]
                     # Calculate error:
                     # err = np.array(info['error'].values()).mean(0)
@@ -739,6 +905,10 @@ class Ptycho(Base):
                 engine.finalize()
             if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.engine_finalize += t.duration
 
+            # Pending autosaves
+            if self._autosaver is not None:
+                self._autosaver.wait()
+
             # Save
             if self.p.io.rfile:
                 self.save_run(kind=self.p.io.rformat)
@@ -778,12 +948,36 @@ class Ptycho(Base):
             for engine in self.engines.values():
                 self.run(engine=engine)
 
+    def _update_state(self):
+        """
+        Exposes probe, object and error on the state channel of the
+        interaction server and marks them as changed.
+        """
+        if self.interactor is None:
+            return
+        states = self.interactor.states
+        for name, container in [('obj', self.obj), ('probe', self.probe)]:
+            for ID, S in container.storages.items():
+                key = '%s/%s' % (name, ID)
+                if key not in states:
+                    # previews bin the last two axes, i.e. only 2D frames
+                    self.interactor.register_state(key, lambda S=S: S.data, preview=(S.data.ndim == 3))
+        if 'error' not in states:
+            self.interactor.register_state(
+                'error', lambda: np.array([info['error'] for info in self.runtime.iter_info]))
+        self.interactor.new_state()
+
     def finalize(self):
         """
         Cleanup
         """
         # 'allstop' will be interpreted as 'quit' on threaded plot clients
         self.runtime.allstop = time.asctime()
+        if self._autosaver is not None:
+            self._autosaver.stop()
+            self._autosaver = None
+        if self.model is not None:
+            self.model.stop_loading()
         if parallel.master and self.interactor is not None:
             self.interactor.process_requests()
         if self.plotter and self.p.io.autoplot.make_movie:
@@ -882,6 +1076,15 @@ class Ptycho(Base):
             P.init_data()
         return P
 
+    def _h5options(self):
+        """
+        Options of :py:mod:`ptypy.io.h5rw` for writing reconstruction files.
+        """
+        compression = self.p.io.compression
+        return dict(UNSUPPORTED='ignore',
+                    COMPRESSION=compression,
+                    COMPRESSION_OPTS=self.p.io.compression_level if compression == 'gzip' else None)
+
     def save_run(self, alt_file=None, kind='minimal', force_overwrite=True):
         """
         Save run to file.
@@ -1022,11 +1225,9 @@ class Ptycho(Base):
                 for ID, S in self.obj.storages.items():
                     content.positions[ID] = np.array([v.coord for v in S.views if v.pod.pr_view.layer==0])
 
-            h5opt = io.h5options['UNSUPPORTED']
-            io.h5options['UNSUPPORTED'] = 'ignore'
             logger.info('Saving to %s' % dest_file)
-            io.h5write(dest_file, header=header, content=content)
-            io.h5options['UNSUPPORTED'] = h5opt
+            with io.h5options_local(**self._h5options()):
+                io.h5write(dest_file, header=header, content=content)
         else:
             pass
         # We have to wait for all processes, just in case the script isn't
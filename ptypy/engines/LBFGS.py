@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Limited-memory BFGS reconstruction engine.
+
+The engine minimizes the same negative log-likelihood as the ML engine
+and uses its noise models for the gradient and the line search, but
+takes quasi-Newton instead of conjugate gradient directions.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import numpy as np
+import time
+
+from ..utils.verbose import logger
+from .utils import Cdot, Caxpy
+from . import register
+from .ML import ML
+
+
+__all__ = ['LBFGS']
+
+
+class LBFGSMixin:
+    """
+    Limited-memory BFGS directions on top of the gradient and line
+    search of an ML engine.
+
+    Defaults:
+
+    [bfgs_memory_size]
+    default = 5
+    type = int
+    lowlim = 1
+    help = Number of correction pairs kept for the L-BFGS direction
+    doc = Each pair costs two copies of object and probe.
+
+    [bfgs_single_precision]
+    default = True
+    type = bool
+    help = Keep the correction pairs in single precision
+    doc = This halves the memory of the history for double precision reconstructions.
+
+    """
+
+    def _bfgs_initialize(self):
+        """
+        Allocate one set of containers per correction pair.
+        """
+        dtype = np.complex64 if self.p.bfgs_single_precision else None
+        self.bfgs_slots = []
+        for i in range(self.p.bfgs_memory_size):
+            self.bfgs_slots.append([c.copy(c.ID + '_bfgs_%s%d' % (kind, i), fill=0., dtype=dtype)
+                                    for kind in 'sy' for c in (self.ob, self.pr)])
+        # Correction pairs in use as (slot, rho), oldest first
+        self.bfgs_pairs = []
+        # Slot holding the last step, waiting for its gradient change
+        self.bfgs_step = None
+
+        self.ptycho.citations.add_article(
+            title='Updating quasi-Newton matrices with limited storage',
+            author='Nocedal J.',
+            journal='Mathematics of Computation',
+            volume=35,
+            year=1980,
+            page=773,
+            doi='10.1090/S0025-5718-1980-0572855-7',
+            comment='The limited-memory BFGS algorithm',
+        )
+
+    def _bfgs_finalize(self):
+        for slot in self.bfgs_slots:
+            for c in slot:
+                del self.ptycho.containers[c.ID]
+        del self.bfgs_slots
+        self.bfgs_pairs = []
+        self.bfgs_step = None
+
+    @staticmethod
+    def _bfgs_dot(ob1, pr1, ob2, pr2):
+        return np.real(Cdot(ob1, ob2)) + np.real(Cdot(pr1, pr2))
+
+    def _bfgs_reset(self):
+        self.bfgs_pairs = []
+        self.bfgs_step = None
+
+    def _bfgs_update(self):
+        """
+        Complete the correction pair of the last step with the change
+        from the previous gradient to the current one. Pairs that
+        violate the curvature condition are dropped.
+        """
+        if self.bfgs_step is None:
+            return
+        ob_s, pr_s, ob_y, pr_y = slot = self.bfgs_step
+        self.bfgs_step = None
+        # ob_y, pr_y hold the previous gradient
+        ob_y *= -1.
+        ob_y += self.ob_grad
+        pr_y *= -1.
+        pr_y += self.pr_grad
+        sy = self._bfgs_dot(ob_s, pr_s, ob_y, pr_y)
+        if sy > 0:
+            self.bfgs_pairs.append((slot, 1. / sy))
+        else:
+            logger.debug('L-BFGS: skipping pair without positive curvature')
+
+    def _bfgs_direction(self, ob_grad, pr_grad):
+        """
+        Two-loop recursion for the search direction into `ob_h`, `pr_h`.
+        The initial inverse Hessian is the probe/object preconditioner,
+        scaled with the latest correction pair in the preconditioned
+        metric.
+        """
+        ob_h, pr_h = self.ob_h, self.pr_h
+        ob_h << ob_grad
+        pr_h << pr_grad
+
+        alphas = []
+        for (ob_s, pr_s, ob_y, pr_y), rho in reversed(self.bfgs_pairs):
+            alpha = rho * self._bfgs_dot(ob_s, pr_s, ob_h, pr_h)
+            Caxpy(-alpha, ob_y, ob_h)
+            Caxpy(-alpha, pr_y, pr_h)
+            alphas.append(alpha)
+
+        if self.bfgs_pairs:
+            (ob_s, pr_s, ob_y, pr_y), rho = self.bfgs_pairs[-1]
+            yy = np.real(Cdot(ob_y, ob_y)) + self.scale_p_o * np.real(Cdot(pr_y, pr_y))
+            gamma = 1. / (rho * yy)
+        else:
+            gamma = 1.
+        ob_h *= gamma
+        pr_h *= gamma * self.scale_p_o
+
+        for ((ob_s, pr_s, ob_y, pr_y), rho), alpha in zip(self.bfgs_pairs, reversed(alphas)):
+            beta = rho * self._bfgs_dot(ob_y, pr_y, ob_h, pr_h)
+            Caxpy(alpha - beta, ob_s, ob_h)
+            Caxpy(alpha - beta, pr_s, pr_h)
+
+        ob_h *= -1.
+        pr_h *= -1.
+
+        # Fall back to steepest descent if this is not a descent direction
+        if self._bfgs_dot(ob_h, pr_h, ob_grad, pr_grad) >= 0 and self.bfgs_pairs:
+            logger.debug('L-BFGS: resetting history')
+            self._bfgs_reset()
+            self._bfgs_direction(ob_grad, pr_grad)
+
+    def _bfgs_store_step(self):
+        """
+        Keep the step just taken in `ob_h`, `pr_h` and the gradient it
+        was taken from for the next correction pair, reusing the slot of
+        the oldest pair if needed.
+        """
+        used = [id(slot) for slot, rho in self.bfgs_pairs]
+        free = [slot for slot in self.bfgs_slots if id(slot) not in used]
+        if not free:
+            free = [self.bfgs_pairs.pop(0)[0]]
+        ob_s, pr_s, ob_y, pr_y = free[0]
+        ob_s << self.ob_h
+        pr_s << self.pr_h
+        ob_y << self.ob_grad
+        pr_y << self.pr_grad
+        self.bfgs_step = free[0]
+
+    def _bfgs_gradients(self):
+        """
+        Constraints and preconditioning of the new gradients with the
+        `_replace_pr_grad` and `_replace_ob_grad` methods of the ML
+        engine, which make them the current gradients.
+        """
+        # The curvature changes once the probe is refined as well
+        if self.p.probe_update_start == self.curiter:
+            self._bfgs_reset()
+
+        self._replace_pr_grad()
+        self._replace_ob_grad()
+
+        # probe/object rescaling
+        self._update_scale_p_o(self.ob_grad, self.pr_grad)
+
+    def engine_iterate(self, num=1):
+        """
+        Compute `num` iterations.
+        """
+        tg = 0.
+        tc = 0.
+        for it in range(num):
+            t1 = time.time()
+            error_dct = self.ML_model.new_grad()
+            self._bfgs_gradients()
+            tg += time.time() - t1
+
+            self._bfgs_update()
+
+            # Search direction
+            self._bfgs_direction(self.ob_grad, self.pr_grad)
+
+            # Line search along the direction
+            t2 = time.time()
+            B = self.ML_model.poly_line_coeffs(self.ob_h, self.pr_h)
+            tc += time.time() - t2
+
+            if np.isinf(B).any() or np.isnan(B).any():
+                logger.warning(
+                    'Warning! inf or nan found! Trying to continue...')
+                B[np.isinf(B)] = 0.
+                B[np.isnan(B)] = 0.
+
+            dt = self.ptycho.FType
+            self.tmin = dt(-.5 * B[1] / B[2])
+            self.ob_h *= self.tmin
+            self.pr_h *= self.tmin
+            self.ob += self.ob_h
+            self.pr += self.pr_h
+            self._bfgs_store_step()
+
+            # Position correction
+            self.position_update()
+
+            # Allow for customized modifications at the end of each iteration
+            self._post_iterate_update()
+
+            # increase iteration counter
+            self.curiter += 1
+
+        logger.info('Time spent in gradient calculation: %.2f' % tg)
+        logger.info('  ....  in coefficient calculation: %.2f' % tc)
+        return error_dct
+
+
+@register()
+class LBFGS(LBFGSMixin, ML):
+    """
+    Limited-memory BFGS reconstruction engine, with the noise models
+    of the maximum likelihood engine.
+
+    Defaults:
+
+    [name]
+    default = LBFGS
+    type = str
+    help =
+    doc =
+
+    """
+
+    def engine_initialize(self):
+        """
+        Prepare for L-BFGS reconstruction.
+        """
+        super(LBFGS, self).engine_initialize()
+        self._bfgs_initialize()
+
+    def engine_finalize(self):
+        """
+        Delete temporary containers.
+        """
+        self._bfgs_finalize()
+        super(LBFGS, self).engine_finalize()
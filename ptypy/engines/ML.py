@@ -17,7 +17,7 @@ import time
 from .. import utils as u
 from ..utils.verbose import logger
 from ..utils import parallel
-from .utils import Cnorm2, Cdot
+from .utils import Cnorm2, Cdot, pod_stacks
 from . import register
 from .base import BaseEngine, PositionCorrectionEngine
 from ..core.manager import Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull, GradFull, BlockGradFull
@@ -99,7 +99,21 @@ class ML(PositionCorrectionEngine):
     type = int
     lowlim = 0
     help = Number of iterations before probe update starts
-    
+
+    [batch_size]
+    default = None
+    type = int
+    lowlim = 1
+    help = Number of diffraction frames processed as one stack in gradient and line search
+    doc = If None, the noise model runs view by view through the pods. Otherwise, views of the same diffraction storage and geometry are propagated and accumulated in stacks of up to this many frames. Views that cannot be stacked, e.g. with resampling, still go through their pods.
+
+    [far_field_cache]
+    default = 1024.
+    type = float
+    lowlim = 0
+    help = Memory in MB for keeping the propagated waves of the gradient step for the line search
+    doc = The line search reuses the far field waves computed for the gradient instead of propagating object and probe again, which saves a third of the forward propagations per iteration. Views that do not fit into this budget are propagated again. Set to 0 to disable the cache.
+
     """
 
     SUPPORTED_MODELS = [Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull, GradFull, BlockGradFull]
@@ -231,22 +245,7 @@ class ML(PositionCorrectionEngine):
                     s.data[:] = self.smooth_gradient(s.data)
 
             # probe/object rescaling
-            if self.p.scale_precond:
-                cn2_new_pr_grad = Cnorm2(new_pr_grad)
-                cn2_new_ob_grad = Cnorm2(new_ob_grad)
-                if cn2_new_pr_grad > 1e-5:
-                    scale_p_o = (self.p.scale_probe_object * cn2_new_ob_grad 
-                                 / cn2_new_pr_grad)
-                else:
-                    scale_p_o = self.p.scale_probe_object
-                if self.scale_p_o is None:
-                    self.scale_p_o = scale_p_o
-                else:
-                    self.scale_p_o = self.scale_p_o ** self.scale_p_o_memory
-                    self.scale_p_o *= scale_p_o ** (1-self.scale_p_o_memory)
-                logger.debug('Scale P/O: %6.3g' % scale_p_o)
-            else:
-                self.scale_p_o = self.p.scale_probe_object
+            self._update_scale_p_o(new_ob_grad, new_pr_grad)
 
             ############################
             # Compute next conjugate
@@ -316,6 +315,70 @@ class ML(PositionCorrectionEngine):
         logger.info('  ....  in coefficient calculation: %.2f' % tc)
         return error_dct  # np.array([[self.ML_model.LL[0]] * 3])
 
+    def _get_smooth_gradient(self, data, sigma):
+        """
+        Smoothing preconditioner of the object gradient `data`.
+        """
+        return self.smooth_gradient(data)
+
+    def _replace_ob_grad(self):
+        """
+        Smooth the new object gradient and make it the current one.
+        Returns its squared norm and its dot product with the previous one.
+        """
+        new_ob_grad = self.ob_grad_new
+        # Smoothing preconditioner
+        if self.smooth_gradient:
+            self.smooth_gradient.sigma *= (1. - self.p.smooth_gradient_decay)
+            for name, s in new_ob_grad.storages.items():
+                s.data[:] = self._get_smooth_gradient(s.data, self.smooth_gradient.sigma)
+
+        norm = Cnorm2(new_ob_grad)
+        dot = np.real(Cdot(new_ob_grad, self.ob_grad))
+        self.ob_grad << new_ob_grad
+        return norm, dot
+
+    def _replace_pr_grad(self):
+        """
+        Apply the probe support to the new probe gradient and make it the
+        current one. Returns its squared norm and its dot product with the
+        previous one.
+        """
+        new_pr_grad = self.pr_grad_new
+        # probe support
+        if self.p.probe_update_start <= self.curiter:
+            # Apply probe support if needed
+            for name, s in new_pr_grad.storages.items():
+                self.support_constraint(s)
+        else:
+            new_pr_grad.fill(0.)
+
+        norm = Cnorm2(new_pr_grad)
+        dot = np.real(Cdot(new_pr_grad, self.pr_grad))
+        self.pr_grad << new_pr_grad
+        return norm, dot
+
+    def _update_scale_p_o(self, new_ob_grad, new_pr_grad):
+        """
+        Update the relative scale of probe and object gradients.
+        """
+        if self.p.scale_precond:
+            cn2_new_pr_grad = Cnorm2(new_pr_grad)
+            cn2_new_ob_grad = Cnorm2(new_ob_grad)
+            if cn2_new_pr_grad > 1e-5:
+                scale_p_o = (self.p.scale_probe_object * cn2_new_ob_grad
+                             / cn2_new_pr_grad)
+            else:
+                scale_p_o = self.p.scale_probe_object
+            if self.scale_p_o is None:
+                self.scale_p_o = scale_p_o
+            else:
+                self.scale_p_o = self.scale_p_o ** self.scale_p_o_memory
+                self.scale_p_o *= scale_p_o ** (1-self.scale_p_o_memory)
+            logger.debug('Scale P/O: %6.3g' % scale_p_o)
+        else:
+            self.scale_p_o = self.p.scale_probe_object
+
     def _post_iterate_update(self):
         """
         Enables modification at the end of each ML iteration.
@@ -378,6 +441,14 @@ class BaseModel(object):
         # Create working variables
         self.LL = 0.
 
+        # Stacks of views for batched processing, and views to process
+        # one at a time
+        self.stacks = []
+        self.single_views = []
+
+        # Far field waves of the last gradient step, by view or stack
+        self._far_field = {}
+        self._far_field_free = 0
 
     def prepare(self):
         # Useful quantities
@@ -398,6 +469,13 @@ class BaseModel(object):
             # TODO remove usage of .p. access
             self.regularizer.amplitude = self.p.reg_del2_amplitude * reg_rescale
 
+        if self.p.batch_size is None:
+            self.stacks = []
+            self.single_views = [v for v in self.di.views.values() if v.active]
+        else:
+            self.stacks, self.single_views = pod_stacks(
+                self.di.views.values(), self.p.batch_size, exit=False)
+
     def __del__(self):
         """
         Clean up routine
@@ -427,6 +505,67 @@ class BaseModel(object):
         """
         raise NotImplementedError
 
+    def _reset_far_field(self):
+        """
+        Drop the cached far field waves, e.g. at the start of a
+        gradient step.
+        """
+        self._far_field = {}
+        self._far_field_free = int(self.p.far_field_cache * 2**20)
+
+    def _keep_far_field(self, key, f):
+        """
+        Keep the far field waves `f` (array or dict of arrays) of view
+        or stack `key` for the line search, if they fit into the budget.
+        """
+        nbytes = sum(x.nbytes for x in f.values()) if isinstance(f, dict) else f.nbytes
+        if nbytes <= self._far_field_free:
+            self._far_field[key] = f
+            self._far_field_free -= nbytes
+
+    def _pop_far_field(self, key):
+        """
+        Cached far field waves of `key`, or None if they have to be
+        propagated again. Object and probe change after the line search,
+        hence the waves are used once only.
+        """
+        return self._far_field.pop(key, None)
+
+    def _stack_line_terms(self, stack, ob_h, pr_h):
+        """
+        Intensity model along direction h for all views of a stack,
+        as zeroth, first and second order terms.
+        """
+        pr = stack.get('pr_view')
+        ob = stack.get('ob_view')
+        pr_h = stack.get('pr_view', pr_h)
+        ob_h = stack.get('ob_view', ob_h)
+
+        f = self._pop_far_field(stack)
+        if f is None:
+            f = stack.fw(pr * ob)
+        a = stack.fw(pr * ob_h + pr_h * ob)
+        b = stack.fw(pr_h * ob_h)
+
+        A0 = u.abs2(f).astype(np.longdouble).sum(0)
+        A1 = (2 * np.real(f * a.conj()).astype(np.longdouble)).sum(0)
+        A2 = (2 * np.real(f * b.conj()).astype(np.longdouble)
+              + u.abs2(a).astype(np.longdouble)).sum(0)
+
+        if self.p.floating_intensities:
+            fic = np.array([self.float_intens_coeff[v.ID]
+                            for v in stack.views])[:, None, None]
+            A0 *= fic
+            A1 *= fic
+            A2 *= fic
+
+        return A0, A1, A2
+
+    def _store_errors(self, stack, LLL, npix, error_dct):
+        for diff_view, err in zip(stack.views, LLL):
+            diff_view.error = err
+            error_dct[diff_view.ID] = np.array([0, err / npix, 0])
+
 
 class GaussianModel(BaseModel):
     """
@@ -468,15 +607,19 @@ class GaussianModel(BaseModel):
         """
         self.ob_grad.fill(0.)
         self.pr_grad.fill(0.)
+        self._reset_far_field()
 
         # We need an array for MPI
         LL = np.array([0.])
         error_dct = {}
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of diffraction patterns
+        for stack in self.stacks:
+            LL += self._new_grad_stack(stack, error_dct)
+
+        # Outer loop: through remaining diffraction patterns
+        for diff_view in self.single_views:
+            dname = diff_view.ID
 
             # Weights and intensities for this view
             w = self.weights[diff_view]
@@ -492,6 +635,8 @@ class GaussianModel(BaseModel):
                 f[name] = pod.fw(pod.probe * pod.object)
                 Imodel += pod.downsample(u.abs2(f[name]))
 
+            self._keep_far_field(dname, f)
+
             # Floating intensity option
             if self.p.floating_intensities:
                 self.float_intens_coeff[dname] = ((w * Imodel * I).sum()
@@ -537,10 +682,13 @@ class GaussianModel(BaseModel):
         B = np.zeros((3,), dtype=np.longdouble)
         Brenorm = 1. / self.LL[0]**2
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of diffraction patterns
+        for stack in self.stacks:
+            B += self._poly_line_coeffs_stack(stack, ob_h, pr_h, Brenorm)
+
+        # Outer loop: through remaining diffraction patterns
+        for diff_view in self.single_views:
+            dname = diff_view.ID
 
             # Weights and intensities for this view
             w = self.weights[diff_view]
@@ -549,11 +697,15 @@ class GaussianModel(BaseModel):
             A0 = None
             A1 = None
             A2 = None
+            f_cached = self._pop_far_field(dname)
 
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
+                if f_cached is not None:
+                    f = f_cached[name]
+                else:
+                    f = pod.fw(pod.probe * pod.object)
                 a = pod.fw(pod.probe * ob_h[pod.ob_view]
                            + pr_h[pod.pr_view] * pod.object)
                 b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
@@ -593,6 +745,53 @@ class GaussianModel(BaseModel):
 
         return B
 
+    def _new_grad_stack(self, stack, error_dct):
+        """
+        Gradient contribution and errors of all views of a stack.
+        Returns the summed log-likelihood.
+        """
+        w = stack.diff(self.weights)
+        I = stack.diff()
+        pr = stack.get('pr_view')
+        ob = stack.get('ob_view')
+
+        f = stack.fw(pr * ob)
+        Imodel = u.abs2(f).sum(0)
+        self._keep_far_field(stack, f)
+
+        # Floating intensity option
+        if self.p.floating_intensities:
+            fic = ((w * Imodel * I).sum(axis=(-2, -1))
+                   / (w * Imodel**2).sum(axis=(-2, -1)))
+            Imodel *= fic[:, None, None]
+            for diff_view, c in zip(stack.views, fic):
+                self.float_intens_coeff[diff_view.ID] = c
+
+        DI = np.double(Imodel) - I
+
+        # Gradients computation
+        LLL = np.sum((w * DI**2).astype(np.float64), axis=(-2, -1))
+        xi = stack.bw((w * DI) * f)
+        stack.add('ob_view', 2. * xi * pr.conj(), self.ob_grad)
+        stack.add('pr_view', 2. * xi * ob.conj(), self.pr_grad)
+
+        self._store_errors(stack, LLL, np.prod(DI.shape[-2:]), error_dct)
+        return LLL.sum()
+
+    def _poly_line_coeffs_stack(self, stack, ob_h, pr_h, Brenorm):
+        """
+        Line minimization coefficients of all views of a stack.
+        """
+        w = stack.diff(self.weights)
+        A0, A1, A2 = self._stack_line_terms(stack, ob_h, pr_h)
+        A0 = np.double(A0) - stack.diff()
+
+        B = np.zeros((3,), dtype=np.longdouble)
+        B[0] = np.sum(w * A0**2) * Brenorm
+        B[1] = np.sum(w * (2 * A0 * A1)) * Brenorm
+        B[2] = np.sum(w * (A1**2 + 2*A0*A2)) * Brenorm
+        return B
+
 
 class PoissonModel(BaseModel):
     """
@@ -620,15 +819,19 @@ class PoissonModel(BaseModel):
         """
         self.ob_grad.fill(0.)
         self.pr_grad.fill(0.)
+        self._reset_far_field()
 
         # We need an array for MPI
         LL = np.array([0.])
         error_dct = {}
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of diffraction patterns
+        for stack in self.stacks:
+            LL += self._new_grad_stack(stack, error_dct)
+
+        # Outer loop: through remaining diffraction patterns
+        for diff_view in self.single_views:
+            dname = diff_view.ID
 
             # Mask and intensities for this view
             I = diff_view.data
@@ -644,6 +847,8 @@ class PoissonModel(BaseModel):
                 f[name] = pod.fw(pod.probe * pod.object)
                 Imodel += u.abs2(f[name])
 
+            self._keep_far_field(dname, f)
+
             # Floating intensity option
             if self.p.floating_intensities:
                 self.float_intens_coeff[dname] = I.sum() / Imodel.sum()
@@ -689,10 +894,13 @@ class PoissonModel(BaseModel):
         B = np.zeros((3,), dtype=np.longdouble)
         Brenorm = 1/(self.tot_measpts * self.LL[0])**2
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of diffraction patterns
+        for stack in self.stacks:
+            B += self._poly_line_coeffs_stack(stack, ob_h, pr_h, Brenorm)
+
+        # Outer loop: through remaining diffraction patterns
+        for diff_view in self.single_views:
+            dname = diff_view.ID
 
             # Weights and intensities for this view
             I = diff_view.data
@@ -701,11 +909,15 @@ class PoissonModel(BaseModel):
             A0 = None
             A1 = None
             A2 = None
+            f_cached = self._pop_far_field(dname)
 
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
+                if f_cached is not None:
+                    f = f_cached[name]
+                else:
+                    f = pod.fw(pod.probe * pod.object)
                 a = pod.fw(pod.probe * ob_h[pod.ob_view]
                            + pr_h[pod.pr_view] * pod.object)
                 b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
@@ -744,6 +956,57 @@ class PoissonModel(BaseModel):
 
         return B
 
+    def _new_grad_stack(self, stack, error_dct):
+        """
+        Gradient contribution and errors of all views of a stack.
+        Returns the summed log-likelihood.
+        """
+        I = stack.diff()
+        m = stack.mask()
+        pr = stack.get('pr_view')
+        ob = stack.get('ob_view')
+
+        f = stack.fw(pr * ob)
+        Imodel = u.abs2(f).sum(0)
+        self._keep_far_field(stack, f)
+
+        # Floating intensity option
+        if self.p.floating_intensities:
+            fic = I.sum(axis=(-2, -1)) / Imodel.sum(axis=(-2, -1))
+            Imodel *= fic[:, None, None]
+            for diff_view, c in zip(stack.views, fic):
+                self.float_intens_coeff[diff_view.ID] = c
+
+        Imodel += 1e-6
+        DI = m * (1. - I / Imodel)
+
+        # Gradients computation
+        LLbase = np.array([self.LLbase[v.ID] for v in stack.views])
+        LLL = LLbase + (m * (Imodel - I * np.log(Imodel))).sum(axis=(-2, -1)).astype(np.float64)
+        xi = stack.bw(DI * f)
+        stack.add('ob_view', 2 * xi * pr.conj(), self.ob_grad)
+        stack.add('pr_view', 2 * xi * ob.conj(), self.pr_grad)
+
+        self._store_errors(stack, LLL, np.prod(DI.shape[-2:]), error_dct)
+        return LLL.sum()
+
+    def _poly_line_coeffs_stack(self, stack, ob_h, pr_h, Brenorm):
+        """
+        Line minimization coefficients of all views of a stack.
+        """
+        I = stack.diff()
+        m = stack.mask()
+        A0, A1, A2 = self._stack_line_terms(stack, ob_h, pr_h)
+        A0 += 1e-6
+        DI = 1. - I/A0
+
+        LLbase = np.array([self.LLbase[v.ID] for v in stack.views])
+        B = np.zeros((3,), dtype=np.longdouble)
+        B[0] = np.sum(LLbase + (m * (A0 - I * np.log(A0))).sum(axis=(-2, -1)).astype(np.float64)) * Brenorm
+        B[1] = np.sum(m * A1 * DI) * Brenorm
+        B[2] = (np.sum(m * A2 * DI) + .5*np.sum(m * I * (A1/A0)**2.)) * Brenorm
+        return B
+
 
 class Regul_del2(object):
     """\
@@ -42,6 +42,7 @@ from .base import BaseEngine, DEFAULT_iter_info
 from . import projectional
 from . import stochastic
 from . import ML
+from . import LBFGS
 from . import Bragg3d_engines
 
 # dynamic load, maybe discarded in future
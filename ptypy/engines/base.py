@@ -13,7 +13,7 @@ import time
 from .. import utils as u
 from ..utils import parallel
 from ..utils.verbose import logger, headerline, log
-from .posref import AnnealingRefine, GridSearchRefine
+from .posref import AnnealingRefine, GridSearchRefine, GradientRefine
 
 __all__ = ['BaseEngine', 'Base3dBraggEngine', 'DEFAULT_iter_info', 'PositionCorrectionEngine']
 
@@ -333,7 +333,8 @@ class PositionCorrectionEngine(BaseEngine):
     [position_refinement.method]
     default = Annealing
     type = str
-    help = Annealing or GridSearch
+    help = Annealing, GridSearch or Gradient
+    doc = Annealing and GridSearch try integer pixel shifts and keep those that lower the error. Gradient estimates the subpixel shift of each frame from the gradient of its error with respect to the position, at the cost of a few propagations per frame instead of one per trial shift.
 
     [position_refinement.start]
     default = None
@@ -377,6 +378,13 @@ class PositionCorrectionEngine(BaseEngine):
     type = str
     help = Error metric, can choose between "fourier" and "photon"
     
+    [position_refinement.tolerance]
+    default = 0.01
+    type = float
+    lowlim = 0.0
+    help = Relative error change below which the Gradient method skips a frame
+    doc = Frames whose error changed by less than this fraction since their last refinement keep their position.
+
     [position_refinement.record]
     default = False
     type = bool
@@ -385,7 +393,8 @@ class PositionCorrectionEngine(BaseEngine):
 
     POSREF_ENGINES = {
         "Annealing": AnnealingRefine,
-        "GridSearch": GridSearchRefine
+        "GridSearch": GridSearchRefine,
+        "Gradient": GradientRefine
     }
 
     def __init__(self, ptycho_parent, pars):
@@ -66,6 +66,10 @@ class PositionRefine(object):
         af2 = np.zeros_like(di_view.data)
         for name, pod in di_view.pods.items():
             af2 += pod.downsample(u.abs2(pod.fw(pod.probe*obj)))
+        return self._fourier_metric(di_view, af2)
+
+    @staticmethod
+    def _fourier_metric(di_view, af2):
         return np.sum(di_view.pod.mask * (np.sqrt(af2) - np.sqrt(np.abs(di_view.data)))**2) / di_view.pod.mask.sum()
 
     def estimate_photon_metric(self, di_view, obj):
@@ -87,6 +91,10 @@ class PositionRefine(object):
         af2 = np.zeros_like(di_view.data)
         for name, pod in di_view.pods.items():
             af2 += pod.downsample(u.abs2(pod.fw(pod.probe*obj)))
+        return self._photon_metric(di_view, af2)
+
+    @staticmethod
+    def _photon_metric(di_view, af2):
         return (np.sum(di_view.pod.mask * (af2 - di_view.data)**2 / (di_view.data + 1.)) / np.prod(af2.shape))
 
     def cleanup(self):
@@ -320,3 +328,150 @@ class GridSearchRefine(PositionRefine):
             "page" : 64,
             "doi" : '10.1016/j.ultramic.2012.06.001',
             "comment" : 'Position Refinement using annealing algorithm'}
+
+
+class GradientRefine(PositionRefine):
+
+    def __init__(self, position_refinement_parameters, Cobj, metric="fourier"):
+        '''
+        Gradient Position Refinement.
+
+        Refines the positions by the least squares shift that moves the exit
+        waves towards the Fourier constrained ones, similar to:
+
+        M. Odstrcil, A. Menzel, M. Guizar-Sicairos,
+        Iterative least-squares solver for generalized maximum-likelihood ptychography,
+        Optics Express, Volume 26, 2018, Pages 3108-3123
+
+        Parameters
+        ----------
+        position_refinement_parameters : ptypy.utils.parameters.Param
+            The parameter tree for the refinement
+
+        Cobj : ptypy.core.classes.Container
+            The current pbject container object
+        metric : str
+            "fourier" or "photon"
+        '''
+        super(GradientRefine, self).__init__(position_refinement_parameters)
+
+        self.Cobj = Cobj  # take a reference here. It would be cool if we could make this read-only or something
+
+        # Updated before each iteration by self.update_constraints
+        self.max_shift_dist = None
+
+        # Choose metric for fourier error
+        if metric == "fourier":
+            self.metric = self._fourier_metric
+        elif metric == "photon":
+            self.metric = self._photon_metric
+        else:
+            raise NotImplementedError("Metric %s is currently not implemented" %metric)
+
+        # Original coordinates and the errors at the last refinement, per view
+        self.original_coords = {}
+        self.errors = {}
+
+    @staticmethod
+    def _far_field(di_view, obj):
+        f = {}
+        af2 = np.zeros_like(di_view.data)
+        for name, pod in di_view.pods.items():
+            f[name] = pod.fw(pod.probe * obj)
+            af2 += pod.downsample(u.abs2(f[name]))
+        return f, af2
+
+    def update_view_position(self, di_view):
+        '''
+        Refines the positions by the following algorithm:
+
+        Propagates the exit waves, replaces their Fourier magnitudes by the
+        measured ones and propagates back. The shift is the least squares
+        solution for the change of the exit waves to first order in the
+        position, which gives subpixel positions with a single pair of
+        propagations. Views whose error changed by less than the tolerance
+        since their last refinement are skipped. A view only moves to
+        another pixel if this lowers the fourier error.
+
+        Parameters
+        ----------
+        di_view : ptypy.core.classes.View
+            A diffraction view that we wish to refine.
+
+        Returns
+        -------
+        numpy.ndarray
+            A length 2 numpy array with the position increments for x and y co-ordinates respectively
+        '''
+        # there might be more than one object view
+        ob_view = di_view.pod.ob_view
+
+        initial_coord = ob_view.coord.copy()
+        initial_dcoord = ob_view.dcoord.copy()
+        original_coord = self.original_coords.setdefault(ob_view.ID, initial_coord)
+        psize = ob_view.psize.copy()
+
+        # if you cannot move far, do nothing
+        if np.max(psize) >= self.max_shift_dist:
+            return np.zeros((2,))
+
+        obj = ob_view.data
+        f, af2 = self._far_field(di_view, obj)
+        error = self.metric(di_view, af2)
+
+        # skip views whose error did not change
+        last = self.errors.get(di_view.ID)
+        if last is not None and np.abs(error - last) <= self.p.tolerance * np.abs(last):
+            return np.zeros((2,))
+        self.errors[di_view.ID] = error
+
+        # Least squares shift towards the exit waves with measured magnitudes
+        fm = np.where(di_view.pod.mask, np.sqrt(np.abs(di_view.data)) / (np.sqrt(af2) + 1e-10), 1.)
+        dobj = np.gradient(obj)
+        num = np.zeros((2,))
+        den = np.zeros((2,))
+        for name, pod in di_view.pods.items():
+            chi = pod.bw(pod.upsample(fm) * f[name]) - pod.probe * obj
+            for k in range(2):
+                g = pod.probe * dobj[k]
+                num[k] += np.vdot(g, chi).real
+                den[k] += np.vdot(g, g).real
+        # the step is damped by the part of the position error the object
+        # has absorbed, such that the steps accumulate over the iterations
+        delta = num / np.maximum(den, 1e-30) * psize
+
+        # Limit the step and the distance from the original position
+        norm = np.linalg.norm(delta)
+        if norm > self.max_shift_dist:
+            delta *= self.max_shift_dist / norm
+        new_coord = initial_coord + delta
+        norm = np.linalg.norm(new_coord - original_coord)
+        if norm > self.p.max_shift:
+            new_coord = original_coord + (new_coord - original_coord) * self.p.max_shift / norm
+
+        # Move view to new position
+        ob_view.coord = new_coord
+        ob_view.storage.update_views(ob_view)
+        if not np.all(ob_view.dcoord == initial_dcoord):
+            data = ob_view.data
+            # keep the new pixel only if slicing is fine and the error drops
+            if (not np.allclose(data.shape, ob_view.shape)
+                    or not self.metric(di_view, self._far_field(di_view, data)[1]) < error):
+                new_coord = initial_coord
+                ob_view.coord = new_coord
+                ob_view.storage.update_views(ob_view)
+
+        log(4, "Position correction: %s, coord: %s, delta: %s" % (di_view.ID, new_coord, new_coord - initial_coord))
+        return new_coord - initial_coord
+
+    @property
+    def citation_dictionary(self):
+        return {
+            "title" : 'Iterative least-squares solver for generalized maximum-likelihood ptychography',
+            "author" : 'Odstrcil M. et al.',
+            "journal" : 'Optics Express',
+            "volume" : 26,
+            "year" : 2018,
+            "page" : 3108,
+            "doi" : '10.1364/OE.26.003108',
+            "comment" : 'Position Refinement using the gradient of the error'}
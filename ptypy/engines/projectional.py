@@ -13,6 +13,7 @@ from .. import utils as u
 from ..utils.verbose import logger, log
 from ..utils import parallel
 from .utils import projection_update_generalized, log_likelihood
+from .utils import projection_update_generalized_stack, pod_stacks
 from . import register
 from .base import PositionCorrectionEngine
 from ..core.manager import Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull
@@ -106,6 +107,29 @@ class _ProjectionEngine(PositionCorrectionEngine):
     type = bool
     help = A switch for computing the log-likelihood error (this can impact the performance of the engine)
 
+    [batch_size]
+    default = None
+    type = int
+    lowlim = 1
+    help = Number of diffraction frames processed as one stack in the Fourier update
+    doc = If None, the Fourier update runs view by view through the pods. Otherwise, views of the same diffraction storage and geometry are propagated and projected in stacks of up to this many frames. Views that cannot be stacked, e.g. with resampling, still go through their pods.
+
+    [reduce_region]
+    default = False
+    type = bool
+    help = Only reduce the region of object and probe storages that is updated by any process
+    doc = The bounding box of the views of all active pods is agreed on across processes and only this region is summed with MPI. Outside of it, every process applies the inertia (and smoothing) to its own, identical copy, which costs no communication.
+
+    [reduce_nonblocking]
+    default = False
+    type = bool
+    help = Overlap the MPI reduction of each storage with the update of the next one
+
+    [reduce_fused]
+    default = False
+    type = bool
+    help = Reduce object (probe) and its normalisation in a single MPI message per storage
+
     """
 
     SUPPORTED_MODELS = [Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull]
@@ -131,6 +155,10 @@ class _ProjectionEngine(PositionCorrectionEngine):
 
         self.pbound = None
 
+        # Stacks of views for the batched Fourier update
+        self.stacks = []
+        self.single_views = None
+
         # Required to get proper normalization of object inertia
         # The actual value is computed in engine_prepare
         # Another possibility would be to use the maximum value of all probe storages.
@@ -182,6 +210,10 @@ class _ProjectionEngine(PositionCorrectionEngine):
         for name, s in self.ob_viewcover.storages.items():
             s.fill(s.get_view_coverage())
 
+        if self.p.batch_size is not None:
+            self.stacks, self.single_views = pod_stacks(
+                self.di.views.values(), self.p.batch_size)
+
     def engine_iterate(self, num=1):
         """
         Compute `num` iterations.
@@ -252,9 +284,22 @@ class _ProjectionEngine(PositionCorrectionEngine):
         DM Fourier constraint update (including DM step).
         """
         error_dct = {}
-        for name, di_view in self.di.views.items():
+        if self.p.batch_size is None:
+            views = self.di.views.values()
+        else:
+            for stack in self.stacks:
+                pbound = self.pbound_scan[stack.views[0].storage.label]
+                errs = projection_update_generalized_stack(
+                    stack, self._a, self._b, self._c, pbound,
+                    LL_error=self.p.compute_log_likelihood)
+                for di_view, err in zip(stack.views, np.array(errs).T):
+                    error_dct[di_view.ID] = err
+            views = self.single_views
+
+        for di_view in views:
             if not di_view.active:
                 continue
+            name = di_view.ID
             #pbound = self.pbound[di_view.storage.ID]
             pbound = self.pbound_scan[di_view.storage.label]
             """
@@ -344,8 +389,11 @@ class _ProjectionEngine(PositionCorrectionEngine):
         ob = self.ob
         ob_nrm = self.ob_nrm
 
+        groups = self._pods_by_storage(ob, 'ob_view')
+        regions = self._reduce_regions(ob, groups, 'ob_view') if self.p.reduce_region else {}
+
         # Fill container
-        if not parallel.master:
+        if not parallel.master and not regions:
             ob.fill(0.0)
             ob_nrm.fill(0.)
         else:
@@ -367,19 +415,25 @@ class _ProjectionEngine(PositionCorrectionEngine):
 
                 ob_nrm.storages[name].fill(cfact)
 
-        # DM update per node
-        for name, pod in self.pods.items():
-            if not pod.active:
-                continue
-            pod.object += pod.probe.conj() * pod.exit * pod.object_weight
-            ob_nrm[pod.ob_view] += u.abs2(pod.probe) * pod.object_weight
+                if not parallel.master:
+                    # Only this region is reduced
+                    s.data[regions[name]] = 0.
+                    ob_nrm.storages[name].data[regions[name]] = 0.
+
+        # DM update per node, the reduction of a storage
+        # starts as soon as its pods are done
+        requests = {}
+        for name, s in self.ob.storages.items():
+            for pod in groups[name]:
+                pod.object += pod.probe.conj() * pod.exit * pod.object_weight
+                ob_nrm[pod.ob_view] += u.abs2(pod.probe) * pod.object_weight
+            requests[name] = self._reduce(s, ob_nrm.storages[name], regions.get(name))
 
         # Distribute result with MPI
         for name, s in self.ob.storages.items():
             # Get the np arrays
             nrm = ob_nrm.storages[name].data
-            parallel.allreduce(s.data)
-            parallel.allreduce(nrm)
+            requests[name].wait()
             s.data /= nrm
 
             # A possible (but costly) sanity check would be as follows:
@@ -395,11 +449,14 @@ class _ProjectionEngine(PositionCorrectionEngine):
         pr_nrm = self.pr_nrm
         pr_buf = self.pr_buf
 
+        groups = self._pods_by_storage(pr, 'pr_view')
+        regions = self._reduce_regions(pr, groups, 'pr_view') if self.p.reduce_region else {}
+
         # Fill container
         # "cfact" fill
         # BE: was this asymmetric in original code
         # only because of the number of MPI nodes ?
-        if parallel.master:
+        if parallel.master or regions:
             for name, s in pr.storages.items():
                 # Instead of Npts_scan, the number of views should be considered
                 # Please note that a call to s.views may be
@@ -407,16 +464,23 @@ class _ProjectionEngine(PositionCorrectionEngine):
                 cfact = self.p.probe_inertia * len(s.views) / s.data.shape[0]
                 s.data[:] = cfact * s.data
                 pr_nrm.storages[name].fill(cfact)
+
+                if not parallel.master:
+                    # Only this region is reduced
+                    s.data[regions[name]] = 0.
+                    pr_nrm.storages[name].data[regions[name]] = 0.
         else:
             pr.fill(0.0)
             pr_nrm.fill(0.0)
 
-        # DM update per node
-        for name, pod in self.pods.items():
-            if not pod.active:
-                continue
-            pod.probe += pod.object.conj() * pod.exit * pod.probe_weight
-            pr_nrm[pod.pr_view] += u.abs2(pod.object) * pod.probe_weight
+        # DM update per node, the reduction of a storage
+        # starts as soon as its pods are done
+        requests = {}
+        for name, s in pr.storages.items():
+            for pod in groups[name]:
+                pod.probe += pod.object.conj() * pod.exit * pod.probe_weight
+                pr_nrm[pod.pr_view] += u.abs2(pod.object) * pod.probe_weight
+            requests[name] = self._reduce(s, pr_nrm.storages[name], regions.get(name))
 
         change = 0.
 
@@ -424,8 +488,7 @@ class _ProjectionEngine(PositionCorrectionEngine):
         for name, s in pr.storages.items():
             # MPI reduction of results
             nrm = pr_nrm.storages[name].data
-            parallel.allreduce(s.data)
-            parallel.allreduce(nrm)
+            requests[name].wait()
             s.data /= nrm
 
             # Apply probe support if requested
@@ -440,6 +503,56 @@ class _ProjectionEngine(PositionCorrectionEngine):
 
         return np.sqrt(change / len(pr.storages))
 
+    def _pods_by_storage(self, container, role):
+        """
+        Active pods grouped by the storage of their `role` view
+        (e.g. 'ob_view'), for each storage in `container`.
+        """
+        groups = {name: [] for name in container.storages}
+        for pod in self.pods.values():
+            if pod.active:
+                groups[getattr(pod, role).storageID].append(pod)
+        return groups
+
+    def _reduce_regions(self, container, groups, role):
+        """
+        Bounding box of the `role` views of the pods in `groups` across
+        all processes, as a tuple of slices for each storage in `container`.
+        """
+        names = list(container.storages.keys())
+        nd = container.storages[names[0]].ndim
+        low = np.full((len(names), nd), np.iinfo(np.int64).max, dtype=np.int64)
+        high = np.full((len(names), nd), np.iinfo(np.int64).min, dtype=np.int64)
+        for i, name in enumerate(names):
+            if groups[name]:
+                rec = container.view_records([getattr(pod, role) for pod in groups[name]])
+                low[i] = rec['dlow'][:, :nd].min(0)
+                high[i] = rec['dhigh'][:, :nd].max(0)
+        if parallel.MPIenabled:
+            parallel.allreduce(low, parallel.MPI.MIN)
+            parallel.allreduce(high, parallel.MPI.MAX)
+
+        regions = {}
+        for i, name in enumerate(names):
+            shape = container.storages[name].shape[1:]
+            lo = np.clip(low[i], 0, shape)
+            hi = np.clip(high[i], lo, shape)
+            regions[name] = (slice(None),) + tuple(slice(a, b) for a, b in zip(lo, hi))
+        return regions
+
+    def _reduce(self, s, nrm, region=None):
+        """
+        Start the MPI sum of storage `s` and its normalisation `nrm`,
+        optionally only in `region`. Returns the request to wait for,
+        which is already complete unless reduce_nonblocking is set.
+        """
+        region = Ellipsis if region is None else region
+        request = parallel.iallreduce([s.data[region], nrm.data[region]],
+                                      fuse=self.p.reduce_fused)
+        if not self.p.reduce_nonblocking:
+            request.wait()
+        return request
+
 
 class DMMixin:
 
@@ -242,6 +242,255 @@ def projection_update_generalized(diff_view, a, b, c, pbound=None):
     return err_fmag, err_exit
 
 
+class PodStack(object):
+    """
+    Diffraction views of the same storage and geometry, whose pods
+    are accessed as stacks of frames.
+
+    All views hold the same number of pods and, after sorting, the pods
+    at the same position refer to the same probe, object and exit
+    storages. The access methods return arrays of shape
+    ``(npods, nviews) + frame shape``.
+    """
+
+    def __init__(self, views):
+        """
+        Parameters
+        ----------
+        views : list of View
+            Diffraction views, as grouped by :py:func:`pod_stacks`
+        """
+        self.views = views
+        self.pods = [sorted(v.pods.values(), key=_pod_key) for v in views]
+        self.npods = len(self.pods[0])
+        self.geometry = self.pods[0][0].geometry
+        self.fw = self.geometry.propagator.fw
+        self.bw = self.geometry.propagator.bw
+        self.shape = tuple(views[0].shape)
+
+    def _views(self, name, m):
+        return [getattr(pods[m], name) for pods in self.pods]
+
+    @staticmethod
+    def _data(views, container):
+        if container is None:
+            return views[0].storage.data
+        return container.storages[views[0].storageID].data
+
+    def get(self, name, container=None):
+        """
+        Stack of the data of the pods' views `name` (one of 'pr_view',
+        'ob_view', 'ex_view', 'di_view', 'ma_view'), read from `container`
+        if given, otherwise from the views' own container.
+        """
+        out = None
+        for m in range(self.npods):
+            views = self._views(name, m)
+            data = self._data(views, container)
+            if out is None:
+                out = np.empty((self.npods, len(views)) + self.shape, dtype=data.dtype)
+            for i, v in enumerate(views):
+                out[m, i] = data[v.slice]
+        return out
+
+    def set(self, name, stack, container=None):
+        """
+        Write `stack` into the regions of the pods' views `name`.
+        """
+        for m in range(self.npods):
+            views = self._views(name, m)
+            data = self._data(views, container)
+            for v, d in zip(views, stack[m]):
+                data[v.slice] = d
+
+    def add(self, name, stack, container=None):
+        """
+        Add `stack` to the regions of the pods' views `name`. Overlapping
+        regions accumulate.
+        """
+        for m in range(self.npods):
+            views = self._views(name, m)
+            data = self._data(views, container)
+            for v, d in zip(views, stack[m]):
+                data[v.slice] += d
+
+    def diff(self, container=None):
+        """
+        Stack of diffraction data, shape ``(nviews,) + frame shape``.
+        """
+        data = self._data(self.views, container)
+        return np.array([data[v.slice] for v in self.views])
+
+    def mask(self):
+        """
+        Stack of masks, shape ``(nviews,) + frame shape``.
+        """
+        return self.get('ma_view')[0]
+
+
+def _pod_key(pod):
+    return (pod.pr_view.storageID, pod.ob_view.storageID,
+            pod.ex_view.storageID if pod.use_exit_container else None)
+
+
+def _stackable(diff_view, exit=True):
+    pods = list(diff_view.pods.values())
+    if not pods or diff_view.ndim != 2:
+        return False
+    geo = pods[0].geometry
+    if geo.resample != 1:
+        return False
+    for pod in pods:
+        if pod.is_empty or pod.geometry is not geo:
+            return False
+        if exit and not pod.use_exit_container:
+            return False
+        if pod.pr_view.ndim != 2 or pod.ob_view.ndim != 2:
+            return False
+        if pod.pr_view.storage.subpixel or pod.ob_view.storage.subpixel:
+            return False
+    return True
+
+
+def pod_stacks(diff_views, batch_size, exit=True):
+    """
+    Group active diffraction views into stacks for batched processing.
+
+    Parameters
+    ----------
+    diff_views : iterable of View
+        Diffraction views
+
+    batch_size : int
+        Maximum number of views per stack
+
+    exit : bool
+        If True, only views whose pods keep their exit waves in
+        a container are stacked
+
+    Returns
+    -------
+    stacks, singles : list of PodStack, list of View
+        The stacks and the active views that must be processed
+        one at a time through their pods
+    """
+    groups = {}
+    singles = []
+    for v in diff_views:
+        if not v.active:
+            continue
+        if not _stackable(v, exit):
+            singles.append(v)
+            continue
+        pods = list(v.pods.values())
+        key = (v.storageID, pods[0].geometry.ID,
+               tuple(sorted(_pod_key(pod) for pod in pods)))
+        groups.setdefault(key, []).append(v)
+
+    stacks = []
+    for views in groups.values():
+        for i in range(0, len(views), batch_size):
+            stacks.append(PodStack(views[i:i + batch_size]))
+    return stacks, singles
+
+
+def log_likelihood_stack(stack, f=None):
+    """
+    Log-likelihood errors for all views of a :py:class:`PodStack`,
+    as in :py:func:`log_likelihood`.
+
+    Parameters
+    ----------
+    stack : PodStack
+        Stack of diffraction views
+
+    f : ndarray, optional
+        Forward propagated product of probe and object, if already
+        available
+
+    Returns
+    -------
+    ll_error : ndarray
+        Log-likelihood error per view
+    """
+    I = stack.diff()
+    if f is None:
+        f = stack.fw(stack.get('pr_view') * stack.get('ob_view'))
+    LL = u.abs2(f).sum(0)
+    return (np.sum(stack.mask() * (LL - I)**2 / (I + 1.), axis=(-2, -1))
+            / np.prod(LL.shape[-2:]))
+
+
+def projection_update_generalized_stack(stack, a, b, c, pbound=None, LL_error=False):
+    """
+    Generalized projection update for all views of a :py:class:`PodStack`.
+    Equivalent to :py:func:`projection_update_generalized` for each view,
+    but with propagation and magnitude projection done on whole stacks.
+
+    Parameters
+    ----------
+    stack : PodStack
+        Stack of diffraction views
+
+    a,b,c : float
+        Coefficients for Overlap, Fourier and Fourier * Overlap constraints,
+        respectively
+
+    pbound : float, optional
+        Power bound, see :py:func:`projection_update_generalized`
+
+    LL_error : bool, optional
+        If True, also compute the log-likelihood error per view.
+
+    Returns
+    -------
+    err_fmag, err_phot, err_exit : ndarray
+        Errors per view; `err_phot` is zero unless `LL_error` is True.
+    """
+    I = stack.diff()
+    fmask = stack.mask().astype(I.dtype)
+    ex = stack.get('ex_view')
+    prob = stack.get('pr_view') * stack.get('ob_view')
+
+    # Propagate the exit waves
+    f = stack.fw((1 - c) * ex + c * prob)
+    af = np.sqrt(u.abs2(f).sum(0))
+    fmag = np.sqrt(np.abs(I))
+
+    # Fourier magnitudes deviations
+    fdev = af - fmag
+    err_fmag = np.sum(fmask * fdev**2, axis=(-2, -1)) / fmask.sum(axis=(-2, -1))
+
+    if LL_error:
+        # With c == 1, f is the propagated product of probe and object
+        err_phot = log_likelihood_stack(stack, f if c == 1 else None)
+    else:
+        err_phot = np.zeros_like(err_fmag)
+
+    # Same as in projection_update_generalized, per view
+    if pbound is None:
+        renorm = np.zeros_like(err_fmag)
+        upd = np.ones(err_fmag.shape, dtype=bool)
+    else:
+        upd = err_fmag > pbound
+        renorm = np.sqrt(pbound / np.where(upd, err_fmag, 1.)).astype(fmag.dtype)
+
+    df = np.empty_like(ex)
+    if upd.any():
+        sel = Ellipsis if upd.all() else upd
+        fm = (1 - fmask[sel]) + fmask[sel] * (fmag[sel] + fdev[sel] * renorm[sel, None, None]) / (af[sel] + 1e-10)
+        df[:, sel] = (b * stack.bw(fm * f[:, sel]) + a * prob[:, sel]
+                      - (a + b) * ex[:, sel])
+    if not upd.all():
+        df[:, ~upd] = (a + b * c) * (prob[:, ~upd] - ex[:, ~upd])
+
+    ex += df
+    stack.set('ex_view', ex)
+    err_exit = u.abs2(df).mean(axis=(-2, -1)).sum(0)
+
+    return err_fmag, err_phot, err_exit
+
+
 def projection_update_DM_AP(diff_view, alpha=1.0, pbound=None):
     """
     Linear interpolation between Difference Map algorithm (a,b,c = -1,1,2)
@@ -538,3 +787,14 @@ def Cdot(c1, c2):
         r += np.vdot(c1.storages[name].data.flat, c2.storages[name].data.flat)
     return r
 
+
+def Caxpy(a, c1, c2):
+    """
+    Add `a` times container `c1` to container `c2` in place. Unlike
+    ``c2 += a * c1``, this does not create a temporary container.
+
+    :param scalar a: Factor
+    :param Container c1, c2: Input and output
+    """
+    for name, s in c2.storages.items():
+        s.data += a * c1.storages[name].data
@@ -16,10 +16,10 @@ from ptypy.core.data import PtyScan
 from ptypy.experiment import register
 from ptypy.utils import parallel
 from ptypy.utils.verbose import log
+from ptypy.io import h5pool
 from ptypy.utils.array_utils import _translate_to_pix
 
 import os
-from multiprocessing import Pool, RawArray
 
 @register()
 class Hdf5Loader(PtyScan):
@@ -324,7 +324,7 @@ class Hdf5Loader(PtyScan):
         self.normalisation = None
         self.normalisation_laid_out_like_positions = None
         self.darkfield_laid_out_like_data = None
-        self.flatfield_field_laid_out_like_data = None
+        self.flatfield_laid_out_like_data = None
         self.mask_laid_out_like_data = None
         self.preview_indices = None
         self.framefilter = None
@@ -866,14 +866,112 @@ class Hdf5Loader(PtyScan):
             except:
                 pass
 
+_worker = {}
+
+
+def _init_fast_worker(sources, frames2d, swmr):
+    """
+    Initializer of the :py:class:`Hdf5LoaderFast` worker processes,
+    which open the datasets laid out like the data once.
+    """
+    _worker['files'] = []
+    _worker['datasets'] = {}
+    for name, (fname, key) in sources.items():
+        f = h5.File(fname, 'r', swmr=swmr)
+        _worker['files'].append(f)
+        _worker['datasets'][name] = f[key]
+    _worker['frames2d'] = frames2d
+    _worker['swmr'] = swmr
+
+
+def _read_fast_task(args):
+    """
+    Read a batch of frame ranges into the shared intensity and weight
+    buffers and correct for darkfield and flatfield if they exist.
+    """
+    intensities_name, weights_name, shape, intensities_dtype, weights_dtype, runs = args
+    datasets = _worker['datasets']
+    frames2d = _worker['frames2d']
+    if _worker['swmr']:
+        for dset in datasets.values():
+            dset.refresh()
+
+    shms = [h5pool.attach_shared(intensities_name)]
+    dest_intensities = np.ndarray(shape, dtype=intensities_dtype, buffer=shms[0].buf)
+    if weights_name is not None:
+        shms.append(h5pool.attach_shared(weights_name))
+        dest_weights = np.ndarray(shape, dtype=weights_dtype, buffer=shms[1].buf)
+    else:
+        dest_weights = None
+
+    try:
+        for head, first, tail, start, stop in runs:
+            src = head + (slice(first, first + stop - start),) + tail
+            dest = np.s_[start:stop]
+
+            # Copy intensities and weights
+            datasets['intensities'].read_direct(dest_intensities, src, dest)
+            if dest_weights is not None:
+                if 'mask' in datasets:
+                    datasets['mask'].read_direct(dest_weights, src, dest)
+                else:
+                    dest_weights[dest] = frames2d['mask']
+
+            # Correct darkfield
+            if 'darkfield' in datasets:
+                df = datasets['darkfield'][src]
+            else:
+                df = frames2d.get('darkfield')
+            if df is not None:
+                dest_intensities[dest] = Hdf5LoaderFast.subtract_dark(dest_intensities[dest], df)
+
+            # Correct flatfield
+            if 'flatfield' in datasets:
+                dest_intensities[dest] /= datasets['flatfield'][src]
+            elif 'flatfield' in frames2d:
+                dest_intensities[dest] /= frames2d['flatfield']
+    finally:
+        del dest_intensities, dest_weights
+        for shm in shms:
+            shm.close()
+
+
 @register()
 class Hdf5LoaderFast(Hdf5Loader):
+    """
+    Hdf5Loader reading the frames with a pool of worker processes.
+
+    The pool is started with the first load and kept for the remaining
+    scan. Its workers open the files themselves, read batches of
+    contiguous frame ranges and write into shared memory buffers,
+    which are reused between loads.
+
+    Defaults:
+
+    [name]
+    default = 'Hdf5LoaderFast'
+    type = str
+    help =
+
+    [processes]
+    default = None
+    type = int
+    help = Number of worker processes per rank
+    doc = If None, the available cores are divided equally among the MPI ranks.
+    """
+
     def __init__(self, pars=None, **kwargs):
         super().__init__(pars=pars, **kwargs)
-        self.cpu_count_per_rank = max(os.cpu_count() // parallel.size,1)
-        print("Rank %d has access to %d processes" %(parallel.rank, self.cpu_count_per_rank))
+        if self.p.processes is None:
+            self.cpu_count_per_rank = max(os.cpu_count() // parallel.size,1)
+        else:
+            self.cpu_count_per_rank = self.p.processes
+        log(3, "Rank %d has access to %d processes" %(parallel.rank, self.cpu_count_per_rank))
         self.intensities_array = None
         self.weights_array = None
+        self._pool = None
+        self._intensities_buffer = h5pool.SharedBuffer()
+        self._weights_buffer = h5pool.SharedBuffer()
 
     @staticmethod
     def subtract_dark(raw, dark):
@@ -885,109 +983,103 @@ class Hdf5LoaderFast(Hdf5Loader):
         corr[raw<dark] = 0
         return corr
 
+    def _start_pool(self):
+        """
+        Start the worker processes. Datasets laid out like the data are
+        opened by the workers, 2d frames are passed on directly.
+        """
+        sources = {'intensities': (self.p.intensities.file, self.p.intensities.key)}
+        frames2d = {}
+        for name, laid_out_like_data in [('mask', self.mask_laid_out_like_data),
+                                         ('darkfield', self.darkfield_laid_out_like_data),
+                                         ('flatfield', self.flatfield_laid_out_like_data)]:
+            dset = getattr(self, name)
+            if dset is None:
+                continue
+            if laid_out_like_data:
+                sources[name] = (self.p[name].file, self.p[name].key)
+            else:
+                frames2d[name] = np.asarray(dset[self.frame_slices])
+        self._pool = h5pool.process_pool(self.cpu_count_per_rank, initializer=_init_fast_worker,
+                                         initargs=(sources, frames2d, self._is_swmr))
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._intensities_buffer.close()
+        self._weights_buffer.close()
+
+    def _finalize(self):
+        super()._finalize()
+        self._close_pool()
+
     @staticmethod
-    def _init_worker(intensities_raw_array, weights_raw_array, 
-                     intensities_handle,
-                     weights_handle,
-                     darkfield_handle,
-                     flatfield_handle,
-                     intensities_dtype, weights_dtype,
-                     array_shape, 
-                     mask_laid_out_like_data,
-                     darkfield_laid_out_like_data,
-                     flatfield_laid_out_like_data):
-        Hdf5LoaderFast.worker_intensities_handle = intensities_handle
-        Hdf5LoaderFast.worker_intensities_array = np.frombuffer(intensities_raw_array, intensities_dtype, -1).reshape(array_shape)
-        Hdf5LoaderFast.worker_weights_handle = weights_handle
-        Hdf5LoaderFast.worker_weights_array = np.frombuffer(weights_raw_array, weights_dtype, -1).reshape(array_shape) if weights_raw_array else None
-        Hdf5LoaderFast.worker_mask_laid_out_like_data = mask_laid_out_like_data
-        Hdf5LoaderFast.worker_darkfield_handle = darkfield_handle
-        Hdf5LoaderFast.worker_darkfield_laid_out_like_data = darkfield_laid_out_like_data
-        Hdf5LoaderFast.worker_flatfield_handle = flatfield_handle
-        Hdf5LoaderFast.worker_flatfield_laid_out_like_data = flatfield_laid_out_like_data
+    def _frame_runs(src_slices):
+        """
+        Coalesce the per-frame selections `src_slices` into runs of
+        consecutive frames along the last scan axis. Returns lists
+        ``[head, first, tail, start, stop]``, such that the frames
+        ``src_slices[start:stop]`` are read with the selection
+        ``head + (slice(first, first + stop - start),) + tail``.
+        """
+        runs = []
+        for k, sel in enumerate(src_slices):
+            head, idx, tail = tuple(sel[:-3]), sel[-3], tuple(sel[-2:])
+            if runs:
+                r = runs[-1]
+                if r[0] == head and r[2] == tail and r[1] + (k - r[3]) == idx:
+                    r[4] = k + 1
+                    continue
+            runs.append([head, int(idx), tail, k, k + 1])
+        return runs
 
     @staticmethod
-    def _read_intensities_and_weights(slices):
-        '''
-        Copy intensities/weights into memory and correct for 
-        darkfield/flatfield if they exist
-        '''
-        indexed_frame_slices, dest_slices = slices
-        frame_slices = tuple(np.array(indexed_frame_slices)[-2:])
-
-        # Handle / target array for intensities
-        src_intensities  = Hdf5LoaderFast.worker_intensities_handle
-        dest_intensities = Hdf5LoaderFast.worker_intensities_array
-
-        # Handle / target array for mask/weights
-        src_weights  = Hdf5LoaderFast.worker_weights_handle
-        dest_weights = Hdf5LoaderFast.worker_weights_array
-        mask_laid_out_like_data = Hdf5LoaderFast.worker_mask_laid_out_like_data
-
-        # Handle for darkfield
-        src_darkfield = Hdf5LoaderFast.worker_darkfield_handle
-        darkfield_laid_out_like_data = Hdf5LoaderFast.worker_darkfield_laid_out_like_data
-
-        # Handle for flatfield
-        src_flatfield = Hdf5LoaderFast.worker_flatfield_handle
-        flatfield_laid_out_like_data = Hdf5LoaderFast.worker_flatfield_laid_out_like_data
-
-        # Copy intensities and weights
-        src_intensities.read_direct(dest_intensities, indexed_frame_slices, dest_slices)
-        if src_weights is not None:
-            if mask_laid_out_like_data:
-                src_weights.read_direct(dest_weights, indexed_frame_slices, dest_slices)
-            else:
-                src_weights.read_direct(dest_weights, frame_slices, dest_slices)
+    def _split_runs(runs, nframes, nbatches):
+        """
+        Split `runs` into `nbatches` batches of about the same number
+        of frames, cutting runs where necessary.
+        """
+        bounds = np.linspace(0, nframes, nbatches + 1).astype(int)
+        batches = [[] for i in range(nbatches)]
+        for head, first, tail, start, stop in runs:
+            while start < stop:
+                b = np.searchsorted(bounds, start, side='right') - 1
+                end = min(stop, bounds[b + 1])
+                batches[b].append((head, first, tail, start, int(end)))
+                first += end - start
+                start = int(end)
+        return [b for b in batches if b]
 
-        # Correct darkfield
-        if src_darkfield is not None:
-            if darkfield_laid_out_like_data:
-                df = src_darkfield[indexed_frame_slices].squeeze()
-            else:
-                df = src_darkfield[frame_slices].squeeze()
-            dest_intensities[dest_slices] = Hdf5LoaderFast.subtract_dark(dest_intensities[dest_slices], df)
+    def load_multiprocessing(self, src_slices):
+        if self._pool is None:
+            self._start_pool()
+        sh = (len(src_slices),) + self.frame_shape
 
-        # Correct flatfield
-        if src_flatfield is not None:
-            if flatfield_laid_out_like_data:
-                dest_intensities[dest_slices] /= src_flatfield[indexed_frame_slices].squeeze()
-            else:
-                dest_intensities[dest_slices] /= src_flatfield[frame_slices].squeeze()
-
-    def _setup_raw_intensity_buffer(self, dtype, sh):
-        npixels = int(np.prod(sh))
-        if (self.intensities_array is not None) and (self.intensities_array.size == npixels):
-            return
-        self._intensities_raw_array = RawArray(np.ctypeslib.as_ctypes_type(dtype), npixels)
-        self.intensities_array = np.frombuffer(self._intensities_raw_array, self.intensities_dtype, -1).reshape(sh)
-        
-    def _setup_raw_weights_buffer(self, dtype, sh):
-        npixels = int(np.prod(sh))
-        if (self.weights_array is not None) and (self.weights_array.size == npixels):
-            return
+        intensities = self._intensities_buffer.array(sh, self.intensities_dtype)
         if self.mask is not None:
-            self._weights_raw_array = RawArray(np.ctypeslib.as_ctypes_type(dtype), npixels)
-            self.weights_array = np.frombuffer(self._weights_raw_array, dtype, -1).reshape(sh)
+            weights = self._weights_buffer.array(sh, self.mask_dtype)
+            weights_name = self._weights_buffer.name
         else:
-            self._weights_raw_array = None
+            weights = None
+            weights_name = None
+
+        runs = self._frame_runs(src_slices)
+        batches = self._split_runs(runs, len(src_slices), self.cpu_count_per_rank)
+        self._pool.map(_read_fast_task,
+                       [(self._intensities_buffer.name, weights_name, sh,
+                         np.dtype(self.intensities_dtype).str, np.dtype(self.mask_dtype).str, b)
+                        for b in batches])
+
+        # One contiguous copy out of the shared buffers, which are
+        # overwritten by the next load
+        self.intensities_array = np.array(intensities)
+        if weights is not None:
+            self.weights_array = np.array(weights)
+        elif self.weights_array is None or self.weights_array.shape != sh:
             self.weights_array = np.ones(sh, dtype=int)
-
-    def load_multiprocessing(self, src_slices):
-        sh = (len(src_slices),) + self.frame_shape
-        self._setup_raw_intensity_buffer(self.intensities_dtype, sh)
-        self._setup_raw_weights_buffer(self.mask_dtype, sh)
-        dest_slices = [np.s_[i:i+1] for i in range(len(src_slices))]
-
-        with Pool(self.cpu_count_per_rank, 
-                  initializer=Hdf5LoaderFast._init_worker,
-                  initargs=(self._intensities_raw_array, self._weights_raw_array,
-                            self.intensities, self.mask, self.darkfield, self.flatfield,
-                            self.intensities_dtype, self.mask_dtype,
-                            sh, self.mask_laid_out_like_data,
-                            self.darkfield_laid_out_like_data, 
-                            self.flatfield_field_laid_out_like_data)) as p:
-            p.map(self._read_intensities_and_weights, zip(src_slices, dest_slices))
+        del intensities, weights
 
     def load_unmapped_raster_scan(self, indices):
 
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel reading of HDF5 datasets with a persistent process pool.
+
+Workers open the files themselves and write into a shared memory
+buffer owned by the calling process, such that no array data is
+pickled between processes.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import numpy as np
+import h5py
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+
+__all__ = ['SharedBuffer', 'H5ReadPool', 'frame_runs', 'attach_shared', 'process_pool']
+
+
+def process_pool(processes, **kwargs):
+    """
+    Process pool whose workers do not inherit the state of the calling
+    process. The pools are created while data loading threads run, and a
+    forked child could inherit a lock held by another thread (e.g. by
+    h5py or logging). Workers are therefore started from a fork server,
+    or spawned where no fork server is available. As for any such pool,
+    scripts that create it must guard their main code with
+    ``if __name__ == "__main__":``.
+
+    Parameters
+    ----------
+    processes : int
+        Number of worker processes.
+    kwargs :
+        Passed on to :py:class:`multiprocessing.pool.Pool`.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+    else:
+        ctx = multiprocessing.get_context('spawn')
+    return ctx.Pool(processes, **kwargs)
+
+
+def frame_runs(frames):
+    """
+    Split the sequence of integer `frames` into runs of consecutive
+    numbers.
+
+    Returns
+    -------
+    runs : list
+        ``(first, start, stop)`` tuples, such that ``frames[start:stop]``
+        equals ``range(first, first + stop - start)``.
+    """
+    frames = np.asarray(frames, dtype=int)
+    if len(frames) == 0:
+        return []
+    bounds = np.concatenate(([0], np.nonzero(np.diff(frames) != 1)[0] + 1, [len(frames)]))
+    return [(int(frames[b0]), int(b0), int(b1)) for b0, b1 in zip(bounds[:-1], bounds[1:])]
+
+
+def attach_shared(name):
+    """
+    Attach to the shared memory block `name` created by another process,
+    e.g. by a :py:class:`SharedBuffer`.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    # The creating process owns the block, keep the resource
+    # tracker of this process from unlinking it on exit.
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+class SharedBuffer(object):
+    """
+    Shared memory block that grows on demand and is reused
+    between reads.
+    """
+
+    def __init__(self):
+        self.shm = None
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def array(self, shape, dtype):
+        """
+        Array of `shape` and `dtype` on the shared memory block,
+        reallocating the block if it is too small. Arrays from
+        earlier calls are invalid after a reallocation.
+        """
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        if self.shm is None or self.shm.size < nbytes:
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    def close(self):
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                # Arrays on the block are still in use, the memory
+                # is released with the last of them
+                pass
+            self.shm.unlink()
+            self.shm = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _read_task(args):
+    """
+    Pool worker: read a batch of dataset selections into shared memory.
+    """
+    filename, shm_name, shape, dtype, reads = args
+    shm = attach_shared(shm_name)
+    try:
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        with h5py.File(filename, 'r') as f:
+            for path, source_sel, dest_sel in reads:
+                f[path].read_direct(out, source_sel, dest_sel)
+        del out
+    finally:
+        shm.close()
+
+
+class H5ReadPool(object):
+    """
+    Persistent pool of processes reading HDF5 selections in parallel.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.pool = process_pool(processes)
+        self.buffer = SharedBuffer()
+
+    def read(self, filename, shape, dtype, reads):
+        """
+        Read the selections `reads` of file `filename` into a new array.
+
+        Parameters
+        ----------
+        filename : str
+            HDF5 file, opened once per worker and call.
+        shape, dtype :
+            Shape and data type of the output array.
+        reads : list
+            ``(path, source_sel, dest_sel)`` tuples as for
+            :py:meth:`h5py.Dataset.read_direct`. The reads are split
+            into one batch per process.
+
+        Returns
+        -------
+        out : ndarray
+        """
+        shared = self.buffer.array(shape, dtype)
+        batches = [reads[i::self.processes] for i in range(self.processes)]
+        self.pool.map(_read_task, [(filename, self.buffer.name, shape, np.dtype(dtype).str, b)
+                                   for b in batches if b])
+        out = np.array(shared)
+        del shared
+        return out
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.buffer.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
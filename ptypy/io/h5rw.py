@@ -12,21 +12,102 @@ import numpy as np
 import time
 import os
 import glob
+import threading
+import contextlib
 from collections import OrderedDict
 import pickle
 from ..utils import Param
 from ..utils.verbose import logger
 
-__all__ = ['h5write', 'h5append', 'h5read', 'h5info', 'h5options']
+__all__ = ['h5write', 'h5append', 'h5read', 'h5info', 'h5options', 'h5options_local']
 
 h5options = dict(
     H5RW_VERSION='0.1',
     H5PY_VERSION=h5py.version.version,
     # UNSUPPORTED = 'ignore',
     UNSUPPORTED='fail',
-    SLASH_ESCAPE='_SLASH_')
+    SLASH_ESCAPE='_SLASH_',
+    # None, 'gzip', 'lzf' or the name of a filter in hdf5plugin, e.g. 'blosc'
+    COMPRESSION='gzip',
+    # gzip level or keyword arguments of the hdf5plugin filter
+    COMPRESSION_OPTS=None,
+    # Target chunk size for stacks of frames, in bytes
+    CHUNK_BYTES=2**20)
 STR_CONVERT = [type]
 
+BUILTIN_FILTERS = ['gzip', 'lzf', 'szip']
+
+_local = threading.local()
+
+
+def _option(key):
+    """
+    Value of option `key` of the current thread, see :py:func:`h5options_local`.
+    """
+    local = getattr(_local, 'options', {})
+    return local[key] if key in local else h5options.get(key)
+
+
+@contextlib.contextmanager
+def h5options_local(**kwargs):
+    """
+    Context in which the options `kwargs` replace those in
+    :py:data:`h5options` for the current thread only, e.g.
+    for writing in a background thread::
+
+        with h5options_local(UNSUPPORTED='ignore', COMPRESSION=None):
+            h5write(filename, content=content)
+    """
+    old = getattr(_local, 'options', {})
+    _local.options = dict(old, **kwargs)
+    try:
+        yield
+    finally:
+        _local.options = old
+
+
+def _filter_options(a):
+    """
+    Keyword arguments of :py:meth:`h5py.Group.create_dataset` for array `a`
+    according to the compression settings in :py:data:`h5options`,
+    see also :py:func:`h5options_local`.
+
+    Arrays with 3 or more dimensions are taken as stacks of frames and
+    are chunked along the frame axis, such that a chunk holds whole
+    frames and about ``CHUNK_BYTES`` bytes. If a single frame exceeds
+    ``CHUNK_BYTES``, as for large object storages, h5py picks the chunk
+    shape instead.
+    """
+    comp = _option('COMPRESSION')
+    opts = _option('COMPRESSION_OPTS')
+    if a.ndim == 0 or a.size == 0:
+        return {}
+
+    kwargs = {}
+    if comp is None:
+        pass
+    elif str(comp).lower() in BUILTIN_FILTERS:
+        kwargs['compression'] = str(comp).lower()
+        if opts is not None:
+            kwargs['compression_opts'] = opts
+    else:
+        try:
+            import hdf5plugin
+            filters = {k.lower(): v for k, v in vars(hdf5plugin).items()
+                       if isinstance(v, type) and hasattr(v, 'filter_id')}
+            kwargs.update(filters[str(comp).lower()](**(opts or {})))
+        except (ImportError, KeyError):
+            logger.warning('HDF5 filter %s is not available, using gzip instead.' % comp)
+            kwargs['compression'] = 'gzip'
+
+    if a.ndim >= 3:
+        frame = a.shape[-2:]
+        frame_bytes = int(np.prod(frame)) * a.dtype.itemsize
+        n = int(_option('CHUNK_BYTES') or 2**20) // max(frame_bytes, 1)
+        if n >= 1:
+            kwargs['chunks'] = (1,) * (a.ndim - 3) + (min(n, a.shape[-3]),) + frame
+    return kwargs
+
 
 def sdebug(f):
     """
@@ -108,7 +189,7 @@ def _h5write(filename, mode, *args, **kwargs):
     # @sdebug
     def _store_numpy(group, a, name, compress=True):
         if compress:
-            dset = group.create_dataset(name, data=a, compression='gzip')
+            dset = group.create_dataset(name, data=a, **_filter_options(a))
         else:
             dset = group.create_dataset(name, data=a)
         dset.attrs['type'] = 'array'
@@ -250,9 +331,9 @@ def _h5write(filename, mode, *args, **kwargs):
         elif type(a) in STR_CONVERT:
             dset = _store_string(group, str(a), name)
         else:
-            if h5options['UNSUPPORTED'] == 'fail':
+            if _option('UNSUPPORTED') == 'fail':
                 raise RuntimeError('Unsupported data type : %s' % type(a))
-            elif h5options['UNSUPPORTED'] == 'pickle':
+            elif _option('UNSUPPORTED') == 'pickle':
                 dset = _store_pickle(group, a, name)
             else:
                 dset = None
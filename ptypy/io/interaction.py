@@ -22,6 +22,7 @@ import re
 import json
 
 from ..utils.verbose import logger
+from ..utils.array_utils import preview_pyramid
 from .. import defaults_tree
 
 __all__ = ['Server', 'Client']
@@ -159,6 +160,35 @@ def numpy_zmq_recv(in_socket):
         return message
 
 
+# Version of the message layout on the state channel
+STATE_PROTOCOL = 1
+
+
+def state_zmq_send(out_socket, message, arrays):
+    """
+    Send `message`, which refers to the numpy `arrays` with
+    ``NPYARRAY[...]`` strings, such that it can be received with
+    :py:func:`numpy_zmq_recv`.
+
+    Unlike :py:func:`numpy_zmq_send`, the message is not searched for
+    arrays and contiguous arrays are sent without copying. Returns
+    when the buffers of the arrays are no longer used by zmq.
+    """
+    if not arrays:
+        out_socket.send_json({'hasarray': False, 'message': message})
+        return
+
+    arrays = [np.ascontiguousarray(a) for a in arrays]
+    arrayprops = [{'dtype': a.dtype.str, 'shape': a.shape} for a in arrays]
+    out_socket.send_json({'hasarray': True, 'message': message, 'arraylist': arrayprops}, flags=zmq.SNDMORE)
+    trackers = [out_socket.send(a, copy=False, track=True, flags=zmq.SNDMORE) for a in arrays[:-1]]
+    trackers.append(out_socket.send(arrays[-1], copy=False, track=True))
+
+    # The arrays may be modified as soon as we return
+    for tracker in trackers:
+        tracker.wait()
+
+
 @defaults_tree.parse_doc('io.interaction.server')
 class Server(object):
     """
@@ -268,6 +298,14 @@ class Server(object):
         # Object list, from which data can be transferred
         self.objects = dict()
 
+        # Arrays on the state channel, name -> [getter, version, preview],
+        # and sequence number of the last change
+        self.states = dict()
+        self.sequence = 0
+
+        # Preview pyramids of the state arrays, name -> (version, levels)
+        self._pyramids = dict()
+
         # Client names (might not be unique, but can be informative)
         self.names = {}
 
@@ -295,6 +333,7 @@ class Server(object):
                      'GET': self._cmd_queue_get,          # Send an object to the client (synchronous)
                      'GETNOW': self._cmd_get_now,         # Send an object to the client (asynchronous)
                      'SET': self._cmd_queue_set,          # Set an object sent by the client (synchronous)
+                     'STATE': self._cmd_queue_state,      # Send changed state arrays to the client (synchronous)
                      'PING': self._cmd_ping,              # Regular ping from client
                      'AVAIL': self._cmd_avail,            # Send list of available objects
                      'SHUTDOWN': self._cmd_shutdown}      # Shut down the server
@@ -555,6 +594,16 @@ class Server(object):
         self._need_process = True
         return {'status': 'ok'}
 
+    def _cmd_queue_state(self, ID, args):
+        """\
+        Process a STATE command (put it in the queue).
+        """
+        DEBUG('Queuing a STATE command')
+        self.queue.put({'ID': ID, 'cmd': 'STATE', 'ticket': args['ticket'],
+                        'known': args.get('known') or {}, 'preview': args.get('preview')})
+        self._need_process = True
+        return {'status': 'ok'}
+
     def _cmd_get_now(self, ID, args):
         """\
         Return the requested object to be sent immediately as a reply.
@@ -617,6 +666,20 @@ class Server(object):
 
             status = 'ok'
 
+            # This is the socket to send data to
+            out_socket = self.out_sockets[q['ID']][0]
+
+            # State arrays go through their own binary path
+            if q['cmd'] == 'STATE':
+                try:
+                    message, arrays = self._get_state(q['known'], q['preview'])
+                except:
+                    message, arrays = {'out': None, 'status': str(sys.exc_info()[0])}, []
+                message['ticket'] = ticket
+                state_zmq_send(out_socket, message, arrays)
+                self.queue.task_done()
+                continue
+
             # Process the command
             if q['cmd'] == 'GET':
                 try:
@@ -641,9 +704,6 @@ class Server(object):
             elif q['cmd'] in ['WARN', 'ERROR']:
                 out = q['str']
 
-            # This is the socket to send data to
-            out_socket = self.out_sockets[q['ID']][0]
-
             # Send the data
             try:
                 self._send(out_socket, {'ticket': ticket, 'status': status, 'out': out})
@@ -659,6 +719,79 @@ class Server(object):
             logger.debug('Time spent : %f' % (time.time() - t0))
         return
 
+    def _get_state(self, known, preview=None):
+        """
+        Collect the state arrays that changed since the versions
+        `known` of the client.
+
+        Parameters
+        ----------
+        known : dict
+            Version of each state array the client already has.
+        preview : int, optional
+            Display size of the client in pixels. Of state arrays with
+            previews, the coarsest level that still has at least this
+            many pixels along one of its last two axes is sent.
+
+        Returns
+        -------
+        message : dict
+            Reply with placeholders for the arrays.
+        arrays : list
+            The arrays to send.
+        """
+        arrays = []
+        states = {}
+        for name, (getter, version, has_preview) in self.states.items():
+            if version <= known.get(name, -1):
+                continue
+            level = 0
+            if preview and has_preview:
+                levels = self._preview_levels(name)
+                while (level + 1 < len(levels)
+                       and max(levels[level + 1].shape[-2:]) >= preview):
+                    level += 1
+                a = levels[level]
+            else:
+                a = getter()
+            states[name] = {'version': version, 'level': level,
+                            'data': u'NPYARRAY[%03d]' % len(arrays)}
+            arrays.append(np.asarray(a))
+        out = {'protocol': STATE_PROTOCOL, 'sequence': self.sequence, 'states': states}
+        return {'status': 'ok', 'out': out}, arrays
+
+    def _preview_levels(self, name):
+        """
+        Preview pyramid of state array `name`, computed once per version.
+        """
+        getter, version, _ = self.states[name]
+        cached = self._pyramids.get(name)
+        if cached is None or cached[0] != version:
+            cached = (version, preview_pyramid(getter()))
+            self._pyramids[name] = cached
+        return cached[1]
+
+    def register_state(self, name, getter, preview=False):
+        """
+        Exposes the array returned by the callable `getter` on the state
+        channel under `name`. Clients only receive it again after it has
+        been marked as changed with :py:meth:`new_state`.
+
+        If `preview` is True, clients may ask for a binned version of the
+        array matching their display size, see
+        :py:func:`~ptypy.utils.array_utils.preview_pyramid`.
+        """
+        self.states[name] = [getter, self.sequence, preview]
+        self._pyramids.pop(name, None)
+
+    def new_state(self, names=None):
+        """
+        Marks the state arrays `names` (all if None) as changed.
+        """
+        self.sequence += 1
+        for name in (self.states.keys() if names is None else names):
+            self.states[name][1] = self.sequence
+
     def register(self, obj, name):
         """\
         Exposes the content of an object for transmission and interaction.
@@ -1065,6 +1198,31 @@ class Client(object):
                 return ticket, self.data[ticket]
         return ticket
 
+    def get_state(self, known=None, preview=None, timeout=0, tag=None):
+        """
+        Requests the state arrays that the server marked as changed since
+        the versions in `known`, a dict ``{name: version}``. The data
+        arrives as a dict ``{'protocol', 'sequence', 'states'}``, with
+        ``states[name] = {'version': version, 'level': level, 'data': array}``
+        for the changed arrays only. With `preview`, arrays that have
+        previews are sent binned by ``2**level`` to about the display
+        size `preview` in pixels.
+        Returns the ticket number as :py:meth:`get`.
+        """
+        ticket = self.masterticket + 1
+        self.masterticket += 1
+        self.cmds.append({'ID': self.ID, 'cmd': 'STATE',
+                          'args': {'ticket': ticket, 'known': dict(known or {}), 'preview': preview}})
+        self.tickets[ticket] = 'pending'
+        self.pending.append(ticket)
+        if tag is not None:
+            self.tags_to_tickets[tag] = ticket
+            self.tickets_to_tags[ticket] = tag
+        if timeout > 0:
+            if self.wait(ticket, timeout):
+                return ticket, self.data[ticket]
+        return ticket
+
     def get_now(self, evalstr):
         """
         Synchronous get. May be dangerous, but should be safe for small objects like parameters.
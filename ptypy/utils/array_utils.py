@@ -15,7 +15,7 @@ from .math_utils import smooth_step
 __all__ = ['grids', 'switch_orientation', 'mirror',
            'crop_pad_symmetric_2d', 'crop_pad_axis', 'crop_pad',
            'pad_lr', 'zoom', 'shift_zoom', 'c_zoom',
-           'rebin', 'rebin_2d', 'rectangle', 'ellipsis']
+           'rebin', 'rebin_2d', 'preview_pyramid', 'rectangle', 'ellipsis']
 
 
 def switch_orientation(A, orientation, center=None):
@@ -150,6 +150,46 @@ def crop_pad_symmetric_2d(A, newshape, center=None):
     return A, c + low
 
 
+def preview_pyramid(A, min_size=64):
+    """
+    Multi-resolution previews of array `A` along the last 2 axes.
+
+    Each level is binned by 2 from the one before, after dropping an
+    odd last row or column. For complex `A`, the amplitude is averaged
+    and the phase is that of the summed complex values, such that
+    phase wrapping does not reduce the amplitude of the preview.
+
+    Parameters
+    ----------
+    A : array-like
+        Input array, must be at least two-dimensional.
+
+    min_size : int
+        No further level is made once one of the last two axes is
+        shorter than ``2 * min_size``.
+
+    Returns
+    -------
+    levels : list
+        Level ``k`` is binned by ``2**k``, ``levels[0]`` is `A` itself.
+    """
+    A = np.asarray(A)
+    levels = [A]
+    iscomplex = np.iscomplexobj(A)
+    amp = np.abs(A) if iscomplex else A
+    csum = A
+    while min(amp.shape[-2:]) >= 2 * min_size:
+        ny, nx = (np.array(amp.shape[-2:]) // 2) * 2
+        sh = amp.shape[:-2] + (ny // 2, 2, nx // 2, 2)
+        amp = amp[..., :ny, :nx].reshape(sh).mean(axis=(-3, -1))
+        if iscomplex:
+            csum = csum[..., :ny, :nx].reshape(sh).sum(axis=(-3, -1))
+            levels.append((amp * np.exp(1j * np.angle(csum))).astype(A.dtype))
+        else:
+            levels.append(amp)
+    return levels
+
+
 def rebin(a, *args, **kwargs):
     """
     Rebin ndarray data into a smaller ndarray of the same rank whose dimensions
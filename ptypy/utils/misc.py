@@ -8,6 +8,8 @@ This file is part of the PTYPY package.
     :license: see LICENSE for details.
 """
 import os
+import mmap
+import tempfile
 import numpy as np
 from functools import wraps
 from collections import OrderedDict
@@ -16,7 +18,7 @@ from collections import namedtuple
 __all__ = ['str2int', 'str2range', 'complex_overload', 'expect2',
            'expect3', 'keV2m', 'keV2nm', 'nm2keV', 'm2keV', 'clean_path',
            'unique_path', 'Table', 'all_subclasses', 'expectN', 'isstr',
-           'electron_wavelength']
+           'electron_wavelength', 'scratch_array', 'prefetch']
 
 
 def all_subclasses(cls, names=False):
@@ -340,6 +342,43 @@ def clean_path(filename):
     return filename
 
 
+def scratch_array(shape, dtype, directory=None):
+    """\
+    Uninitialised array memory-mapped to a scratch file.
+
+    The file is removed from `directory` right away, its disk space
+    is freed with the last reference to the array.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the array.
+    dtype : numpy.dtype
+        Data type of the array.
+    directory : str or None
+        Directory for the scratch file. If None, or if the array is
+        empty, an ordinary in-memory array is returned.
+    """
+    if directory is None or int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype)
+    directory = os.path.abspath(os.path.expanduser(directory))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with tempfile.TemporaryFile(dir=directory, prefix='ptypy_') as f:
+        return np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+
+
+def prefetch(a):
+    """\
+    Advise the operating system to start reading the memory-mapped
+    array `a` (see :py:func:`scratch_array`) into memory ahead of
+    access. Does nothing for in-memory arrays.
+    """
+    m = getattr(a, '_mmap', None)
+    if m is not None and hasattr(m, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+        m.madvise(mmap.MADV_WILLNEED)
+
+
 def electron_wavelength(electron_energy):
     """
     Calculate electron wavelength based on energy in keV:
@@ -26,8 +26,8 @@ MPIenabled = not (size == 1)
 master = (rank == 0)
 
 __all__ = ['MPIenabled', 'comm', 'MPI', 'master','barrier',
-           'LoadManager', 'loadmanager','allreduce','send','receive','bcast',
-           'bcast_dict', 'gather_dict', 'gather_list', 
+           'LoadManager', 'loadmanager','allreduce','iallreduce','send','receive','bcast',
+           'bcast_dict', 'scatter_dict', 'gather_dict', 'gather_list', 
            'MPIrand_normal', 'MPIrand_uniform','MPInoise2d']
 
 
@@ -197,6 +197,79 @@ def allreduce(a, op=None):
     else:
         return a
 
+class AllreduceRequest(object):
+    """
+    Handle for a non-blocking in-place sum, see :py:func:`iallreduce`.
+    """
+
+    def __init__(self, arrays, fuse=False):
+        self.arrays = arrays
+        self.requests = []
+        # (array, contiguous buffer or fused part) pairs to copy back
+        self._unpack = []
+        if not MPIenabled or not arrays:
+            return
+        if fuse:
+            dtype = np.result_type(*[np.empty(0, a.dtype).real.dtype for a in arrays])
+            buf = np.empty(sum(a.size * (2 if np.iscomplexobj(a) else 1) for a in arrays), dtype)
+            offset = 0
+            for a in arrays:
+                if np.iscomplexobj(a):
+                    part = buf[offset:offset + 2 * a.size].reshape(a.shape + (2,))
+                    part[..., 0] = a.real
+                    part[..., 1] = a.imag
+                else:
+                    part = buf[offset:offset + a.size].reshape(a.shape)
+                    part[...] = a
+                offset += part.size
+                self._unpack.append((a, part))
+            self.requests.append(comm.Iallreduce(MPI.IN_PLACE, buf))
+        else:
+            for a in arrays:
+                if a.flags.c_contiguous:
+                    buf = a
+                else:
+                    buf = np.ascontiguousarray(a)
+                    self._unpack.append((a, buf))
+                self.requests.append(comm.Iallreduce(MPI.IN_PLACE, buf))
+
+    def wait(self):
+        """
+        Wait for the reduction to complete and return the arrays.
+        """
+        if self.requests:
+            MPI.Request.Waitall(self.requests)
+            self.requests = []
+        for a, part in self._unpack:
+            if part.shape != a.shape:
+                a.real[...] = part[..., 0]
+                a.imag[...] = part[..., 1]
+            else:
+                a[...] = part
+        self._unpack = []
+        return self.arrays
+
+
+def iallreduce(arrays, fuse=False):
+    """
+    Start a non-blocking in-place sum of `arrays` over all processes.
+    The result is only valid after calling ``wait()`` on the returned
+    :py:class:`AllreduceRequest`.
+
+    Parameters
+    ----------
+    arrays : list of numpy-ndarray
+        The arrays to operate on. Non-contiguous arrays, e.g. a region
+        of a larger buffer, are reduced through a contiguous copy.
+
+    fuse : bool
+        If True, reduce all arrays in a single message. Complex arrays
+        are sent as pairs of real numbers, all arrays are sent in the
+        highest precision among them.
+    """
+    return AllreduceRequest(arrays, fuse)
+
+
 def allreduceC(c):
     """
     Performs MPI parallel ``allreduce`` with a sum as reduction
@@ -518,6 +591,86 @@ def bcast_dict(dct, keys='all', source=0):
                 out[k] = v
         return out
 
+def scatter_dict(dct, keys, source=0):
+    """
+    Scatters a dict `dct` from ``rank==source``, sending every node only
+    the items it accepts.
+
+    Unlike :any:`bcast_dict`, each value leaves the source node once.
+    If all values are arrays of the same shape and dtype (e.g. diffraction
+    frames), the items for each node are packed into one contiguous
+    buffer and distributed with a single ``Scatterv``, otherwise the
+    per-node dictionaries are pickled and scattered.
+
+    Parameters
+    ----------
+    dct : dict
+        Input dictionary, only relevant at ``rank==source``.
+
+    keys : list
+        Nested list such that ``keys[rank]`` holds the keys accepted by
+        the node of that rank, e.g. as returned by
+        :py:meth:`LoadManager.assign`. Must be the same on all nodes.
+
+    source : int
+        Rank of node / process which scatters.
+
+    Returns
+    -------
+    dct : dict
+        Dictionary with the items of `keys[rank]` that were in the source
+        dictionary. Packed values are views into a single receive buffer.
+
+    See also
+    --------
+    bcast_dict
+    gather_dict
+
+    """
+    if not MPIenabled:
+        return {k: dct[k] for k in keys[rank] if k in dct}
+
+    if rank == source:
+        parts = [[k for k in keys[r] if k in dct] for r in range(size)]
+        values = [dct[k] for part in parts for k in part]
+        v0 = values[0] if values else None
+        packable = bool(values) and all(
+            isinstance(v, np.ndarray) and v.shape == v0.shape and v.dtype == v0.dtype
+            for v in values)
+        if packable:
+            meta = (parts, v0.shape, v0.dtype.str)
+        else:
+            meta = (parts, None, None)
+        parts, shape, dtypestr = comm.bcast(meta, source)
+    else:
+        parts, shape, dtypestr = comm.bcast(None, source)
+
+    if shape is None:
+        # Pickled values, still only the node's own items are sent.
+        if rank == source:
+            return comm.scatter([{k: dct[k] for k in part} for part in parts], source)
+        else:
+            return comm.scatter(None, source)
+
+    # One MPI datatype element per item keeps the counts small
+    dtype = np.dtype(dtypestr)
+    itemtype = MPI.BYTE.Create_contiguous(int(np.prod(shape)) * dtype.itemsize)
+    itemtype.Commit()
+
+    counts = [len(part) for part in parts]
+    recv = np.empty((counts[rank],) + tuple(shape), dtype=dtype)
+    if rank == source:
+        send = np.empty((len(values),) + tuple(shape), dtype=dtype)
+        for i, v in enumerate(values):
+            send[i] = v
+        displs = np.cumsum([0] + counts[:-1]).tolist()
+        comm.Scatterv([send, counts, displs, itemtype], [recv, counts[rank], itemtype], source)
+    else:
+        comm.Scatterv(None, [recv, counts[rank], itemtype], source)
+    itemtype.Free()
+
+    return dict(zip(parts[rank], recv))
+
 def allgather_dict(dct):
     """
     Allgather dict in place.
@@ -129,9 +129,11 @@ class PlotClient(object):
     DATA = 2
     STOPPED = 0
 
-    def __init__(self, client_pars=None, in_thread=False):
+    def __init__(self, client_pars=None, in_thread=False, preview=None):
         """
         Create a client and attempt to connect to a running reconstruction server.
+        With `preview`, object and probe are received binned to about this
+        display size in pixels.
         """
         # This avoids circular imports.
         from ptypy.io.interaction import Client
@@ -145,6 +147,12 @@ class PlotClient(object):
         # When the data associated with a ticket arrives it is places in buffer[key].
         self.cmd_dct = {}
 
+        # Probe and object arrays come through the state channel, which
+        # only sends those that changed since the versions we have.
+        self.state_ticket = None
+        self.state_versions = {}
+        self.preview = preview
+
         # Initialize data containers. Here we use our own "Param" class, which adds attribute access
         # on top of dictionary.
         self.pr = Param()  # Probe
@@ -274,7 +282,6 @@ class PlotClient(object):
         for ID in ob_IDs:
             S = Param()
             self.ob[ID] = S
-            self.cmd_dct["Ptycho.obj.S['%s'].data" % str(ID)] = [None, S, 'data']
             self.cmd_dct["Ptycho.obj.S['%s'].psize" % str(ID)] = [None, S, 'psize']
             self.cmd_dct["Ptycho.obj.S['%s'].center" % str(ID)] = [None, S, 'center']
 
@@ -286,7 +293,6 @@ class PlotClient(object):
         for ID in pr_IDs:
             S = Param()
             self.pr[ID] = S
-            self.cmd_dct["Ptycho.probe.S['%s'].data" % str(ID)] = [None, S, 'data']
             self.cmd_dct["Ptycho.probe.S['%s'].psize" % str(ID)] = [None, S, 'psize']
             self.cmd_dct["Ptycho.probe.S['%s'].center" % str(ID)] = [None, S, 'center']
 
@@ -306,6 +312,7 @@ class PlotClient(object):
         """
         for cmd, item in self.cmd_dct.items():
             item[0] = self.client.get(cmd)
+        self.state_ticket = self.client.get_state(self.state_versions, preview=self.preview)
 
     def _store_data(self):
         """
@@ -314,10 +321,30 @@ class PlotClient(object):
         with self._lock:
             for cmd, item in self.cmd_dct.items():
                 item[1][item[2]] = self.client.data[item[0]]
+            state = self.client.data[self.state_ticket]
+            changed = False
+            if state is not None:
+                for name, st in state['states'].items():
+                    kind, _, ID = name.partition('/')
+                    buf = {'obj': self.ob, 'probe': self.pr}.get(kind)
+                    if buf is not None and ID in buf:
+                        buf[ID]['data'] = st['data']
+                        buf[ID]['binning'] = 2 ** st['level']
+                    self.state_versions[name] = st['version']
+                    changed = True
+            # Pixel size and center of binned previews
+            for S in list(self.ob.values()) + list(self.pr.values()):
+                b = S.get('binning', 1)
+                if b > 1 and S.get('psize') is not None:
+                    S['psize'] = np.asarray(S['psize']) * b
+                    S['center'] = (np.asarray(S['center']) - (b - 1) / 2.) / b
             # An extra step for the error. This should be handled differently at some point.
             # self.error = np.array([info['error'].sum(0) for info in self.runtime.iter_info])
-            self._new_data = True
+            complete = all('data' in S for S in list(self.ob.values()) + list(self.pr.values()))
+            if changed and complete:
+                self._new_data = True
         self.client.flush()
+        return changed
 
     def _loop(self):
         # Activate the client thread.
@@ -327,7 +354,9 @@ class PlotClient(object):
         while not self._stopping:
             self._request_data()
             self.client.wait()
-            self._store_data()
+            if not self._store_data():
+                # Nothing new on the server yet
+                time.sleep(0.1)
             # logger.info('New data arrived.')
         self.disconnect()
         self._has_stopped = True
@@ -659,7 +688,7 @@ class MPLClient(MPLplotter):
 
         super(MPLClient,self).__init__(pars = layout, in_thread = in_thread)
 
-        self.pc = PlotClient(client_pars,in_thread=in_thread)
+        self.pc = PlotClient(client_pars, in_thread=in_thread, preview=self.config.get('preview'))
         self.pc.start()
         self._framefile= None
         self.is_slave = is_slave
@@ -1,7 +1,7 @@
 import unittest
 import sys
 import numpy as np
-from ptypy.accelerate.base.address_manglers import BaseMangler, RandomIntMangler
+from ptypy.accelerate.base.address_manglers import BaseMangler, RandomIntMangler, GradientMangler
 
 COMPLEX_TYPE = np.complex64
 FLOAT_TYPE = np.float32
@@ -94,3 +94,15 @@ class AddressManglersTest(unittest.TestCase):
 
         np.testing.assert_array_equal(addr1, exp1)
         np.testing.assert_array_equal(addr2, exp2)
+
+    def test_gradient_mangler_get_positions(self):
+        # steps of at most 2 pixels, at most 3 pixels away from the original positions
+        mglr = GradientMangler(2, 0, 10, 0, decay=False, max_bound=3)
+        mglr.setup_shifts(0, nframes=4)
+        original = np.array([[5., 5.], [5., 5.], [4., 5.], [9., 9.]])
+        positions = np.array([[5., 5.], [7.5, 5.], [4., 5.], [9., 8.5]])
+        shifts = np.array([[0.3, -0.4], [1.5, 0.], [-3., -4.], [0., 1.]])
+        new_positions = mglr.get_positions(positions, shifts, original, 10, 9)
+
+        exp = np.array([[5.3, 4.6], [8., 5.], [2.8, 3.4], [9., 9.]])
+        np.testing.assert_allclose(new_positions, exp)
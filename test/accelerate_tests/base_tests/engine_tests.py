@@ -167,5 +167,158 @@ class MLSerialTest(unittest.TestCase):
                                            scanmodel="BlockFull", autosave=False, verbose_level="critical"))
         self.check_engine_output(out, plotting=False, debug=False)
 
+    def test_ML_serial_threads(self):
+        out = []
+        for numthreads in [1, 3]:
+            np.random.seed(0)
+            engine_params = u.Param()
+            engine_params.name = "ML_serial"
+            engine_params.numiter = 100
+            engine_params.floating_intensities = False
+            engine_params.reg_del2 = False
+            engine_params.reg_del2_amplitude = 1.
+            engine_params.scale_precond = False
+            engine_params.numthreads = numthreads
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out, plotting=False, debug=False)
+
+    def test_ML_serial_far_field_cache(self):
+        for numthreads in [1, 3]:
+            out = []
+            for cache in [0., 1024.]:
+                np.random.seed(0)
+                engine_params = u.Param()
+                engine_params.name = "ML_serial"
+                engine_params.numiter = 10
+                engine_params.floating_intensities = True
+                engine_params.numthreads = numthreads
+                engine_params.far_field_cache = cache
+                out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                               scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+            np.testing.assert_array_equal(out[0].obj.S["SMFG00"].data, out[1].obj.S["SMFG00"].data)
+            np.testing.assert_array_equal(out[0].probe.S["SMFG00"].data, out[1].probe.S["SMFG00"].data)
+
+    def test_ML_serial_poisson(self):
+        out = []
+        for eng in ["ML", "ML_serial"]:
+            np.random.seed(0)
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.ML_type = "poisson"
+            engine_params.numiter = 3
+            engine_params.floating_intensities = True
+            engine_params.probe_update_start = 0
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        LL = [[info["error"][1] for info in P.runtime["iter_info"]] for P in out]
+        np.testing.assert_allclose(LL[0], LL[1], rtol=1e-3)
+        self.check_engine_output(out, plotting=False, debug=False)
+
+    def test_ML_serial_euclid(self):
+        out = []
+        for numthreads in [1, 3]:
+            np.random.seed(0)
+            engine_params = u.Param()
+            engine_params.name = "ML_serial"
+            engine_params.ML_type = "euclid"
+            engine_params.numiter = 20
+            engine_params.numthreads = numthreads
+            engine_params.probe_update_start = 0
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        LL = [[info["error"][1] for info in P.runtime["iter_info"]] for P in out]
+        np.testing.assert_allclose(LL[0], LL[1], rtol=1e-4)
+        self.assertLess(LL[0][-1], LL[0][0] / 10)
+        np.testing.assert_allclose(out[0].obj.S["SMFG00"].data, out[1].obj.S["SMFG00"].data, atol=1e-4)
+
+    def test_ML_serial_position_refinement_gradient(self):
+        engine_params = u.Param()
+        engine_params.name = "ML_serial"
+        engine_params.numiter = 10
+        engine_params.position_refinement = u.Param()
+        engine_params.position_refinement.method = "Gradient"
+        engine_params.position_refinement.start = 2
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=False, verbose_level="critical")
+        LL = np.array([info["error"][1] for info in P.runtime["iter_info"]])
+        self.assertTrue(np.isfinite(LL).all())
+        self.assertLess(LL[-1], LL[0])
+
+    def test_LBFGS_serial(self):
+        out = []
+        for eng in ["LBFGS", "LBFGS_serial"]:
+            np.random.seed(0)
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.floating_intensities = True
+            engine_params.probe_update_start = 0
+            engine_params.bfgs_memory_size = 3
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        LL = [[info["error"][1] for info in P.runtime["iter_info"]] for P in out]
+        np.testing.assert_allclose(LL[0], LL[1], rtol=1e-2)
+        self.check_engine_output(out, plotting=False, debug=False)
+
+    def test_LBFGS_serial_smoothing(self):
+        out = []
+        for eng in ["LBFGS", "LBFGS_serial"]:
+            np.random.seed(0)
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.probe_update_start = 2
+            engine_params.smooth_gradient = 20
+            engine_params.smooth_gradient_decay = 1/10.
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        LL = [[info["error"][1] for info in P.runtime["iter_info"]] for P in out]
+        np.testing.assert_allclose(LL[0], LL[1], rtol=1e-2)
+        self.check_engine_output(out, plotting=False, debug=False)
+
+    def test_SGD_serial(self):
+        np.random.seed(0)
+        engine_params = u.Param()
+        engine_params.name = "SGD_serial"
+        engine_params.numiter = 10
+        engine_params.probe_update_start = 0
+        engine_params.batch_size = 32
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=False, verbose_level="critical")
+        LL = np.array([info["error"][1] for info in P.runtime["iter_info"]])
+        self.assertTrue(np.isfinite(LL).all())
+        self.assertTrue((np.diff(LL) < 0).all())
+        self.assertLess(LL[-1], LL[0] / 3)
+
+    def test_SGD_serial_scatter(self):
+        out = []
+        for scatter in [False, True]:
+            np.random.seed(0)
+            engine_params = u.Param()
+            engine_params.name = "SGD_serial"
+            engine_params.numiter = 3
+            engine_params.probe_update_start = 0
+            engine_params.scatter_po_update = scatter
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        LL = [[info["error"][1] for info in P.runtime["iter_info"]] for P in out]
+        np.testing.assert_allclose(LL[0], LL[1], rtol=1e-5)
+        np.testing.assert_allclose(out[0].obj.S["SMFG00"].data, out[1].obj.S["SMFG00"].data, atol=1e-5)
+
+    def test_SGD_serial_poisson(self):
+        np.random.seed(0)
+        engine_params = u.Param()
+        engine_params.name = "SGD_serial"
+        engine_params.numiter = 5
+        engine_params.ML_type = "poisson"
+        engine_params.floating_intensities = True
+        engine_params.batch_size = 50
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=False, verbose_level="critical")
+        LL = np.array([info["error"][1] for info in P.runtime["iter_info"]])
+        self.assertTrue(np.isfinite(LL).all())
+        self.assertLess(LL[-1], LL[0])
+
 if __name__ == "__main__":
     unittest.main()
@@ -441,6 +441,41 @@ class FourierUpdateKernelTest(unittest.TestCase):
 
         np.testing.assert_array_equal(f, expected_f, err_msg="the f array from the fmag_all_update kernesl isnot behaving as expected.")
 
+    def test_fourier_update(self):
+        '''
+        setup
+        '''
+        N = 10  # number of frames
+        nmodes = 3
+        B, C = 32, 24  # frame size
+        np.random.seed(0)
+        f = (np.random.rand(N * nmodes, B, C) + 1j * np.random.rand(N * nmodes, B, C)).astype(COMPLEX_TYPE)
+        fmag = (2 * np.random.rand(N, B, C)).astype(FLOAT_TYPE)
+        mask = (np.random.rand(N, B, C) > 0.2).astype(FLOAT_TYPE)
+        mask_sum = mask.sum(-1).sum(-1)
+        addr = np.zeros((N, nmodes, 5, 3), dtype=INT_TYPE)
+
+        FUK = FourierUpdateKernel(f, nmodes=nmodes)
+        FUK.allocate()
+        FUK.fchunk = 3  # more than one, not dividing N
+
+        '''
+        test
+        '''
+        for pbound in [0.0, 0.5, 100.]:
+            f_ref, f_fused = f.copy(), f.copy()
+            err_ref = np.zeros(N, dtype=FLOAT_TYPE)
+            err_fused = np.zeros(N, dtype=FLOAT_TYPE)
+            FUK.fourier_error(f_ref, addr, fmag, mask, mask_sum)
+            FUK.error_reduce(addr, err_ref)
+            FUK.fmag_all_update(f_ref, addr, fmag, mask, err_ref, pbound=pbound)
+            FUK.fourier_update(f_fused, addr, fmag, mask, mask_sum, err_fused, pbound=pbound)
+
+            np.testing.assert_allclose(err_fused, err_ref, rtol=1e-5,
+                                       err_msg="The error of the fused fourier_update does not match error_reduce")
+            np.testing.assert_allclose(f_fused, f_ref, rtol=1e-5, atol=1e-6,
+                                       err_msg="The fused fourier_update does not match fmag_all_update")
+
     # TODO: This test needs to be redesigne to NOT use components from the archive test
     @unittest.skip('This test needs to be redone')
     def test_log_likelihood(self):
@@ -273,6 +273,72 @@ class GradientDescentKernelTest(unittest.TestCase):
                                       err_msg="LogLikelihood error has not been updated as expected")
         return
 
+    def prepare_line(self):
+        """
+        Random double precision model and search directions, and the
+        model intensities along the line.
+        """
+        rng = np.random.default_rng(0)
+        N, nmodes, A = 3, 2, 8
+        sh = (N * nmodes, A, A)
+        f, a, b = [(rng.normal(size=sh) + 1j * rng.normal(size=sh)) * 3 for i in range(3)]
+        I = np.round(rng.uniform(0, 40, size=(N, A, A)))
+        w = (rng.uniform(size=(N, A, A)) > 0.1).astype(np.float64)
+        fic = rng.uniform(0.8, 1.2, size=(N,))
+        addr = np.zeros((N, nmodes, 5, 3), dtype=INT_TYPE)
+        Q = lambda t: (np.abs(f + t * a + t**2 * b)**2).reshape(N, nmodes, A, A).sum(1) * fic[:, None, None]
+        return f, a, b, I, w, fic, addr, Q
+
+    def check_line_coeffs(self, B, LL):
+        # B holds value, slope and half the curvature of LL at t=0
+        dt = 1e-4
+        np.testing.assert_allclose(B[0], LL(0), rtol=1e-6)
+        np.testing.assert_allclose(B[1], (LL(dt) - LL(-dt)) / (2 * dt), rtol=1e-4)
+        np.testing.assert_allclose(B[2], (LL(dt) - 2 * LL(0) + LL(-dt)) / (2 * dt**2), rtol=1e-3)
+
+    def test_fill_b_poisson(self):
+        f, a, b, I, w, fic, addr, Q = self.prepare_line()
+        GDK = GradientDescentKernel(f, addr.shape[1])
+        GDK.allocate()
+        B = np.zeros((3,), dtype=np.float64)
+        GDK.make_a012(f, a, b, addr, I, fic)
+        GDK.fill_b_poisson(addr, 1., w, I, B)
+        self.check_line_coeffs(B, lambda t: np.sum(w * (Q(t) + 1e-6 - I * np.log(Q(t) + 1e-6))))
+
+    def test_fill_b_euclid(self):
+        f, a, b, I, w, fic, addr, Q = self.prepare_line()
+        GDK = GradientDescentKernel(f, addr.shape[1])
+        GDK.allocate()
+        B = np.zeros((3,), dtype=np.float64)
+        GDK.make_a012(f, a, b, addr, I, fic)
+        GDK.fill_b_euclid(addr, 1., w, I, B)
+        self.check_line_coeffs(B, lambda t: np.sum(w * (np.sqrt(Q(t)) - np.sqrt(I))**2))
+
+    def test_main_poisson(self):
+        f, a, b, I, w, fic, addr, Q = self.prepare_line()
+        GDK = GradientDescentKernel(f, addr.shape[1])
+        GDK.allocate()
+        aux = f.copy()
+        GDK.make_model(aux, addr)
+        GDK.floating_intensity_sum(addr, I, fic)
+        GDK.main_poisson(aux, addr, w, I)
+        Im = (np.abs(f)**2).reshape(3, 2, 8, 8).sum(1)
+        exp_fic = I.sum((-2, -1)) / Im.sum((-2, -1))
+        Im = Im * exp_fic[:, None, None] + 1e-6
+        np.testing.assert_allclose(fic, exp_fic, rtol=1e-12)
+        np.testing.assert_allclose(GDK.npy.LLerr, w * (Im - I * np.log(Im)), rtol=1e-10)
+        np.testing.assert_allclose(aux, (f.reshape(3, 2, 8, 8) * (w * (1 - I / Im))[:, None]).reshape(f.shape), rtol=1e-10)
+
+    def test_main_euclid(self):
+        f, a, b, I, w, fic, addr, Q = self.prepare_line()
+        GDK = GradientDescentKernel(f, addr.shape[1])
+        GDK.allocate()
+        aux = f.copy()
+        GDK.make_model(aux, addr)
+        GDK.main_euclid(aux, addr, w, I)
+        A = np.sqrt((np.abs(f)**2).reshape(3, 2, 8, 8).sum(1))
+        np.testing.assert_allclose(GDK.npy.LLerr, w * (A - np.sqrt(I))**2, rtol=1e-10)
+        np.testing.assert_allclose(aux, (f.reshape(3, 2, 8, 8) * (w * (1 - np.sqrt(I) / A))[:, None]).reshape(f.shape), rtol=1e-6)
 
 
 if __name__ == '__main__':
@@ -508,5 +508,95 @@ class PoUpdateKernelTest(unittest.TestCase):
         np.testing.assert_array_equal(object_norm, expected_object_norm,
                                       err_msg="The object norm has not been updated as expected")
 
+    def prepare_random_arrays(self, scan_pts=6, num_pr_modes=2, num_ob_modes=2, frame_size=8, step=3):
+        rng = np.random.default_rng(1)
+        fsh = (frame_size, frame_size)
+        osh = (frame_size + step * (scan_pts - 1) + 2,) * 2
+        num_modes = num_pr_modes * num_ob_modes
+
+        def crandn(*shape):
+            return (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(COMPLEX_TYPE)
+
+        probe = crandn(num_pr_modes, *fsh)
+        object_array = crandn(num_ob_modes, *osh)
+        exit_wave = crandn(scan_pts ** 2 * num_modes, *fsh)
+        auxiliary_wave = crandn(scan_pts ** 2 * num_modes, *fsh)
+
+        Y, X = np.indices((scan_pts, scan_pts)) * step + 1
+        addr = np.zeros((scan_pts ** 2, num_modes, 5, 3), dtype=INT_TYPE)
+        exit_idx = 0
+        for position_idx, (ypos, xpos) in enumerate(zip(Y.flat, X.flat)):
+            mode_idx = 0
+            for pr_mode in range(num_pr_modes):
+                for ob_mode in range(num_ob_modes):
+                    addr[position_idx, mode_idx] = np.array([[pr_mode, 0, 0],
+                                                             [ob_mode, ypos, xpos],
+                                                             [exit_idx, 0, 0],
+                                                             [0, 0, 0],
+                                                             [0, 0, 0]], dtype=INT_TYPE)
+                    mode_idx += 1
+                    exit_idx += 1
+
+        return addr, object_array, probe, exit_wave, auxiliary_wave
+
+    def check_scatter(self, method, *args, **kwargs):
+        """
+        Runs `method` with and without scatter on copies of the arrays and
+        checks that all outputs are identical.
+        """
+        results = []
+        for scatter in [False, True]:
+            POUK = PoUpdateKernel(scatter=scatter)
+            # small chunks to exercise the batching
+            POUK.scatter_chunk = 100
+            arrays = [a.copy() if isinstance(a, np.ndarray) else a for a in args]
+            getattr(POUK, method)(*arrays, **kwargs)
+            results.append(arrays)
+        for loop_out, scatter_out in zip(*results):
+            if isinstance(loop_out, np.ndarray):
+                np.testing.assert_array_equal(scatter_out, loop_out,
+                                              err_msg="Scatter %s does not match the loop version" % method)
+
+    def test_ob_update_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays()
+        obn = np.ones(ob.shape, dtype=FLOAT_TYPE)
+        self.check_scatter('ob_update', addr, ob, obn, pr, ex)
+
+    def test_pr_update_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays()
+        prn = np.ones(pr.shape, dtype=FLOAT_TYPE)
+        self.check_scatter('pr_update', addr, pr, prn, ob, ex)
+
+    def test_ob_update_ML_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays()
+        self.check_scatter('ob_update_ML', addr, ob, pr, ex, fac=2.0)
+
+    def test_pr_update_ML_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays()
+        self.check_scatter('pr_update_ML', addr, pr, ob, ex, fac=2.0)
+
+    def test_ob_update_local_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays(scan_pts=1)
+        prn = np.zeros((1,) + pr.shape[-2:], dtype=FLOAT_TYPE)
+        PoUpdateKernel().pr_norm_local(addr, pr, prn)
+        self.check_scatter('ob_update_local', addr, ob, pr, ex, aux, prn, a=0.1, b=0.9)
+
+    def test_pr_update_local_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays(scan_pts=1)
+        obn = np.zeros((1,) + pr.shape[-2:], dtype=FLOAT_TYPE)
+        PoUpdateKernel().ob_norm_local(addr, ob, obn)
+        self.check_scatter('pr_update_local', addr, pr, ob, ex, aux, obn, obn.max(), a=0.1, b=0.9)
+
+    def test_ob_norm_local_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays(scan_pts=1)
+        obn = np.zeros((1,) + pr.shape[-2:], dtype=FLOAT_TYPE)
+        self.check_scatter('ob_norm_local', addr, ob, obn)
+
+    def test_pr_norm_local_scatter(self):
+        addr, ob, pr, ex, aux = self.prepare_random_arrays(scan_pts=1)
+        prn = np.zeros((1,) + pr.shape[-2:], dtype=FLOAT_TYPE)
+        self.check_scatter('pr_norm_local', addr, pr, prn)
+
+
 if __name__ == '__main__':
     unittest.main()
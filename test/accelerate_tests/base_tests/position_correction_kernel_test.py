@@ -321,6 +321,53 @@ class PositionCorrectionKernelTest(unittest.TestCase):
         np.testing.assert_array_equal(expected_ferr, ferr, err_msg="The fourier_update_kernel.error_reduce"
                                                                    "is not behaving as expected.")
 
+    def test_shift_estimate(self):
+        '''
+        setup
+        '''
+        N = 3  # number of frames
+        B = 32  # frame size
+        H = 64  # object size
+        true_shifts = np.array([[0.3, -0.2], [-0.4, 0.1], [0.0, 0.25]])
+
+        # smooth object and probe
+        Y, X = np.mgrid[:H, :H].astype(float)
+        obj = np.exp(1j * (np.sin(2 * np.pi * Y / 23.) + np.cos(2 * np.pi * X / 17.)))
+        Y, X = np.mgrid[:B, :B] - B / 2.
+        probe = np.exp(-(X ** 2 + Y ** 2) / (2 * 6. ** 2)).astype(COMPLEX_TYPE)[None]
+
+        addr = np.zeros((N, 1, 5, 3), dtype=INT_TYPE)
+        for i in range(N):
+            addr[i, 0] = [[0, 0, 0], [0, 10 + 5 * i, 12 + 3 * i], [i, 0, 0], [i, 0, 0], [0, 0, 0]]
+
+        # intensities measured at the shifted positions
+        ky = np.fft.fftfreq(H).reshape(-1, 1)
+        kx = np.fft.fftfreq(H).reshape(1, -1)
+        I = np.zeros((N, B, B), dtype=FLOAT_TYPE)
+        for i, (dy, dx) in enumerate(true_shifts):
+            shifted = np.fft.ifft2(np.fft.fft2(obj) * np.exp(2j * np.pi * (ky * dy + kx * dx)))
+            y, x = addr[i, 0, 1, 1:]
+            I[i] = np.abs(np.fft.fft2(shifted[y:y + B, x:x + B] * probe[0])) ** 2
+        w = np.ones_like(I)
+
+        self.params.method = "Gradient"
+        aux = np.zeros((N, B, B), dtype=COMPLEX_TYPE)
+        daux = np.zeros_like(aux)
+        PCK = PositionCorrectionKernel(aux, 1, self.params, self.resolution)
+        PCK.allocate()
+        ob = obj.astype(COMPLEX_TYPE)[None]
+        PCK.build_aux(aux, addr, ob, probe)
+        aux[:] = np.fft.fft2(aux)
+        for axis, dpr in enumerate(PCK.probe_derivative(probe)):
+            PCK.build_aux(daux, addr, ob, dpr)
+            daux[:] = np.fft.fft2(daux)
+            PCK.intensity_derivative(aux, daux, addr, axis)
+        shifts = np.zeros((N, 2))
+        PCK.shift_estimate(aux, addr, I, w, shifts)
+
+        np.testing.assert_allclose(shifts, true_shifts, atol=0.05,
+                                   err_msg="The shift estimate does not recover the shifts of the measured frames")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,117 @@
+"""
+Test for the serial projectional engines.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import unittest
+from unittest import mock
+
+from test import utils as tu
+from ptypy import utils as u
+from ptypy.utils import parallel
+import ptypy
+ptypy.load_gpu_engines("serial")
+import tempfile
+import shutil
+import numpy as np
+
+class ProjectionalSerialTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="projectional_serial_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def run_engine(self, name, **kwargs):
+        np.random.seed(0)
+        engine_params = u.Param()
+        engine_params.name = name
+        engine_params.numiter = 5
+        engine_params.probe_update_start = 2
+        engine_params.update(kwargs)
+        return tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                   scanmodel="BlockFull", autosave=False, verbose_level="critical")
+
+    def check_equal(self, P1, P2, atol=1e-5):
+        for name, s in P1.obj.storages.items():
+            np.testing.assert_allclose(s.data, P2.obj.storages[name].data, rtol=1e-5, atol=atol)
+        for name, s in P1.probe.storages.items():
+            np.testing.assert_allclose(s.data, P2.probe.storages[name].data, rtol=1e-5, atol=atol)
+
+    def test_reduce_options(self):
+        for name in ["DM_serial", "RAAR_serial", "DM_serial_stream"]:
+            P1 = self.run_engine(name)
+            P2 = self.run_engine(name, reduce_region=True, reduce_nonblocking=True, reduce_fused=True)
+            self.check_equal(P1, P2)
+
+    def test_threads(self):
+        for name in ["DM_serial", "RAAR_serial", "DM_serial_stream"]:
+            P1 = self.run_engine(name, numthreads=1)
+            P2 = self.run_engine(name, numthreads=3)
+            # the threads sum their frames in a different order
+            self.check_equal(P1, P2, atol=5e-3)
+
+    def expected_regions(self, eng, container, col):
+        regions = {}
+        for prep in eng.diff_info.values():
+            ID = prep.poe_IDs[col]
+            sh = np.array(eng.ex.S[prep.poe_IDs[2]].shape[-2:])
+            pos = prep.addr[:, :, col, 1:].reshape(-1, 2)
+            lo, hi = regions.get(ID, (pos.min(0), pos.max(0) + sh))
+            regions[ID] = (np.minimum(lo, pos.min(0)), np.maximum(hi, pos.max(0) + sh))
+        out = {}
+        for ID, (lo, hi) in regions.items():
+            shape = container.S[ID].shape[1:]
+            out[ID] = (slice(None),) + tuple(slice(max(a, 0), min(b, n))
+                                             for a, b, n in zip(lo, hi, shape))
+        return out
+
+    def test_reduce_storages(self):
+        P = self.run_engine("DM_serial", reduce_region=True)
+        eng = P.engines["engine00"]
+        # A few frames only, such that the object region is not the whole storage
+        for prep in eng.diff_info.values():
+            prep.addr = prep.addr[:3]
+
+        class Request:
+            waited = False
+
+            def wait(self):
+                self.waited = True
+
+        calls = []
+
+        def iallreduce(arrays, fuse=False):
+            calls.append(([a.shape for a in arrays], fuse))
+            return Request()
+
+        with mock.patch.object(parallel, 'iallreduce', iallreduce):
+            # The normalisations are deleted with the engine, containers
+            # with the same storages stand in for them
+            for container, col in [(eng.ob, 1), (eng.pr, 0)]:
+                nrm = container.copy(ID=container.ID + '_nrm', fill=0.)
+                expected = self.expected_regions(eng, container, col)
+                if col == 1:
+                    for ID, s in container.storages.items():
+                        self.assertLess(s.data[expected[ID]].size, s.data.size)
+                self.assertEqual(eng._addr_regions(container, col), expected)
+
+                for region, nonblocking in [(True, False), (True, True), (False, False)]:
+                    eng.p.reduce_region = region
+                    eng.p.reduce_nonblocking = nonblocking
+                    del calls[:]
+                    requests = eng._reduce_storages(container, nrm, col)
+                    self.assertEqual(sorted(requests), sorted(container.storages))
+                    self.assertEqual(len(calls), len(container.storages))
+                    for (shapes, fuse), ID in zip(calls, container.storages):
+                        sh = container.S[ID].data[expected[ID] if region else Ellipsis].shape
+                        self.assertEqual(shapes, [sh, sh])
+                        self.assertEqual(fuse, eng.p.reduce_fused)
+                        self.assertEqual(requests[ID].waited, not nonblocking)
+
+
+if __name__ == "__main__":
+    unittest.main()
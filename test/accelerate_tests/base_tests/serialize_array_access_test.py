@@ -0,0 +1,62 @@
+"""
+Test for the address generation of the serialized engines.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import unittest
+import numpy as np
+
+from ptypy import utils as u
+from ptypy.core import Ptycho
+from ptypy.accelerate.base.engines.projectional_serial import \
+    serialize_array_access, _serialize_array_access_loop
+
+
+class SerializeArrayAccessTest(unittest.TestCase):
+
+    def setUp(self):
+        p = u.Param()
+        p.verbose_level = "critical"
+        p.io = u.Param()
+        p.io.home = "./"
+        p.io.rfile = None
+        p.io.interaction = u.Param(active=False)
+        p.io.autosave = u.Param(active=False)
+        p.io.autoplot = u.Param(active=False)
+        p.scans = u.Param()
+        p.scans.MF = u.Param()
+        p.scans.MF.name = "Full"
+        p.scans.MF.data = u.Param()
+        p.scans.MF.data.name = 'MoonFlowerScan'
+        p.scans.MF.data.num_frames = 50
+        p.scans.MF.data.shape = 32
+        p.scans.MF.data.save = None
+        p.scans.MF.coherence = u.Param()
+        p.scans.MF.coherence.num_probe_modes = 2
+        self.P = Ptycho(p, level=4)
+
+    def check_addresses(self):
+        for d in self.P.diff.storages.values():
+            view_IDs, poe_ID, addr = serialize_array_access(d)
+            view_IDs_ref, poe_ID_ref, addr_ref = _serialize_array_access_loop(d.views, poe_ID)
+            assert view_IDs == view_IDs_ref
+            assert addr.dtype == np.int32
+            assert addr.shape == (len(d.views), 2, 5, 3)
+            np.testing.assert_array_equal(addr, addr_ref)
+
+    def test_serialize_array_access(self):
+        self.check_addresses()
+
+    def test_serialize_array_access_cached(self):
+        self.check_addresses()
+        # Pad the object, which shifts all object addresses
+        for s in self.P.obj.storages.values():
+            s.padding = 5
+            s.reformat()
+        self.check_addresses()
+
+
+if __name__ == '__main__':
+    unittest.main()
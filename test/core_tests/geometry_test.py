@@ -104,7 +104,45 @@ class GeometryTest(unittest.TestCase):
         G = self.set_up_farfield()
         P = BasicFarfieldPropagator(G.p,ffttype="scipy")
         self. _basic_propagator_test(P)
-    
+
+    def _inplace_propagator_test(self, prop):
+        A = (np.random.rand(3, *prop.p.shape) + 1j * np.random.rand(3, *prop.p.shape)).astype(np.complex64)
+        B = A.copy()
+        out = prop.fw_inplace(B)
+        self.assertIs(out, B)
+        np.testing.assert_allclose(B, prop.fw(A), rtol=1e-4, atol=1e-5,
+                                   err_msg="fw_inplace differs from fw, using {:s}".format(prop.FFTch.ffttype))
+        prop.bw_inplace(B)
+        np.testing.assert_allclose(B, A, rtol=1e-4, atol=1e-5,
+                                   err_msg="bw_inplace(fw_inplace(x)) did not return x, using {:s}".format(prop.FFTch.ffttype))
+
+    def test_inplace_farfield_propagator(self):
+        G = self.set_up_farfield()
+        for ffttype in ["fftw", "numpy", "scipy"]:
+            P = BasicFarfieldPropagator(G.p, ffttype=ffttype, dtype=np.complex64, fft_threads=2)
+            self._inplace_propagator_test(P)
+
+    def test_inplace_nearfield_propagator(self):
+        G = self.set_up_nearfield()
+        for ffttype in ["fftw", "numpy", "scipy"]:
+            P = BasicNearfieldPropagator(G.p, ffttype=ffttype, dtype=np.complex64, fft_threads=2)
+            self._inplace_propagator_test(P)
+
+    def test_inplace_propagator_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        G = self.set_up_farfield()
+        for ffttype in ["fftw", "numpy", "scipy"]:
+            P = BasicFarfieldPropagator(G.p, ffttype=ffttype, dtype=np.complex64)
+            A = (np.random.rand(8, 4, *P.p.shape) + 1j * np.random.rand(8, 4, *P.p.shape)).astype(np.complex64)
+            B = A.copy()
+            with ThreadPoolExecutor(4) as pool:
+                list(pool.map(lambda i: [P.fw_inplace(B[i]) for k in range(10)], range(8)))
+            for i in range(8):
+                ref = A[i].copy()
+                for k in range(10):
+                    ref = P.fw(ref)
+                np.testing.assert_allclose(B[i], ref, rtol=1e-3, atol=1e-4,
+                                           err_msg="concurrent fw_inplace differs from fw, using {:s}".format(ffttype))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+'''
+A test for the scan models
+'''
+
+import unittest
+import tempfile
+import shutil
+import numpy as np
+from ptypy import utils as u
+from ptypy.core import Ptycho
+
+
+class ManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="manager_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def load(self, prefetch, level=2):
+        np.random.seed(0)
+        p = u.Param()
+        p.verbose_level = "critical"
+        p.frames_per_block = 20
+        p.io = u.Param()
+        p.io.home = self.outpath
+        p.io.interaction = u.Param(active=False)
+        p.io.autosave = u.Param(active=False)
+        p.io.autoplot = u.Param(active=False)
+        p.scans = u.Param()
+        p.scans.MF = u.Param()
+        p.scans.MF.name = 'BlockFull'
+        p.scans.MF.prefetch = prefetch
+        p.scans.MF.data = u.Param()
+        p.scans.MF.data.name = 'MoonFlowerScan'
+        p.scans.MF.data.num_frames = 100
+        p.scans.MF.data.shape = 32
+        p.scans.MF.data.save = None
+        p.scans.MF.data.add_poisson_noise = False
+        P = Ptycho(p, level=level)
+        while level >= 2 and P.model.data_available:
+            P.model.new_data()
+        return P
+
+    def test_prefetch(self):
+        """
+        Tests that loading in the background gives the same data
+        """
+        P0 = self.load(0)
+        P1 = self.load(2)
+        assert P1.model.end_of_scan
+        assert len(P0.diff.V) == len(P1.diff.V)
+        for ID, s in P0.diff.storages.items():
+            np.testing.assert_array_equal(s.data, P1.diff.storages[ID].data)
+
+    def test_prefetch_stop(self):
+        """
+        Tests that the background loader stops before the end of the scan
+        """
+        P = self.load(2, level=1)
+        scan = P.model.scans['MF']
+        scan.new_data(20)
+        thread = scan._loader.thread
+        assert not P.model.end_of_scan
+        P.finalize()
+        assert scan._loader is None
+        assert not thread.is_alive()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,10 @@ A test for the Storage class
 '''
 
 import unittest
+import tempfile
+import shutil
 import numpy as np
-from ptypy.core import Storage, Container, View
+from ptypy.core import Storage, Container, View, Base
 
 class StorageTest(unittest.TestCase):
     def test_storage(self):
@@ -14,6 +16,40 @@ class StorageTest(unittest.TestCase):
         cont = Container()
         a = Storage(cont)
 
+    def test_storage_adopt_data(self):
+        """
+        Tests that a storage adopts a buffer of matching type without copy
+        """
+        C = Container(data_type='real')
+        buf = np.arange(3 * 4 * 5, dtype=C.dtype).reshape(3, 4, 5)
+        S = C.new_storage(data=buf, shape=10)
+        assert S.shape == (3, 4, 5)
+        assert S.data is buf or np.shares_memory(S.data, buf)
+        S = C.new_storage(data=buf.astype(int))
+        assert S.data.dtype == C.dtype
+        assert not np.shares_memory(S.data, buf)
+        np.testing.assert_array_equal(S.data, buf)
+
+    def test_storage_backing(self):
+        """
+        Tests that storages of a backed container are memory-mapped
+        """
+        scratch = tempfile.mkdtemp()
+        try:
+            C = Container(Base(), data_type=np.float32, backing=scratch)
+            S = C.new_storage(shape=(1, 10, 10), fill=2.)
+            assert isinstance(S.data, np.memmap)
+            for i in range(3):
+                View(C, storageID=S.ID, coord=(0., 0.), layer=i, shape=(10, 10), psize=1.)
+            S.reformat()
+            assert isinstance(S.data, np.memmap)
+            assert S.data.shape == (3, 10, 10)
+            np.testing.assert_array_equal(S.data, 2.)
+            # Copies are kept in memory
+            assert not isinstance(C.copy().S[S.ID].data, np.memmap)
+        finally:
+            shutil.rmtree(scratch)
+
     def test_storage_reformat(self):
         """
         Tests that storages reformat when adding views
@@ -52,6 +88,134 @@ class StorageTest(unittest.TestCase):
         S.reformat()
         assert np.allclose(S[V], 1.)
 
+    def _views_in_chunks(self, coords, chunks, padonly=False):
+        C = Container(data_dims=2, data_type='real')
+        S = C.new_storage(psize=1., padonly=padonly)
+        views = []
+        for chunk in np.array_split(np.arange(len(coords)), chunks):
+            for i in chunk:
+                views.append(View(container=C, storageID=S.ID, coord=coords[i],
+                                  shape=(8, 8), layer=int(i)))
+            S.reformat()
+            for v in views:
+                S[v] = v.layer
+        return C, S, views
+
+    def test_storage_reformat_incremental(self):
+        """
+        Tests that reformatting chunk by chunk matches a single reformat
+        """
+        np.random.seed(0)
+        coords = np.random.uniform(-20, 20, (50, 2))
+        C1, S1, V1 = self._views_in_chunks(coords, 1)
+        C2, S2, V2 = self._views_in_chunks(coords, 7)
+        assert S1.shape == S2.shape
+        assert S1.layermap == S2.layermap
+        np.testing.assert_array_equal(S1.center, S2.center)
+        for v1, v2 in zip(V1, V2):
+            assert v1.dlayer == v2.dlayer
+            np.testing.assert_array_equal(v1.dlow, v2.dlow)
+            assert (S2[v2] == v2.layer).all()
+
+    def test_storage_reformat_move_and_deactivate(self):
+        """
+        Tests that the field of view follows moved and deactivated views
+        """
+        C = Container(data_dims=2, data_type='real')
+        S = C.new_storage(psize=1.)
+        V1 = View(container=C, storageID=S.ID, coord=(0., 0.), shape=(8, 8))
+        V2 = View(container=C, storageID=S.ID, coord=(20., 0.), shape=(8, 8))
+        S.reformat()
+        assert S.shape == (1, 28, 8)
+        V2.coord = (4., 0.)
+        S.reformat()
+        assert S.shape == (1, 12, 8)
+        V2.active = False
+        S.reformat()
+        assert S.shape == (1, 8, 8)
+        assert S.views == [V1]
+
+    def test_storage_layer_growth(self):
+        """
+        Tests that appending layers reuses the spare capacity of the buffer
+        """
+        C = Container(data_dims=2, data_type='real')
+        S = C.new_storage(psize=1., padonly=True)
+        for i in range(4):
+            View(container=C, storageID=S.ID, coord=(0., 0.), shape=(8, 8), layer=i)
+        S.reformat()
+        S.data[:] = np.arange(4)[:, None, None]
+        View(container=C, storageID=S.ID, coord=(0., 0.), shape=(8, 8), layer=4)
+        S.reformat()
+        base = S.data.base
+        View(container=C, storageID=S.ID, coord=(0., 0.), shape=(8, 8), layer=5)
+        S.reformat()
+        assert S.data.shape == (6, 8, 8)
+        assert S.data.base is base
+        np.testing.assert_array_equal(S.data[:4, 0, 0], np.arange(4))
+        assert (S.data[4:] == S.fill_value).all()
+
+    def _subpixel_setup(self, subpixel):
+        C = Container(data_dims=2, data_type='real', subpixel=subpixel)
+        # keep the buffer larger than the view, so that it has neighbours
+        S = C.new_storage(shape=(1, 64, 64), psize=1., origin=(0., 0.), padonly=True)
+        V = View(container=C, storageID=S.ID, coord=(32., 20.3), shape=(16, 16))
+        S.reformat()
+        return C, S, V
+
+    def test_storage_subpixel_off(self):
+        """
+        Tests that views access the buffer directly without subpixel method
+        """
+        C, S, V = self._subpixel_setup(None)
+        assert np.allclose(V.sp, (0., .3))
+        assert np.shares_memory(S[V], S.data)
+
+    def test_storage_subpixel_linear(self):
+        """
+        Tests bilinear subpixel access on a linear ramp, including the edges
+        """
+        C, S, V = self._subpixel_setup('linear')
+        y, x = np.indices(S.shape[-2:], dtype=float)
+        S.data[:] = x + 2. * y
+        ey, ex = np.indices((16, 16), dtype=float)
+        expected = (V.dlow[1] + ex + .3) + 2. * (V.dlow[0] + ey)
+        np.testing.assert_allclose(S[V], expected, rtol=1e-6)
+
+        # Writing back what was read leaves the buffer unchanged
+        before = S.data.copy()
+        S[V] = S[V]
+        np.testing.assert_allclose(S.data, before, rtol=1e-6)
+
+        # Changes land in the view region only and do not wrap around
+        S[V] = S[V] + 1.
+        window = S.data[0, V.dlow[0]:V.dhigh[0], V.dlow[1]:V.dhigh[1]]
+        np.testing.assert_allclose(window, before[0, V.dlow[0]:V.dhigh[0],
+                                                  V.dlow[1]:V.dhigh[1]] + 1., rtol=1e-6)
+        window[:] -= 1.
+        np.testing.assert_allclose(S.data, before, rtol=1e-6)
+
+    def test_storage_subpixel_fourier(self):
+        """
+        Tests Fourier subpixel access on a linear ramp, including the edges,
+        and that writing undoes the shift
+        """
+        C, S, V = self._subpixel_setup('fourier')
+        y, x = np.indices(S.shape[-2:], dtype=float)
+        S.data[:] = x + 2. * y
+        ey, ex = np.indices((16, 16), dtype=float)
+        expected = (V.dlow[1] + ex + .3) + 2. * (V.dlow[0] + ey)
+        # no wrap-around, only the small error of the band limit remains
+        np.testing.assert_allclose(S[V], expected, atol=1e-2)
+
+        # Writing back what was read leaves the buffer unchanged
+        before = S.data.copy()
+        S[V] = S[V]
+        np.testing.assert_allclose(S.data, before, atol=1e-6)
+
+        # Copies inherit the setting
+        assert C.copy(ID='Ccopy').subpixel == 'fourier'
+
 
 if __name__ == '__main__':
     unittest.main()
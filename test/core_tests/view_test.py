@@ -3,6 +3,7 @@ A test for the Base
 '''
 
 import unittest
+import numpy as np
 from ptypy.core import View, Container
 
 
@@ -11,5 +12,20 @@ class ViewTest(unittest.TestCase):
         cont = Container()
         a = View(cont)
 
+    def test_view_table(self):
+        """
+        Tests that view records stay in the container's table when it grows
+        """
+        C = Container(data_dims=2, data_type='real')
+        views = [View(C, storageID='S0', coord=(float(i), 0.), shape=(4, 4), psize=1.)
+                 for i in range(40)]
+        copies = [v.copy() for v in views[:3]]
+        views[0].coord = (-5., 0.)
+        C.S['S0'].update_views()
+        rec = C.view_records(views + copies)
+        np.testing.assert_array_equal(rec['coord'][:, 0], [-5.] + list(range(1, 40)) + [0., 1., 2.])
+        np.testing.assert_array_equal(rec['dlow'][:, :2], np.array([v.dlow for v in views + copies]))
+        assert copies[1].ID != views[1].ID
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
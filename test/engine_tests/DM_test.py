@@ -11,6 +11,7 @@ from test import utils as tu
 from ptypy import utils as u
 import tempfile
 import shutil
+import numpy as np
 
 class DMTest(unittest.TestCase):
 
@@ -35,6 +36,16 @@ class DMTest(unittest.TestCase):
         engine_params.position_refinement = True
         tu.EngineTestRunner(engine_params, output_path=self.outpath)
 
+    def test_DM_position_refinement_gradient(self):
+        engine_params = u.Param()
+        engine_params.name = 'DM'
+        engine_params.numiter = 5
+        engine_params.probe_update_start = 2
+        engine_params.position_refinement = u.Param()
+        engine_params.position_refinement.method = "Gradient"
+        engine_params.position_refinement.start = 2
+        tu.EngineTestRunner(engine_params, output_path=self.outpath)
+
     def test_DM(self):
         engine_params = u.Param()
         engine_params.name = 'DM'
@@ -49,5 +60,47 @@ class DMTest(unittest.TestCase):
         engine_params.obj_smooth_std = 20
         tu.EngineTestRunner(engine_params, output_path=self.outpath)
 
+    def test_DM_batched(self):
+        engine_params = u.Param()
+        engine_params.name = 'DM'
+        engine_params.numiter = 5
+        engine_params.alpha =1
+        engine_params.probe_update_start = 2
+        engine_params.probe_inertia = 1e-3
+        engine_params.object_inertia = 0.1
+        engine_params.fourier_relax_factor = 0.01
+        results = []
+        for batch_size in [None, 16]:
+            engine_params.batch_size = batch_size
+            np.random.seed(0)
+            P = tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False)
+            results.append(P)
+        for name, s in results[0].obj.storages.items():
+            np.testing.assert_allclose(s.data, results[1].obj.storages[name].data, rtol=1e-4, atol=1e-4)
+        for name, s in results[0].probe.storages.items():
+            np.testing.assert_allclose(s.data, results[1].probe.storages[name].data, rtol=1e-4, atol=1e-3)
+
+    def test_DM_reduce_region(self):
+        engine_params = u.Param()
+        engine_params.name = 'DM'
+        engine_params.numiter = 5
+        engine_params.alpha =1
+        engine_params.probe_update_start = 2
+        engine_params.probe_inertia = 1e-3
+        engine_params.object_inertia = 0.1
+        engine_params.fourier_relax_factor = 0.01
+        results = []
+        for reduce in [False, True]:
+            engine_params.reduce_region = reduce
+            engine_params.reduce_nonblocking = reduce
+            engine_params.reduce_fused = reduce
+            np.random.seed(0)
+            P = tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False)
+            results.append(P)
+        for name, s in results[0].obj.storages.items():
+            np.testing.assert_array_equal(s.data, results[1].obj.storages[name].data)
+        for name, s in results[0].probe.storages.items():
+            np.testing.assert_array_equal(s.data, results[1].probe.storages[name].data)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,60 @@
+"""
+Test for the LBFGS engine.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import unittest
+from test import utils as tu
+from ptypy import utils as u
+import tempfile
+import shutil
+import numpy as np
+
+class LBFGSTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="LBFGS_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def test_LBFGS_farfield(self):
+        engine_params = u.Param()
+        engine_params.name = 'LBFGS'
+        engine_params.numiter = 5
+        engine_params.floating_intensities = True
+        engine_params.reg_del2 = True
+        engine_params.reg_del2_amplitude = 0.01
+        engine_params.scale_precond = True
+        engine_params.probe_update_start = 2
+        tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False)
+
+    def test_LBFGS_nearfield(self):
+        engine_params = u.Param()
+        engine_params.name = 'LBFGS'
+        engine_params.numiter = 5
+        engine_params.probe_update_start = 0
+        engine_params.bfgs_memory_size = 2
+        engine_params.bfgs_single_precision = False
+        tu.EngineTestRunner(engine_params, propagator='nearfield', output_path=self.outpath, autosave=False)
+
+    def test_LBFGS_converges(self):
+        engine_params = u.Param()
+        engine_params.name = 'LBFGS'
+        engine_params.numiter = 30
+        engine_params.probe_update_start = 0
+        engine_params.scale_precond = True
+        np.random.seed(0)
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False,
+                                init_correct_probe=True, verbose_level="critical")
+        LL = [info["error"][1] for info in P.runtime["iter_info"]]
+        self.assertLess(LL[-1], LL[0] / 10)
+        # history containers are released
+        self.assertFalse([ID for ID in P.containers if '_bfgs_' in ID])
+
+
+if __name__ == "__main__":
+    unittest.main()
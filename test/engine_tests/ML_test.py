@@ -11,6 +11,7 @@ from test import utils as tu
 from ptypy import utils as u
 import tempfile
 import shutil
+import numpy as np
 
 class MLTest(unittest.TestCase):
 
@@ -64,5 +65,55 @@ class MLTest(unittest.TestCase):
 
         tu.EngineTestRunner(engine_params, propagator='nearfield', output_path=self.outpath)
 
+    def check_batched(self, engine_params):
+        results = []
+        for batch_size in [None, 16]:
+            engine_params.batch_size = batch_size
+            np.random.seed(0)
+            P = tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False)
+            results.append(P)
+        for name, s in results[0].obj.storages.items():
+            np.testing.assert_allclose(s.data, results[1].obj.storages[name].data, rtol=1e-4, atol=1e-5)
+        for name, s in results[0].probe.storages.items():
+            np.testing.assert_allclose(s.data, results[1].probe.storages[name].data, rtol=1e-4, atol=1e-3)
+
+    def test_ML_batched(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 5
+        engine_params.floating_intensities = True
+        engine_params.reg_del2 = True
+        engine_params.probe_update_start = 0
+        self.check_batched(engine_params)
+
+    def test_ML_poisson_batched(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.ML_type = 'poisson'
+        engine_params.numiter = 5
+        engine_params.floating_intensities = True
+        engine_params.probe_update_start = 0
+        self.check_batched(engine_params)
+
+    def test_ML_far_field_cache(self):
+        for ML_type in ['gaussian', 'poisson']:
+            for batch_size in [None, 16]:
+                results = []
+                for cache in [0., 1024.]:
+                    engine_params = u.Param()
+                    engine_params.name = 'ML'
+                    engine_params.ML_type = ML_type
+                    engine_params.numiter = 5
+                    engine_params.floating_intensities = True
+                    engine_params.probe_update_start = 0
+                    engine_params.batch_size = batch_size
+                    engine_params.far_field_cache = cache
+                    np.random.seed(0)
+                    results.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False))
+                for name, s in results[0].obj.storages.items():
+                    np.testing.assert_array_equal(s.data, results[1].obj.storages[name].data)
+                for name, s in results[0].probe.storages.items():
+                    np.testing.assert_array_equal(s.data, results[1].probe.storages[name].data)
+
 if __name__ == "__main__":
     unittest.main()
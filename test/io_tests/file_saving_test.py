@@ -180,3 +180,58 @@ class FileSavingTest(unittest.TestCase):
             probe = f['/content/probe/SMFG00/data'][0]
         except KeyError:
             self.fail(msg="Couldn't load the probe data")
+
+    def test_threaded_autosave(self):
+        '''
+        Dumps written in the background are the same as the synchronous ones
+        '''
+        from ptypy.core import Ptycho
+        import numpy as np
+        import os
+        import shutil
+
+        def run(threaded, outpath):
+            np.random.seed(0)
+            p = u.Param()
+            p.verbose_level = "critical"
+            p.io = u.Param()
+            p.io.home = outpath
+            p.io.rfile = None
+            p.io.interaction = u.Param(active=False)
+            p.io.autosave = u.Param(active=True, interval=2, threaded=threaded,
+                                    rfile="dumps/%(engine)s_%(iterations)04d.ptyr")
+            p.io.autoplot = u.Param(active=False)
+            p.scans = u.Param()
+            p.scans.MF = u.Param()
+            p.scans.MF.name = 'Full'
+            p.scans.MF.data = u.Param()
+            p.scans.MF.data.name = 'MoonFlowerScan'
+            p.scans.MF.data.num_frames = 50
+            p.scans.MF.data.shape = 32
+            p.scans.MF.data.save = None
+            p.scans.MF.data.add_poisson_noise = False
+            p.engines = u.Param()
+            p.engines.engine00 = u.Param(name='DM', numiter=6)
+            Ptycho(p, level=5)
+            return sorted(os.listdir(os.path.join(outpath, 'dumps')))
+
+        outpath = tempfile.mkdtemp(prefix='autosave')
+        try:
+            files = run(False, os.path.join(outpath, 'sync'))
+            files_threaded = run(True, os.path.join(outpath, 'threaded'))
+            self.assertEqual(files, files_threaded)
+            self.assertEqual(len(files), 3)
+            for name in files:
+                with h5.File(os.path.join(outpath, 'sync', 'dumps', name), 'r') as f1, \
+                        h5.File(os.path.join(outpath, 'threaded', 'dumps', name), 'r') as f2:
+                    nodes1, nodes2 = [], []
+                    f1.visit(nodes1.append)
+                    f2.visit(nodes2.append)
+                    self.assertEqual(sorted(nodes1), sorted(nodes2))
+                    for key in ['obj', 'probe']:
+                        for ID in f1['content'][key]:
+                            for k in ['data', 'grids']:
+                                np.testing.assert_array_equal(f1['content'][key][ID][k][()],
+                                                              f2['content'][key][ID][k][()])
+        finally:
+            shutil.rmtree(outpath)
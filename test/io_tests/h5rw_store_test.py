@@ -170,6 +170,32 @@ class H5rwStoreTest(unittest.TestCase):
             test_func()
         except:
             self.fail(msg="This should not have produced an exception!")
+    def test_store_compression(self):
+        frames = np.arange(10 * 64 * 64, dtype=np.float32).reshape(10, 64, 64)
+        h5opt = dict(io.h5options)
+        try:
+            for comp, opts in [(None, None), ('lzf', None), ('gzip', 1)]:
+                io.h5options['COMPRESSION'] = comp
+                io.h5options['COMPRESSION_OPTS'] = opts
+                io.h5options['CHUNK_BYTES'] = 4 * 64 * 64 * 4
+                path = self.filepath % "store_compression_test"
+                io.h5write(path, content={'frames': frames})
+                with h5.File(path, 'r') as f:
+                    dset = f['content/frames']
+                    self.assertEqual(dset.compression, comp)
+                    self.assertEqual(dset.chunks, (4, 64, 64))
+                np.testing.assert_array_equal(io.h5read(path, 'content')['content']['frames'], frames)
+
+            # Frames larger than a chunk are left to h5py, which tiles them
+            io.h5options['CHUNK_BYTES'] = 64 * 64
+            io.h5write(path, content={'frames': frames})
+            with h5.File(path, 'r') as f:
+                chunks = f['content/frames'].chunks
+                self.assertLess(np.prod(chunks[1:]), 64 * 64)
+            np.testing.assert_array_equal(io.h5read(path, 'content')['content']['frames'], frames)
+        finally:
+            io.h5options.update(h5opt)
+
 
 if __name__=='__main__':
     unittest.main()
\ No newline at end of file
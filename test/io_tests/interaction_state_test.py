@@ -0,0 +1,86 @@
+"""
+Test for the versioned state channel of the interaction server.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import unittest
+import numpy as np
+
+try:
+    import zmq
+    from ptypy.io.interaction import Server
+    have_zmq = True
+except ImportError:
+    have_zmq = False
+
+
+@unittest.skipIf(not have_zmq, "no ZeroMQ available")
+class InteractionStateTest(unittest.TestCase):
+
+    def setUp(self):
+        # The server thread is not started, only the state bookkeeping is used
+        self.server = Server()
+        self.a = np.arange(12.).reshape(3, 4)
+        self.b = np.ones((2, 512, 256), dtype=np.complex64)
+        self.server.register_state('a', lambda: self.a)
+        self.server.register_state('b', lambda: self.b, preview=True)
+
+    def get_state(self, known, preview=None):
+        reply, arrays = self.server._get_state(known, preview=preview)
+        self.assertEqual(reply['status'], 'ok')
+        out = reply['out']
+        data = {}
+        for name, st in out['states'].items():
+            # placeholders refer to the list of arrays
+            data[name] = arrays[int(st['data'][9:12])]
+        return out, data
+
+    def test_initial_state(self):
+        seq = self.server.sequence
+        out, data = self.get_state({})
+        self.assertEqual(out['sequence'], seq)
+        self.assertEqual(sorted(out['states'].keys()), ['a', 'b'])
+        for name in ['a', 'b']:
+            self.assertEqual(out['states'][name]['version'], seq)
+            self.assertEqual(out['states'][name]['level'], 0)
+        np.testing.assert_array_equal(data['a'], self.a)
+        np.testing.assert_array_equal(data['b'], self.b)
+
+    def test_only_changed_states(self):
+        seq = self.server.sequence
+        known = {'a': seq, 'b': seq}
+        out, data = self.get_state(known)
+        self.assertEqual(out['states'], {})
+
+        self.a += 1.
+        self.server.new_state(['a'])
+        out, data = self.get_state(known)
+        self.assertEqual(out['sequence'], seq + 1)
+        self.assertEqual(list(out['states'].keys()), ['a'])
+        self.assertEqual(out['states']['a']['version'], seq + 1)
+        np.testing.assert_array_equal(data['a'], self.a)
+
+        # the client now knows the new version
+        known['a'] = out['states']['a']['version']
+        out, data = self.get_state(known)
+        self.assertEqual(out['states'], {})
+
+        self.server.new_state()
+        out, data = self.get_state(known)
+        self.assertEqual(out['sequence'], seq + 2)
+        self.assertEqual(sorted(out['states'].keys()), ['a', 'b'])
+
+    def test_preview(self):
+        out, data = self.get_state({}, preview=100)
+        # the coarsest level with at least 100 pixels along its longer axis
+        self.assertEqual(out['states']['b']['level'], 2)
+        self.assertEqual(data['b'].shape, (2, 128, 64))
+        # arrays without previews are sent as they are
+        self.assertEqual(out['states']['a']['level'], 0)
+        np.testing.assert_array_equal(data['a'], self.a)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,7 +6,7 @@ import shutil
 import numpy as np
 import ptypy
 from test.utils import PtyscanTestRunner
-from ptypy.experiment.hdf5_loader import Hdf5Loader
+from ptypy.experiment.hdf5_loader import Hdf5Loader, Hdf5LoaderFast
 from ptypy import utils as u
 
 
@@ -1345,6 +1345,74 @@ class Hdf5LoaderTestNoSWMR(unittest.TestCase):
         output = PtyscanTestRunner(Hdf5Loader, data_params, auto_frames=k, cleanup=False)
 
 
+    def test_fast_loader_matches(self):
+        '''
+        Hdf5LoaderFast gives the same frames as Hdf5Loader with darkfield,
+        flatfield laid out like the data and a 2d mask
+        '''
+        A = 6
+        B = 7
+        frame_size_m = 20
+        frame_size_n = 20
+
+        positions_slow = np.arange(A)
+        positions_fast = np.arange(B)
+        fast, slow = np.meshgrid(positions_fast, positions_slow)
+        with h5.File(self.positions_file, 'w') as f:
+            f[self.positions_slow_key] = slow
+            f[self.positions_fast_key] = fast
+
+        data = np.arange(A*B*frame_size_m*frame_size_n, dtype=float).reshape(A, B, frame_size_m, frame_size_n)
+        with h5.File(self.intensity_file, 'w') as f:
+            f[self.intensity_key] = data
+
+        with h5.File(self.dark_file, 'w') as f:
+            f[self.dark_key] = np.full((frame_size_m, frame_size_n), 100.)
+
+        with h5.File(self.flat_file, 'w') as f:
+            f[self.flat_key] = 1. + (data % 3)
+
+        mask = np.ones(data.shape[-2:], dtype=int)
+        mask[::3] = 0
+        with h5.File(self.mask_file, 'w') as f:
+            f[self.mask_key] = mask
+
+        data_params = u.Param()
+        data_params.auto_center = False
+        data_params.intensities = u.Param()
+        data_params.intensities.file = self.intensity_file
+        data_params.intensities.key = self.intensity_key
+
+        data_params.darkfield = u.Param()
+        data_params.darkfield.file = self.dark_file
+        data_params.darkfield.key = self.dark_key
+
+        data_params.flatfield = u.Param()
+        data_params.flatfield.file = self.flat_file
+        data_params.flatfield.key = self.flat_key
+
+        data_params.mask = u.Param()
+        data_params.mask.file = self.mask_file
+        data_params.mask.key = self.mask_key
+
+        data_params.positions = u.Param()
+        data_params.positions.file = self.positions_file
+        data_params.positions.slow_key = self.positions_slow_key
+        data_params.positions.fast_key = self.positions_fast_key
+
+        output = PtyscanTestRunner(Hdf5Loader, data_params.copy(depth=2), auto_frames=A*B, cleanup=False)
+        data_params.processes = 2
+        output_fast = PtyscanTestRunner(Hdf5LoaderFast, data_params, auto_frames=A*B, cleanup=False)
+
+        frames = output['msgs'][0]['iterable']
+        frames_fast = output_fast['msgs'][0]['iterable']
+        self.assertEqual(len(frames), A*B)
+        self.assertEqual(len(frames_fast), A*B)
+        for frame, frame_fast in zip(frames, frames_fast):
+            self.assertEqual(frame['index'], frame_fast['index'])
+            np.testing.assert_array_equal(frame['data'], frame_fast['data'])
+            np.testing.assert_array_equal(frame['mask'], frame_fast['mask'])
+
 
 class Hdf5LoaderTestWithSWMR(unittest.TestCase):
     def test_something(self):
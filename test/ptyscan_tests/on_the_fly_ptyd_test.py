@@ -7,6 +7,7 @@ from ptypy import utils as u
 import tempfile
 import shutil
 import unittest
+import numpy as np
 
 u.verbose.set_level(1)
 
@@ -108,6 +109,21 @@ class OnTheFlyPtydTest(unittest.TestCase):
         self.assertEqual(50, len(msg['iterable']),
                          'There should be 20 frames available in Source ptyd')
 
+    def test_read_processes(self):
+        if u.parallel.master:
+            self.S1.auto(30)
+            self.S1.auto(100)
+        u.parallel.barrier()
+        msgs = []
+        for nproc in [1, 2]:
+            S2 = self._create_PtydScan(save=None, read_processes=nproc)
+            S2.initialize()
+            msgs.append(S2.auto(100))
+        self.assertEqual(50, len(msgs[1]['iterable']))
+        for f1, f2 in zip(msgs[0]['iterable'], msgs[1]['iterable']):
+            np.testing.assert_array_equal(f1['data'], f2['data'])
+            np.testing.assert_array_equal(f1['mask'], f2['mask'])
+
     def test_check(self):
         if u.parallel.master: msg = self.S1.auto(30)
         u.parallel.barrier()
@@ -5,9 +5,12 @@ test Scan `ptypy.core.data.MoonFlowerScan`
 
 from ptypy import utils as u
 from ptypy import io
-from ptypy.core.data import MoonFlowerScan
+from ptypy.core.data import MoonFlowerScan, PtydScan
 from .. import utils as tu
 import unittest
+import tempfile
+import shutil
+import numpy as np
 global DATA
 DATA = u.Param(
     shape = 128,
@@ -76,6 +79,56 @@ class PtyscanTest(unittest.TestCase):
         out = tu.PtyscanTestRunner(MoonFlowerScan,data_params=DATA, save_type='link', cleanup=False)
         d = io.h5read(out['output_file'])
 
+    def test_parallel_ptyd_REGRESSION(self):
+        '''
+        every node saves its own part of the chunks, can we read them back?
+        '''
+        out = tu.PtyscanTestRunner(MoonFlowerScan, data_params=DATA, save_type='parallel',
+                                   auto_frames=30, ncalls=2, cleanup=False)
+        S = PtydScan(u.Param(dfile=out['output_file'], source='file'))
+        S.initialize()
+        msg = S.auto(50)
+        frames = out['msgs'][0]['iterable'] + out['msgs'][1]['iterable']
+        self.assertEqual(len(msg['iterable']), len(frames))
+        for f1, f2 in zip(frames, msg['iterable']):
+            self.assertEqual(f1['index'], f2['index'])
+            np.testing.assert_array_equal(f1['data'], f2['data'])
+
+    def test_parallel_ptyd_empty_part(self):
+        '''
+        nodes without frames in a chunk save an empty part, can we read it?
+        '''
+        outdir = tempfile.mkdtemp()
+        dfile = '%s/prep.h5' % outdir
+        MS = MoonFlowerScan(u.Param(DATA, dfile=dfile, save='parallel'))
+        MS.initialize()
+        MS.auto(30)
+        chunk = u.Param(num=1, indices_node=[], indices=np.arange(30, 40),
+                        positions=np.zeros((10, 2)), data={}, weights={},
+                        data_array=None, weights_array=None)
+        MS._mpi_save_chunk_parallel(chunk)
+        S = PtydScan(u.Param(dfile=dfile, source='file'))
+        S.initialize()
+        msg = S.auto(50)
+        self.assertEqual(len(msg['iterable']), 30)
+        shutil.rmtree(outdir)
+
+    def test_excluded_frames(self):
+        '''
+        loaders may return fewer frames than requested
+        '''
+        class ExcludingScan(MoonFlowerScan):
+            def load(self, indices):
+                intensities, positions, weights = super(ExcludingScan, self).load(indices)
+                for k in [k for k in intensities if k % 3 == 0]:
+                    intensities.pop(k)
+                return intensities, positions, weights
+
+        out = tu.PtyscanTestRunner(ExcludingScan, data_params=DATA, auto_frames=30, ncalls=1)
+        frames = out['msgs'][0]['iterable']
+        self.assertEqual(30, len(frames))
+        for f in frames:
+            self.assertEqual(f['data'] is not None, f['index'] % 3 != 0)
 
 
 if __name__ == '__main__':
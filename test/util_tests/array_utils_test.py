@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+from ptypy.utils.array_utils import preview_pyramid, rebin_2d
+
+class PreviewPyramidTest(unittest.TestCase):
+
+    def test_real_levels(self):
+        inp = np.random.rand(2, 512, 256).astype(np.float32)
+
+        levels = preview_pyramid(inp, min_size=64)
+
+        self.assertEqual([l.shape for l in levels], [(2, 512, 256), (2, 256, 128), (2, 128, 64)])
+        self.assertIs(levels[0], inp)
+        np.testing.assert_allclose(levels[1], rebin_2d(inp, 2), rtol=1e-6)
+        np.testing.assert_allclose(levels[2], rebin_2d(inp, 4), rtol=1e-5)
+
+    def test_complex_amplitude_and_phase(self):
+        amp = np.random.rand(1, 256, 256) + 0.5
+        inp = (amp * np.exp(0.5j)).astype(np.complex64)
+
+        levels = preview_pyramid(inp, min_size=64)
+
+        self.assertEqual(len(levels), 3)
+        for k, level in enumerate(levels[1:], 1):
+            self.assertEqual(level.dtype, np.complex64)
+            np.testing.assert_allclose(np.abs(level), rebin_2d(amp, 2**k), rtol=1e-5)
+            np.testing.assert_allclose(np.angle(level), 0.5, rtol=1e-5)
+
+    def test_odd_shape(self):
+        inp = np.ones((257, 131))
+
+        levels = preview_pyramid(inp, min_size=32)
+
+        self.assertEqual([l.shape for l in levels], [(257, 131), (128, 65), (64, 32)])
+
+
+if __name__ == '__main__':
+    unittest.main()